@@ -9,14 +9,10 @@ from werkzeug.utils import secure_filename # Mantener por si se necesita para ot
 
 # Importa la instancia de la base de datos y el modelo AboutUs desde models.py
 from models import db, AboutUs
+from trabajos import encolar_trabajo, quiere_trabajo_en_segundo_plano
+from almacen_blobs import guardar_subida, liberar
 
-# Importa las bibliotecas para la generación de imágenes y PDF
-from PIL import Image, ImageDraw, ImageFont # Para exportar a JPG
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib.enums import TA_CENTER
+# PIL y reportlab se importan dentro de generar_exportacion_aboutus, solo al exportar
 
 
 # Define el Blueprint para el módulo "Acerca de Nosotros"
@@ -41,21 +37,6 @@ def is_valid_filename(filename):
         return False
     return True
 
-# NUEVO: Función para generar un nombre de archivo único
-def generate_unique_filename(original_filename, upload_folder):
-    """
-    Genera un nombre de archivo único, manteniendo el nombre original si es posible,
-    o añadiendo un número consecutivo si ya existe.
-    """
-    filename_base, extension = os.path.splitext(original_filename)
-    counter = 1
-    unique_filename = original_filename
-    while os.path.exists(os.path.join(upload_folder, unique_filename)):
-        unique_filename = f"{filename_base}_{counter}{extension}"
-        counter += 1
-    return unique_filename
-
-
 # Ruta para ver la sección "Acerca de Nosotros"
 @aboutus_bp.route('/ver', methods=['GET'])
 def ver_aboutus():
@@ -88,14 +69,9 @@ def crear_aboutus():
                         return redirect(request.url)
 
                     if allowed_file(logo_file.filename):
-                        # MODIFICADO: Usar generate_unique_filename
-                        filename = generate_unique_filename(logo_file.filename, current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'])
-                        upload_folder = current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER']
-                        os.makedirs(upload_folder, exist_ok=True)
-                        filepath = os.path.join(upload_folder, filename)
-                        logo_file.save(filepath)
-                        logo_filename = filename
-                        print(f"DEBUG: Archivo de logo guardado en: {filepath}") # DEBUG
+                        # Guardado por contenido: el mismo logo se guarda una sola vez (almacen_blobs.py)
+                        logo_filename, _ = guardar_subida(logo_file, 'ABOUTUS_IMAGE_UPLOAD_FOLDER')
+                        print(f"DEBUG: Archivo de logo guardado como: {logo_filename}") # DEBUG
                     else:
                         flash('Tipo de archivo no permitido para el logo. Solo PNG, JPG, JPEG.', 'danger')
                         print("DEBUG: Tipo de archivo de logo no permitido.") # DEBUG
@@ -105,12 +81,11 @@ def crear_aboutus():
             # Esto mantiene una única sección "Acerca de Nosotros".
             existing_about_us = AboutUs.query.first()
             if existing_about_us:
-                # Si ya existe, elimina el logo anterior si se subió uno nuevo y es diferente
-                if logo_filename and existing_about_us.logo_filename and existing_about_us.logo_filename != logo_filename:
-                    old_logo_path = os.path.join(current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'], existing_about_us.logo_filename)
-                    if os.path.exists(old_logo_path):
-                        os.remove(old_logo_path)
-                        print(f"DEBUG: Logo anterior eliminado: {old_logo_path}")
+                # Si ya existe y se subió un logo nuevo, libera el anterior (se borra tras el commit si
+                # nada más lo usa; si es el mismo contenido, la referencia nueva lo mantiene)
+                if logo_filename and existing_about_us.logo_filename:
+                    liberar('ABOUTUS_IMAGE_UPLOAD_FOLDER', existing_about_us.logo_filename, borrar_sin_registro=True)
+                    print(f"DEBUG: Logo anterior liberado: {existing_about_us.logo_filename}")
 
                 # Actualiza los campos
                 existing_about_us.logo_filename = logo_filename if logo_filename else existing_about_us.logo_filename # Mantener el antiguo si no se subió nuevo
@@ -167,20 +142,15 @@ def editar_aboutus(aboutus_id):
                     return redirect(request.url)
 
                 if logo_file and allowed_file(logo_file.filename):
-                    # Si ya existe un logo, lo elimina del sistema de archivos
+                    # Si ya existe un logo, lo libera: se borra del disco tras el commit si nada más lo usa
                     if about_us_entry.logo_filename:
-                        old_logo_path = os.path.join(current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'], about_us_entry.logo_filename)
-                        if os.path.exists(old_logo_path):
-                            os.remove(old_logo_path)
-                            print(f"DEBUG: Logo anterior eliminado durante edición: {old_logo_path}")
-
-                    # Guarda el nuevo logo
-                    # MODIFICADO: Usar generate_unique_filename
-                    filename = generate_unique_filename(logo_file.filename, current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'])
-                    filepath = os.path.join(current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'], filename)
-                    logo_file.save(filepath)
+                        liberar('ABOUTUS_IMAGE_UPLOAD_FOLDER', about_us_entry.logo_filename, borrar_sin_registro=True)
+                        print(f"DEBUG: Logo anterior liberado durante edición: {about_us_entry.logo_filename}")
+
+                    # Guarda el nuevo logo por contenido (almacen_blobs.py)
+                    filename, _ = guardar_subida(logo_file, 'ABOUTUS_IMAGE_UPLOAD_FOLDER')
                     about_us_entry.logo_filename = filename
-                    print(f"DEBUG: Nuevo logo guardado durante edición: {filepath}")
+                    print(f"DEBUG: Nuevo logo guardado durante edición: {filename}")
                 else:
                     flash('Tipo de archivo no permitido para el logo. Solo PNG, JPG, JPEG.', 'danger')
                     return redirect(request.url)
@@ -207,12 +177,10 @@ def eliminar_aboutus(aboutus_id):
     # Obtiene la entrada de AboutUs por su ID, o devuelve un 404 si no se encuentra
     about_us_entry = AboutUs.query.get_or_404(aboutus_id)
     try:
-        # Elimina el archivo de logo asociado del sistema de archivos
+        # Libera el archivo de logo asociado: se borra del disco tras el commit si nada más lo usa
         if about_us_entry.logo_filename:
-            logo_path = os.path.join(current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'], about_us_entry.logo_filename)
-            if os.path.exists(logo_path):
-                os.remove(logo_path)
-                print(f"DEBUG: Logo eliminado del sistema de archivos: {logo_path}")
+            liberar('ABOUTUS_IMAGE_UPLOAD_FOLDER', about_us_entry.logo_filename, borrar_sin_registro=True)
+            print(f"DEBUG: Logo liberado: {about_us_entry.logo_filename}")
 
         db.session.delete(about_us_entry) # Elimina la entrada de la base de datos
         db.session.commit() # Guarda los cambios
@@ -229,6 +197,28 @@ def eliminar_aboutus(aboutus_id):
 def exportar_aboutus(aboutus_id, format):
     about_us_entry = AboutUs.query.get_or_404(aboutus_id)
 
+    if format in FORMATOS_EXPORTACION and quiere_trabajo_en_segundo_plano():
+        # Exportación en segundo plano: responde 202 con el id del trabajo
+        return encolar_trabajo('aboutus', {'aboutus_id': aboutus_id, 'format': format})
+
+    resultado = generar_exportacion_aboutus(about_us_entry, format)
+    if resultado is None:
+        flash('Formato de exportación no válido.', 'danger')
+        return redirect(url_for('aboutus.ver_aboutus'))
+
+    buffer, download_name, mimetype = resultado
+    return send_file(buffer, as_attachment=True, download_name=download_name, mimetype=mimetype)
+
+
+# Formatos que acepta generar_exportacion_aboutus
+FORMATOS_EXPORTACION = ('txt', 'pdf', 'jpg')
+
+def generar_exportacion_aboutus(about_us_entry, format):
+    """
+    Genera la exportación de "Acerca de Nosotros" en el formato pedido (txt, pdf o jpg).
+    No depende de la petición HTTP, así que también la usan los trabajos en segundo plano.
+    Devuelve (buffer, download_name, mimetype) o None si el formato no es válido.
+    """
     # Contenido base para la exportación
     content = f"Título: {about_us_entry.title}\n\n" \
               f"Información del Logo: {about_us_entry.logo_info}\n\n" \
@@ -241,9 +231,15 @@ def exportar_aboutus(aboutus_id, format):
         buffer = io.BytesIO()
         buffer.write(content.encode('utf-8'))
         buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name='acerca_de_nosotros.txt', mimetype='text/plain; charset=utf-8')
+        return buffer, 'acerca_de_nosotros.txt', 'text/plain; charset=utf-8'
     elif format == 'pdf':
         # Exportar a PDF
+        from reportlab.lib.pagesizes import letter
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.units import inch
+        from reportlab.lib.enums import TA_CENTER
+
         buffer = io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=letter)
         styles = getSampleStyleSheet()
@@ -291,9 +287,10 @@ def exportar_aboutus(aboutus_id, format):
 
         doc.build(story) # Construye el documento PDF
         buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name='acerca_de_nosotros.pdf', mimetype='application/pdf')
+        return buffer, 'acerca_de_nosotros.pdf', 'application/pdf'
     elif format == 'jpg':
         # Exportar a JPG (generando una imagen del texto)
+        from PIL import Image, ImageDraw, ImageFont
         img_width = 800
         padding = 20
         font_size_title = 24
@@ -409,7 +406,6 @@ def exportar_aboutus(aboutus_id, format):
         buffer = io.BytesIO()
         img.save(buffer, format='JPEG')
         buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name='acerca_de_nosotros.jpg', mimetype='image/jpeg')
+        return buffer, 'acerca_de_nosotros.jpg', 'image/jpeg'
     else:
-        flash('Formato de exportación no válido.', 'danger')
-        return redirect(url_for('aboutus.ver_aboutus'))
+        return None
@@ -0,0 +1,236 @@
+# almacen_blobs.py
+# Almacenamiento de subidas direccionado por contenido, con deduplicación.
+#
+# Antes cada subida (registro, editar perfil, editar contacto, archivos,
+# "Acerca de") se guardaba con un nombre nuevo (uuid4, fecha o un contador
+# buscado con os.path.exists), así que el mismo archivo quedaba en disco tantas
+# veces como se subiera. Ahora:
+#
+#   - guardar_subida(archivo, clave_carpeta) copia el stream de la subida a un
+#     temporal por bloques mientras calcula su SHA-256 (nunca lo lee entero en
+#     memoria). El archivo se llama <sha256><extensión> dentro de su carpeta: si
+#     ese contenido ya estaba, se descarta el temporal y solo se suma una
+#     referencia en la tabla blobs.
+#   - liberar(clave_carpeta, nombre) resta una referencia. Cuando llega a cero
+#     se borra la fila y, después del commit (no antes: un rollback dejaría la
+#     fila sin archivo), el archivo del disco (y sus miniaturas si es un avatar).
+#
+# Las carpetas siguen siendo las de config.py, así las URL (url_for('static'))
+# y las miniaturas de avatares no cambian; la deduplicación es por carpeta.
+# Las referencias se suman y restan en db.session y se confirman con el commit
+# de la vista, junto con el cambio que las usa.
+#
+# Espacio ahorrado y limpieza de huérfanos: flask estado-blobs [--limpiar]
+import os
+import re
+import time
+import uuid
+import hashlib
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, event, func, select, update
+from werkzeug.utils import secure_filename
+
+from models import db, Blob
+
+TAMANO_BLOQUE = 64 * 1024
+PATRON_BLOB = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]+)?$')
+SUFIJO_TEMPORAL = '.subiendo'
+CLAVE_BORRADOS = 'blobs_a_borrar' # En session.info: archivos que se borran tras el commit
+CARPETAS_BLOBS = ('UPLOAD_FOLDER', 'ABOUTUS_IMAGE_UPLOAD_FOLDER', 'UPLOAD_FILES_FOLDER') # Claves de config que usan el almacén
+
+
+def es_blob(nombre):
+    return bool(nombre) and bool(PATRON_BLOB.match(nombre))
+
+
+def _carpeta(clave_carpeta):
+    carpeta = current_app.config[clave_carpeta]
+    os.makedirs(carpeta, exist_ok=True)
+    return carpeta
+
+
+def _sumar_referencia(clave_carpeta, digest):
+    """Suma una referencia al blob si existe; devuelve su nombre o None."""
+    resultado = db.session.execute(
+        update(Blob).where(Blob.carpeta == clave_carpeta, Blob.digest == digest)
+        .values(referencias=Blob.referencias + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if not resultado.rowcount:
+        return None
+    return db.session.execute(
+        select(Blob.nombre).where(Blob.carpeta == clave_carpeta, Blob.digest == digest)
+    ).scalar_one()
+
+
+def guardar_subida(archivo, clave_carpeta):
+    """
+    Guarda un FileStorage en la carpeta de `clave_carpeta` (p. ej. 'UPLOAD_FOLDER')
+    deduplicando por contenido. Devuelve (nombre, nuevo): el nombre del archivo
+    dentro de la carpeta y si el contenido no estaba ya guardado.
+    """
+    carpeta = _carpeta(clave_carpeta)
+    extension = os.path.splitext(secure_filename(archivo.filename or ''))[1].lower()
+    temporal = os.path.join(carpeta, f".{uuid.uuid4().hex}{SUFIJO_TEMPORAL}")
+    h = hashlib.sha256()
+    tamano = 0
+    try:
+        with open(temporal, 'wb') as destino:
+            for bloque in iter(lambda: archivo.stream.read(TAMANO_BLOQUE), b''):
+                h.update(bloque)
+                destino.write(bloque)
+                tamano += len(bloque)
+        return adoptar_archivo(temporal, clave_carpeta, h.hexdigest(), tamano, extension)
+    finally:
+        if os.path.exists(temporal):
+            os.unlink(temporal)
+
+
+def adoptar_archivo(ruta_temporal, clave_carpeta, digest, tamano, extension=''):
+    """
+    Mueve al almacén un archivo ya escrito en la carpeta de `clave_carpeta` cuyo
+    SHA-256 es `digest` (lo usan guardar_subida y las subidas por partes de
+    subidas.py). Si el contenido ya estaba, solo suma una referencia y el temporal
+    queda para que lo borre quien llama. Devuelve (nombre, nuevo).
+    """
+    # En SQLite el UPDATE ya toma el bloqueo de escritura hasta el commit: ningún
+    # otro proceso puede insertar el mismo digest entre el UPDATE y el INSERT
+    nombre = _sumar_referencia(clave_carpeta, digest)
+    nuevo = nombre is None
+    if nuevo:
+        nombre = digest + extension
+        db.session.add(Blob(carpeta=clave_carpeta, digest=digest, nombre=nombre, tamano=tamano, referencias=1))
+        db.session.flush()
+    ruta = os.path.join(_carpeta(clave_carpeta), nombre)
+    if nuevo or not os.path.exists(ruta):
+        os.replace(ruta_temporal, ruta)
+    return nombre, nuevo
+
+
+def liberar(clave_carpeta, nombre, borrar_sin_registro=False):
+    """
+    Resta una referencia al archivo `nombre` de la carpeta. Si era la última, el
+    archivo se borra del disco tras el commit. Los archivos anteriores al almacén
+    (sin fila en blobs) solo se borran con `borrar_sin_registro=True`.
+    """
+    if not nombre:
+        return
+    nombre = os.path.basename(nombre)
+    condicion = (Blob.carpeta == clave_carpeta, Blob.nombre == nombre)
+    resultado = db.session.execute(
+        update(Blob).where(*condicion).values(referencias=Blob.referencias - 1)
+        .execution_options(synchronize_session=False)
+    )
+    if resultado.rowcount:
+        borrados = db.session.execute(
+            delete(Blob).where(*condicion, Blob.referencias <= 0).execution_options(synchronize_session=False)
+        ).rowcount
+        if not borrados:
+            return
+    elif not borrar_sin_registro:
+        return
+    db.session.info.setdefault(CLAVE_BORRADOS, []).append((clave_carpeta, nombre))
+
+
+def _borrar_archivo(clave_carpeta, nombre):
+    from avatares import borrar_miniaturas
+
+    try:
+        os.unlink(os.path.join(current_app.config[clave_carpeta], nombre))
+    except FileNotFoundError:
+        pass
+    if clave_carpeta == 'UPLOAD_FOLDER':
+        borrar_miniaturas(nombre)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _borrar_tras_commit(sesion):
+    pendientes = sesion.info.pop(CLAVE_BORRADOS, None)
+    if not pendientes:
+        return
+    # Otra petición pudo volver a subir el mismo contenido después de nuestro commit
+    with db.engine.connect() as conexion:
+        for clave_carpeta, nombre in pendientes:
+            sigue = conexion.execute(
+                select(Blob.id).where(Blob.carpeta == clave_carpeta, Blob.nombre == nombre)
+            ).first()
+            if sigue is None:
+                try:
+                    _borrar_archivo(clave_carpeta, nombre)
+                except OSError as e:
+                    current_app.logger.warning(f"No se pudo borrar {nombre} de {clave_carpeta}: {e}")
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _descartar_borrados(sesion):
+    sesion.info.pop(CLAVE_BORRADOS, None)
+
+
+def estadisticas():
+    """Por carpeta: blobs, referencias, bytes en disco y bytes ahorrados por la deduplicación."""
+    filas = db.session.execute(
+        select(
+            Blob.carpeta,
+            func.count(Blob.id),
+            func.coalesce(func.sum(Blob.referencias), 0),
+            func.coalesce(func.sum(Blob.tamano), 0),
+            func.coalesce(func.sum((Blob.referencias - 1) * Blob.tamano), 0),
+        ).group_by(Blob.carpeta).order_by(Blob.carpeta)
+    )
+    return [
+        {'carpeta': carpeta, 'blobs': blobs, 'referencias': referencias, 'bytes_en_disco': en_disco,
+         'bytes_ahorrados': ahorrados}
+        for carpeta, blobs, referencias, en_disco, ahorrados in filas
+    ]
+
+
+def limpiar_huerfanos(edad_temporales=3600):
+    """
+    Borra los archivos con nombre de blob que no tienen fila (p. ej. de una vista
+    que hizo rollback después de guardar) y los temporales de subidas abandonadas.
+    Devuelve el número de archivos borrados.
+    """
+    borrados = 0
+    limite = time.time() - edad_temporales
+    for clave_carpeta in CARPETAS_BLOBS:
+        carpeta = current_app.config.get(clave_carpeta)
+        if not carpeta or not os.path.isdir(carpeta):
+            continue
+        registrados = set(db.session.execute(select(Blob.nombre).where(Blob.carpeta == clave_carpeta)).scalars())
+        with os.scandir(carpeta) as entradas:
+            for entrada in entradas:
+                if not entrada.is_file():
+                    continue
+                huerfano = es_blob(entrada.name) and entrada.name not in registrados
+                abandonado = entrada.name.endswith(SUFIJO_TEMPORAL) and entrada.stat().st_mtime < limite
+                if huerfano or abandonado:
+                    os.unlink(entrada.path)
+                    borrados += 1
+    return borrados
+
+
+def _formato_bytes(n):
+    for unidad in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024:
+            return f"{n:.0f} {unidad}" if unidad == 'B' else f"{n:.1f} {unidad}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+@click.command('estado-blobs')
+@click.option('--limpiar', is_flag=True, help='Borra los archivos huérfanos y los temporales abandonados.')
+@with_appcontext
+def estado_blobs_command(limpiar):
+    """Espacio en disco de las subidas y lo que ahorra la deduplicación."""
+    total_disco = total_ahorrado = 0
+    for fila in estadisticas():
+        total_disco += fila['bytes_en_disco']
+        total_ahorrado += fila['bytes_ahorrados']
+        print(f"{fila['carpeta']:<32} {fila['blobs']:>6} archivos {fila['referencias']:>6} referencias "
+              f"{_formato_bytes(fila['bytes_en_disco']):>10} en disco {_formato_bytes(fila['bytes_ahorrados']):>10} ahorrados")
+    print(f"Total: {_formato_bytes(total_disco)} en disco, {_formato_bytes(total_ahorrado)} ahorrados por la deduplicación")
+    if limpiar:
+        print(f"Archivos huérfanos borrados: {limpiar_huerfanos()}")
@@ -1,43 +1,45 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, session, current_app, jsonify, make_response, Blueprint
 from config import Config
 import os
-from werkzeug.utils import secure_filename
+import threading
 from datetime import datetime, date, timedelta
 import re
 import json
 from functools import wraps
-import uuid
 from sqlalchemy.exc import IntegrityError
 from auth_setup import oauth_bp, init_oauth
 from models import db, bcrypt, migrate, User, AboutUs
+from busqueda import include_object as busqueda_include_object
 from contactos import contactos_bp
 from perfil import perfil_bp
 from aboutus import aboutus_bp
 from flask_cors import CORS
 from flask_mail import Mail, Message
-from version import version_bp, Version
+from version import version_bp, obtener_ultima_version
 from btns import btns_bp
+from trabajos import trabajos_bp, encolar_trabajo, quiere_trabajo_en_segundo_plano, recuperar_trabajos_interrumpidos
+from planes_consulta import verificar_planes_command
+from presupuesto_consultas import verificar_consultas_command
+from roles import recalcular_roles_command, reclamar_primer_superuser
+from avatares import encolar_miniaturas, avatar_variantes, generar_miniaturas_command
+from contrasenas import generar_hash, verificar_hash, necesita_rehash, ContrasenasOcupadasError
+from sesiones import init_sesiones, limpiar_sesiones_command
+from catalogo_activos import escanear_activos_command
+from almacen_blobs import guardar_subida, estado_blobs_command
+from vigilante_activos import vigilar_activos_command
+from subidas import subidas_bp, limpiar_subidas_command
+from medios import medios_bp
+from rendimiento import init_rendimiento
+from motor_bd import configurar_motor, init_motor_bd, con_reintentos
+from lecturas_bd import configurar_lecturas, init_lecturas
 from flask_babel import Babel  # <-- CAMBIO CLAVE: Usa la importación de Flask-Babel
 # --- IMPORTACIONES PARA LA LÓGICA DE EXPORTACIÓN ---
 from exports import export_to_pdf, export_to_jpg, export_to_xls, export_to_vcard
 
 # --- Instanciar las extensiones globalmente ---
+# Se enlazan a cada app en create_app() (al final de este archivo)
 mail = Mail()
-
-
-app = Flask(__name__, instance_relative_config=True)
-CORS(app)
-
-# --- Cargar configuración ---
-app.config.from_object(Config)
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)
-app.config['BABEL_TRANSLATION_DIRECTORIES'] = 'translations'
-
-# --- Inicializar extensiones ---
-db.init_app(app)
-bcrypt.init_app(app)
-migrate.init_app(app, db)
-mail.init_app(app)
+babel = Babel()
 
 # --- Función para obtener el idioma seleccionado ---
 LANGUAGES = ['es', 'en']
@@ -49,33 +51,31 @@ def get_locale():
         return lang
     return request.accept_languages.best_match(LANGUAGES)
 
-# --- Instanciar y registrar Babel después de la configuración de la app ---
-babel = Babel(app)
-babel.init_app(app, locale_selector=get_locale)
-
-
-# --- Asegurarse de que la carpeta 'instance' exista ---
-if not os.path.exists(app.instance_path):
-    os.makedirs(app.instance_path)
-
-# Configuración para subida de archivos (usando app.config directamente desde el principio)
-# Asegúrate de que estas rutas sean absolutas y que el usuario que ejecuta la app tenga permisos de escritura.
-# Estas rutas ya deberían estar definidas en config.py, aquí solo las aseguramos
-# y creamos las carpetas si no existen.
-# AHORA ESTAS LÍNES SE EJECUTAN DESPUÉS DE app.config.from_object(Config)
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['PROJECT_IMAGE_UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['NOTE_IMAGE_UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['CAMINATA_IMAGE_UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['PAGOS_IMAGE_UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['CALENDAR_IMAGE_UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['SONGS_UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['PLAYLIST_COVER_UPLOAD_FOLDER'], exist_ok=True) # Asegurarse de que esta exista
-os.makedirs(app.config['INSTRUCTION_ATTACHMENT_FOLDER'], exist_ok=True)
-os.makedirs(app.config['MAP_FILES_UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['COVERS_UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['UPLOAD_FILES_FOLDER'], exist_ok=True)
+
+# Carpetas de subida definidas en config.py; create_app() las crea si no existen.
+# Asegúrate de que el usuario que ejecuta la app tenga permisos de escritura.
+CARPETAS_SUBIDA = [
+    'UPLOAD_FOLDER',
+    'PROJECT_IMAGE_UPLOAD_FOLDER',
+    'NOTE_IMAGE_UPLOAD_FOLDER',
+    'CAMINATA_IMAGE_UPLOAD_FOLDER',
+    'PAGOS_IMAGE_UPLOAD_FOLDER',
+    'CALENDAR_IMAGE_UPLOAD_FOLDER',
+    'SONGS_UPLOAD_FOLDER',
+    'PLAYLIST_COVER_UPLOAD_FOLDER',
+    'INSTRUCTION_ATTACHMENT_FOLDER',
+    'MAP_FILES_UPLOAD_FOLDER',
+    'COVERS_UPLOAD_FOLDER',
+    'ABOUTUS_IMAGE_UPLOAD_FOLDER',
+    'UPLOAD_FILES_FOLDER',
+]
+
+
+def crear_carpetas(app):
+    """Crea la carpeta 'instance' y las de subida (una vez por proceso maestro, no en cada import)."""
+    os.makedirs(app.instance_path, exist_ok=True)
+    for clave in CARPETAS_SUBIDA:
+        os.makedirs(app.config[clave], exist_ok=True)
 
 
 # Función auxiliar para verificar extensiones permitidas (ahora usando app.config)
@@ -89,14 +89,7 @@ def allowed_music_file(filename):
            filename.rsplit('.', 1)[1].lower() in {'mp3', 'wav', 'ogg'} # Usar set literal o definir en config
 
 
-# Adjuntando allowed_file y allowed_music_file al objeto 'app'
-# Esto permite que los Blueprints accedan a ellos a través de current_app
-app.allowed_file = allowed_file
-app.allowed_music_file = allowed_music_file
-
-
 # NUEVOS FILTROS DE JINJA2: Para formatear moneda y parsear JSON en las plantillas
-@app.template_filter('format_currency')
 def format_currency_filter(value):
     if value is None:
         return "N/A"
@@ -105,7 +98,6 @@ def format_currency_filter(value):
     except (ValueError, TypeError):
         return str(value)
 
-@app.template_filter('from_json')
 def from_json_filter(value):
     if value:
         try:
@@ -115,7 +107,6 @@ def from_json_filter(value):
     return []
 
 # Filtro personalizado para Jinja2 para convertir a datetime
-@app.template_filter('to_datetime')
 def to_datetime_filter(value):
     if isinstance(value, datetime):
         return value
@@ -170,14 +161,10 @@ def role_required(roles):
 
 
 # NUEVO: Procesador de contexto para inyectar la última versión en todas las plantillas
-@app.context_processor
 def inject_latest_version():
     try:
-        # CORRECCIÓN: Asegurarse de que Version esté disponible en este contexto
-        # Ya se importa desde version.py arriba
-        latest_version = Version.query.order_by(Version.fecha_creacion.desc()).first()
-        if latest_version:
-            return {'latest_version_number': latest_version.numero_version}
+        # Se lee de la caché de version.py: solo consulta la base de datos cuando cambia una Version
+        return {'latest_version_number': obtener_ultima_version()}
     except Exception as e:
         # Esto es importante para manejar el caso donde la tabla Version aún no existe
         # durante el primer inicio o antes de las migraciones.
@@ -185,44 +172,12 @@ def inject_latest_version():
     return {'latest_version_number': 'N/A'} # Valor por defecto si no hay versiones o hay un error
 
 
-# LÓGICA PARA EL PRIMER SUPERUSUARIO: Se ejecuta antes de cada solicitud
-@app.before_request
-def check_for_first_user():
-    """
-    Verifica si no hay usuarios en la base de datos.
-    Si no hay, la siguiente ruta de registro permitirá crear un Superuser.
-    Esta bandera solo se establece una vez por instancia de la aplicación en memoria.
-    """
-    # Solo ejecutar si la bandera aún no se ha establecido.
-    # Esto evita consultas a la DB en cada request después de la inicialización.
-    # Se añade un try-except para manejar el caso de que la tabla 'user' aún no exista
-    # durante el primer despliegue o después de un borrado de DB.
-    if 'first_user_registration_allowed' not in current_app.config:
-        with app.app_context():
-            try:
-                total_users = db.session.query(User).count()
-                if total_users == 0:
-                    current_app.config['first_user_registration_allowed'] = True
-                    print("DEBUG: No se encontraron usuarios. El próximo registro será un Superuser.")
-                else:
-                    current_app.config['first_user_registration_allowed'] = False
-                    print("DEBUG: Ya existen usuarios. Los registros serán Usuarios Regulares.")
-            except Exception as e:
-                # Si la tabla 'user' no existe (ej. primer inicio), asumimos que es el primer usuario
-                # y permitimos el registro como Superuser.
-                current_app.config['first_user_registration_allowed'] = True
-                print(f"DEBUG: Error al contar usuarios (posiblemente tabla 'user' no existe): {e}. Se permitirá el registro de Superuser.")
-
-
-# Rutas principales de la aplicación
-@app.route('/')
-@app.route('/home') # Añadido /home como ruta alternativa para la página de inicio
+# Rutas principales de la aplicación (se registran en registrar_rutas)
 def home():
     # Redirige a la página 'Acerca de nosotros' como la nueva página de inicio
     return redirect(url_for('aboutus.ver_aboutus'))
 
 
-@app.route('/register', methods=['GET', 'POST'])
 def register():
     # Opciones para los campos de selección (duplicadas aquí por si el context processor no carga a tiempo)
     provincia_opciones = ["Cartago", "Limón", "Puntarenas", "San José", "Heredia", "Guanacaste", "Alajuela"]
@@ -311,28 +266,36 @@ def register():
                                        capacidad_opciones=capacidad_opciones,
                                        participacion_opciones=participacion_opciones)
 
+        # Asignar el rol por defecto de 'Usuario Regular'
+        role = 'Usuario Regular'
+
+        # LÓGICA CLAVE PARA ASIGNAR EL ROL DE SUPERUSUARIO AL PRIMER USUARIO
+        # El reclamo es atómico (fila única en app_settings, ver roles.py) y se guarda
+        # en el mismo commit que el usuario: dos registros simultáneos no pueden ser ambos Superuser.
+        # Va antes de guardar el avatar: el reclamo debe hacerse antes que cualquier otro cambio en la sesión.
+        if reclamar_primer_superuser(username):
+            role = 'Superuser'
+            print(f"DEBUG: Registrando a {username} como Superuser (primer usuario).")
+        # FIN LÓGICA CLAVE
+
         # Hash de la contraseña
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        hashed_password = generar_hash(password) # En el pool de bcrypt (contrasenas.py)
 
         # Manejo de la imagen de avatar
         avatar_url = None
         if 'avatar' in request.files:
             avatar_file = request.files['avatar']
             if avatar_file and avatar_file.filename != '':
-                # Generar un nombre de archivo único
-                filename = secure_filename(avatar_file.filename)
-                unique_filename = str(uuid.uuid4()) + os.path.splitext(filename)[1]
-
                 # Definir la ruta de guardado
-                upload_folder = app.config.get('UPLOAD_FOLDER')
+                upload_folder = current_app.config.get('UPLOAD_FOLDER')
                 if not upload_folder:
                     flash('Error de configuración: Carpeta de subida de avatares no definida.', 'danger')
                     return redirect(url_for('register'))
 
-                os.makedirs(upload_folder, exist_ok=True)
-
-                file_path = os.path.join(upload_folder, unique_filename)
-                avatar_file.save(file_path)
+                # Guardado por contenido: si la imagen ya existe se reutiliza (almacen_blobs.py)
+                unique_filename, nuevo = guardar_subida(avatar_file, 'UPLOAD_FOLDER')
+                if nuevo:
+                    encolar_miniaturas(os.path.join(upload_folder, unique_filename)) # Miniaturas 48/128/512 en WebP y JPEG
 
                 # Actualizar la URL del avatar en el usuario
                 avatar_url = os.path.join('uploads', 'avatars', unique_filename).replace('\\', '/') # Ruta relativa para URL
@@ -358,25 +321,6 @@ def register():
                                        capacidad_opciones=capacidad_opciones,
                                        participacion_opciones=participacion_opciones)
 
-        # Asignar el rol por defecto de 'Usuario Regular'
-        role = 'Usuario Regular'
-
-        # LÓGICA CLAVE PARA ASIGNAR EL ROL DE SUPERUSUARIO AL PRIMER USUARIO
-        # current_app.config.get() es importante por si la bandera no existe (ej. en desarrollo local sin before_request)
-        if current_app.config.get('first_user_registration_allowed', False):
-            with app.app_context(): # Asegura que la consulta a la DB se haga dentro del contexto de la app
-                total_users_after_check = db.session.query(User).count()
-                if total_users_after_check == 0:
-                    role = 'Superuser'
-                    # Desactivar la bandera inmediatamente después de que se registre el primer superuser
-                    current_app.config['first_user_registration_allowed'] = False
-                    print(f"DEBUG: Registrando a {username} como Superuser (primer usuario).")
-                else:
-                    print(f"DEBUG: Ya existen usuarios (verificación secundaria), {username} se registrará como Usuario Regular.")
-        else:
-            print(f"DEBUG: 'first_user_registration_allowed' es False, {username} se registrará como Usuario Regular.")
-        # FIN LÓGICA CLAVE
-
         new_user = User(
             username=username,
             # CORRECCIÓN: Cambiado 'password_hash' a 'password'
@@ -429,17 +373,25 @@ def register():
                            capacidad_opciones=capacidad_opciones,
                            participacion_opciones=participacion_opciones)
 
-@app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username_or_email = request.form['username_or_email']
         password = request.form['password']
         remember_me = request.form.get('remember_me') # AÑADIDO: Captura el valor del checkbox
 
-        user = User.query.filter((User.username == username_or_email) | (User.email == username_or_email.lower())).first()
+        user = User.query.filter((User.username == username_or_email) | (db.func.lower(User.email) == username_or_email.lower())).first()
 
         # CORRECCIÓN: Cambiado user.password_hash a user.password
-        if user and bcrypt.check_password_hash(user.password, password):
+        if user and verificar_hash(user.password, password):
+            # Si cambió BCRYPT_LOG_ROUNDS, se guarda el hash con el costo nuevo
+            if necesita_rehash(user.password):
+                nuevo_hash = generar_hash(password)
+
+                def _guardar_hash():
+                    user.password = nuevo_hash
+                    db.session.commit()
+                con_reintentos(_guardar_hash, revertir_sesion=True)
+
             # AÑADIDO: Lógica para sesión permanente
             if remember_me:
                 session.permanent = True
@@ -455,7 +407,6 @@ def login():
             flash('Nombre de usuario, correo electrónico o contraseña incorrectos.', 'danger')
     return render_template('login.html')
 
-@app.route('/logout')
 @login_required
 def logout():
     session.pop('logged_in', None)
@@ -469,7 +420,6 @@ def logout():
 
 
 # <<< INICIO: NUEVA RUTA PARA CAMBIAR EL TEMA >>>
-@app.route('/change_theme/<theme>')
 def change_theme(theme):
     if theme in ['light', 'dark', 'sepia']:
         session['theme'] = theme
@@ -478,7 +428,6 @@ def change_theme(theme):
 
 
 # <<< INICIO: NUEVA RUTA PARA CAMBIAR EL IDIOMA >>>
-@app.route('/change_language/<lang>')
 def change_language(lang):
     if lang in ['es', 'en']:
         session['lang'] = lang
@@ -501,7 +450,6 @@ Si no solicitaste este cambio, simplemente ignora este correo y no se realizará
     mail.send(msg)
 
 
-@app.route('/request_password_reset', methods=['GET', 'POST'])
 def request_password_reset():
     if session.get('logged_in'):
         return redirect(url_for('home'))
@@ -517,7 +465,6 @@ def request_password_reset():
     return render_template('request_password_reset.html')
 
 
-@app.route('/reset_password/<token>', methods=['GET', 'POST'])
 def reset_password(token):
     if session.get('logged_in'):
         return redirect(url_for('home'))
@@ -534,7 +481,7 @@ def reset_password(token):
             flash('Las contraseñas no coinciden.', 'danger')
             return render_template('reset_password.html', token=token)
 
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        hashed_password = generar_hash(password)
         user.password = hashed_password
         db.session.commit()
         flash('Tu contraseña ha sido actualizada. Ahora puedes iniciar sesión.', 'success')
@@ -545,14 +492,31 @@ def reset_password(token):
 # --- FIN: RUTAS DE RECUPERACIÓN DE CONTRASEÑA ---
 
 
-@app.errorhandler(404)
 def page_not_found(e):
     return render_template('404.html'), 404
 
-@app.errorhandler(500)
 def internal_server_error(e):
     return render_template('500.html'), 500
 
+def contrasenas_ocupadas(e):
+    # Respuesta rápida cuando el pool de bcrypt está saturado (contrasenas.py)
+    if request.accept_mimetypes.best == 'application/json':
+        response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+    else:
+        response = make_response(render_template('503.html', retry_after=e.retry_after))
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def archivo_demasiado_grande(e):
+    # El cuerpo supera MAX_CONTENT_LENGTH: los archivos grandes van por las subidas por partes (subidas.py)
+    limite_mb = current_app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    mensaje = f'El archivo supera el máximo de {limite_mb} MB por envío.'
+    if request.accept_mimetypes.best == 'application/json' or request.blueprint == 'subidas':
+        return jsonify({'error': mensaje}), 413
+    flash(mensaje, 'danger')
+    return redirect(request.referrer or url_for('home'))
+
 
 # --- INICIO: LÓGICA DE EXPORTACIÓN (TU CÓDIGO) ---
 # Define un Blueprint para organizar las rutas de exportación
@@ -577,6 +541,14 @@ def export_data(format_type):
         {'nombre': 'Luis', 'apellido': 'Rodríguez', 'email': 'luis.r@example.com', 'telefono': '555-9012'}
     ]
 
+    # Con ?async=1 y sesión iniciada la exportación se genera como trabajo en segundo plano (responde 202)
+    nombres_archivo = {'pdf': 'contactos.pdf', 'jpg': 'reporte.jpg', 'xls': 'contactos.xlsx'}
+    if quiere_trabajo_en_segundo_plano() and sample_data:
+        if format_type in nombres_archivo:
+            return encolar_trabajo('export_data', {'format_type': format_type, 'data': sample_data, 'filename': nombres_archivo[format_type]})
+        if format_type == 'vcard':
+            return encolar_trabajo('export_data', {'format_type': format_type, 'data': sample_data[0], 'filename': f"contacto_{sample_data[0]['nombre']}.vcf"})
+
     if format_type == 'pdf':
         return export_to_pdf(sample_data, 'contactos.pdf')
     elif format_type == 'jpg':
@@ -595,23 +567,115 @@ def export_data(format_type):
 # --- FIN DE LA LÓGICA DE EXPORTACIÓN ---
 
 
-# REGISTRO DE BLUEPRINTS (DEBE IR DESPUÉS DE LA INICIALIZACIÓN DE EXTENSIONES)
-app.register_blueprint(contactos_bp)
-app.register_blueprint(perfil_bp, url_prefix='/perfil')
-app.register_blueprint(aboutus_bp, url_prefix='/aboutus')
-app.register_blueprint(version_bp, url_prefix='/version')
-app.register_blueprint(btns_bp) # REGISTRO DEL BLUEPRINT DE BTNS
-app.register_blueprint(export_bp) # REGISTRO DEL BLUEPRINT DE EXPORTACIÓN
-
-# --- AÑADE ESTAS DOS LÍNEAS PARA CONECTAR OAUTH ---
-init_oauth(app)
-app.register_blueprint(oauth_bp)
-# --- FIN DE LAS LÍNEAS A AÑADIR ---
+def registrar_rutas(app):
+    """Rutas, filtros y manejadores de error propios de app.py (los módulos usan blueprints)."""
+    # Adjuntando allowed_file y allowed_music_file al objeto 'app'
+    # Esto permite que los Blueprints accedan a ellos a través de current_app
+    app.allowed_file = allowed_file
+    app.allowed_music_file = allowed_music_file
+
+    # Filtros de Jinja2 y procesador de contexto
+    app.add_template_filter(format_currency_filter, 'format_currency')
+    app.add_template_filter(from_json_filter, 'from_json')
+    app.add_template_filter(to_datetime_filter, 'to_datetime')
+    # Miniaturas de avatares en las plantillas: {% set variantes = avatar_variantes(user.avatar_url) %}
+    app.add_template_global(avatar_variantes, 'avatar_variantes')
+    app.context_processor(inject_latest_version)
+
+    app.add_url_rule('/', 'home', home)
+    app.add_url_rule('/home', 'home', home) # Añadido /home como ruta alternativa para la página de inicio
+    app.add_url_rule('/register', 'register', register, methods=['GET', 'POST'])
+    app.add_url_rule('/login', 'login', login, methods=['GET', 'POST'])
+    app.add_url_rule('/logout', 'logout', logout)
+    app.add_url_rule('/change_theme/<theme>', 'change_theme', change_theme)
+    app.add_url_rule('/change_language/<lang>', 'change_language', change_language)
+    app.add_url_rule('/request_password_reset', 'request_password_reset', request_password_reset, methods=['GET', 'POST'])
+    app.add_url_rule('/reset_password/<token>', 'reset_password', reset_password, methods=['GET', 'POST'])
+
+    app.register_error_handler(404, page_not_found)
+    app.register_error_handler(500, internal_server_error)
+    app.register_error_handler(ContrasenasOcupadasError, contrasenas_ocupadas)
+    app.register_error_handler(413, archivo_demasiado_grande)
+
+
+def create_app(config_class=Config):
+    """
+    Fábrica de la aplicación. La usan wsgi.py, servidor.py (que la precarga en el
+    proceso maestro antes de crear los workers) y los comandos `flask`.
+    """
+    app = Flask(__name__, instance_relative_config=True)
+    CORS(app)
+
+    # --- Cargar configuración ---
+    app.config.from_object(config_class)
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)
+    app.config['BABEL_TRANSLATION_DIRECTORIES'] = 'translations'
+
+    # --- Inicializar extensiones ---
+    configurar_motor(app) # QueuePool para SQLite en archivo (motor_bd.py)
+    configurar_lecturas(app) # Bind de solo lectura para las peticiones GET (lecturas_bd.py)
+    db.init_app(app)
+    init_motor_bd(app) # PRAGMA de SQLite (WAL, busy_timeout, caché) en cada conexión
+    init_lecturas(app) # Lee tus escrituras: marca en la sesión tras escribir
+    bcrypt.init_app(app)
+    migrate.init_app(app, db, include_object=busqueda_include_object) # Ignora las tablas FTS5 de búsqueda al autogenerar
+    mail.init_app(app)
+    babel.init_app(app, locale_selector=get_locale)
+    init_sesiones(app) # Sesiones guardadas en el servidor; la cookie solo lleva el identificador
+    init_rendimiento(app) # Tiempos por petición, SQL y plantillas; página /admin/perf
+
+    crear_carpetas(app)
+    registrar_rutas(app)
+
+    # REGISTRO DE BLUEPRINTS (DEBE IR DESPUÉS DE LA INICIALIZACIÓN DE EXTENSIONES)
+    app.register_blueprint(contactos_bp)
+    app.register_blueprint(perfil_bp, url_prefix='/perfil')
+    app.register_blueprint(aboutus_bp, url_prefix='/aboutus')
+    app.register_blueprint(version_bp, url_prefix='/version')
+    app.register_blueprint(btns_bp) # REGISTRO DEL BLUEPRINT DE BTNS
+    app.register_blueprint(export_bp) # REGISTRO DEL BLUEPRINT DE EXPORTACIÓN
+    app.register_blueprint(trabajos_bp) # Trabajos de exportación en segundo plano
+    app.register_blueprint(subidas_bp) # Subidas reanudables por partes
+    app.register_blueprint(medios_bp) # Canciones, videos y archivos con ETag, rangos y X-Sendfile
+
+    # --- Comandos de consola ---
+    app.cli.add_command(verificar_planes_command) # flask verificar-planes: revisa que las consultas frecuentes usen índices
+    app.cli.add_command(verificar_consultas_command) # flask verificar-consultas: presupuesto de consultas por ruta y detección de N+1
+    app.cli.add_command(recalcular_roles_command) # flask recalcular-roles: reconstruye los contadores de usuarios por rol
+    app.cli.add_command(generar_miniaturas_command) # flask generar-miniaturas: miniaturas de los avatares ya existentes
+    app.cli.add_command(limpiar_sesiones_command) # flask limpiar-sesiones: borra las sesiones vencidas
+    app.cli.add_command(escanear_activos_command) # flask escanear-activos: actualiza el catálogo de archivos subidos
+    app.cli.add_command(vigilar_activos_command) # flask vigilar-activos: mantiene el catálogo al día con inotify
+    app.cli.add_command(estado_blobs_command) # flask estado-blobs: espacio ahorrado por la deduplicación de subidas
+    app.cli.add_command(limpiar_subidas_command) # flask limpiar-subidas: descarta las subidas por partes abandonadas
+
+    # --- OAUTH ---
+    init_oauth(app)
+    app.register_blueprint(oauth_bp)
+
+    return app
+
+
+# `from app import app` (archivo WSGI de PythonAnywhere, FLASK_APP=app.py, benchmarks)
+# sigue funcionando: la instancia global se crea la primera vez que se pide, no al importar.
+_app_lock = threading.Lock()
+
+def __getattr__(name):
+    global app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _app_lock:
+        if 'app' not in globals():
+            app = create_app()
+    return app
 
 
 if __name__ == '__main__':
+    # Servidor de desarrollo. En producción: python servidor.py (ver servidor.py)
+    app = create_app()
     with app.app_context(): # Usar app_context para db.create_all()
         db.create_all()
+        recuperar_trabajos_interrumpidos()
     app.run(host='0.0.0.0', debug=True, port=3030)
 
 
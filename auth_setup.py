@@ -1,53 +1,75 @@
 # oauth.py
 import os
-from flask import Blueprint, url_for, redirect, flash
+import threading
+from flask import Blueprint, url_for, redirect, flash, current_app
 from flask_login import login_user
-from authlib.integrations.flask_client import OAuth
 from werkzeug.security import generate_password_hash
 
 # Importa tus modelos y la sesión de la base de datos.
 # Asegúrate de que la ruta de importación sea correcta desde donde ejecutas tu app.
 from models import db, User, OAuthSignIn
+from lecturas_bd import usar_primaria
 
-# 1. Crear el Blueprint y la instancia de OAuth
+# 1. Crear el Blueprint. El cliente OAuth de Authlib se crea con la primera
+# petición a /oauth (ver obtener_oauth): importar Authlib cuesta un cuarto de
+# segundo y no hace falta en el arranque ni en los comandos `flask`.
 oauth_bp = Blueprint('oauth_bp', __name__, url_prefix='/oauth')
-oauth = OAuth()
+_oauth_lock = threading.Lock()
 
 # 2. Función para inicializar los proveedores de OAuth con la app de Flask
 def init_oauth(app):
-    """Inicializa los proveedores de OAuth con la configuración de la app."""
-    oauth.init_app(app)
-    
-    # Registrar GitHub
-    oauth.register(
-        name='github',
-        client_id=app.config.get('GITHUB_CLIENT_ID'),
-        client_secret=app.config.get('GITHUB_CLIENT_SECRET'),
-        api_base_url='https://api.github.com/',
-        access_token_url='https://github.com/login/oauth/access_token',
-        authorize_url='https://github.com/login/oauth/authorize',
-        client_kwargs={'scope': 'user:email'},
-    )
-    
-    # Registrar Google (opcional, si también lo quieres)
-    oauth.register(
-        name='google',
-        server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-        client_id=app.config.get('GOOGLE_CLIENT_ID'),
-        client_secret=app.config.get('GOOGLE_CLIENT_SECRET'),
-        client_kwargs={'scope': 'openid email profile'}
-    )
+    """Prepara la app para OAuth; el cliente de Authlib se crea al primer uso."""
+    app.extensions.setdefault('oauth_cliente', None)
+
+
+def obtener_oauth():
+    """Devuelve el cliente OAuth de la app actual, creándolo y registrando los proveedores la primera vez."""
+    app = current_app._get_current_object()
+    oauth = app.extensions.get('oauth_cliente')
+    if oauth is not None:
+        return oauth
+
+    with _oauth_lock:
+        oauth = app.extensions.get('oauth_cliente')
+        if oauth is not None:
+            return oauth
+
+        from authlib.integrations.flask_client import OAuth
+        oauth = OAuth(app)
+
+        # Registrar GitHub
+        oauth.register(
+            name='github',
+            client_id=app.config.get('GITHUB_CLIENT_ID'),
+            client_secret=app.config.get('GITHUB_CLIENT_SECRET'),
+            api_base_url='https://api.github.com/',
+            access_token_url='https://github.com/login/oauth/access_token',
+            authorize_url='https://github.com/login/oauth/authorize',
+            client_kwargs={'scope': 'user:email'},
+        )
 
-    # Registrar Facebook (opcional, si también lo quieres)
-    oauth.register(
-        name='facebook',
-        client_id=app.config.get('FACEBOOK_CLIENT_ID'),
-        client_secret=app.config.get('FACEBOOK_CLIENT_SECRET'),
-        api_base_url='https://graph.facebook.com/v12.0/',
-        access_token_url='https://graph.facebook.com/v12.0/oauth/access_token',
-        authorize_url='https://www.facebook.com/v12.0/dialog/oauth',
-        client_kwargs={'scope': 'email public_profile'},
-    )
+        # Registrar Google (opcional, si también lo quieres)
+        oauth.register(
+            name='google',
+            server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+            client_id=app.config.get('GOOGLE_CLIENT_ID'),
+            client_secret=app.config.get('GOOGLE_CLIENT_SECRET'),
+            client_kwargs={'scope': 'openid email profile'}
+        )
+
+        # Registrar Facebook (opcional, si también lo quieres)
+        oauth.register(
+            name='facebook',
+            client_id=app.config.get('FACEBOOK_CLIENT_ID'),
+            client_secret=app.config.get('FACEBOOK_CLIENT_SECRET'),
+            api_base_url='https://graph.facebook.com/v12.0/',
+            access_token_url='https://graph.facebook.com/v12.0/oauth/access_token',
+            authorize_url='https://www.facebook.com/v12.0/dialog/oauth',
+            client_kwargs={'scope': 'email public_profile'},
+        )
+
+        app.extensions['oauth_cliente'] = oauth
+        return oauth
 
 # 3. Rutas de Autenticación
 @oauth_bp.route('/login/<provider>')
@@ -56,14 +78,15 @@ def login(provider):
     Redirige al usuario a la página de autorización del proveedor (ej. GitHub).
     """
     redirect_uri = url_for('oauth_bp.authorize', provider=provider, _external=True)
-    return oauth.create_client(provider).authorize_redirect(redirect_uri)
+    return obtener_oauth().create_client(provider).authorize_redirect(redirect_uri)
 
 @oauth_bp.route('/authorize/<provider>')
+@usar_primaria # Busca o crea el usuario: no debe decidir con datos de una réplica atrasada
 def authorize(provider):
     """
     Maneja la respuesta del proveedor después de que el usuario autoriza la app.
     """
-    client = oauth.create_client(provider)
+    client = obtener_oauth().create_client(provider)
     try:
         token = client.authorize_access_token()
     except Exception as e:
@@ -0,0 +1,190 @@
+# avatares.py
+# Miniaturas de los avatares de usuario.
+#
+# Al subir un avatar (registro, editar perfil, editar contacto) el original se
+# guarda como siempre en static/uploads/avatars/ y se encola en un pool de hilos
+# la generación de versiones cuadradas de 48, 128 y 512 px en WebP y JPEG, con
+# la orientación EXIF ya aplicada. Las miniaturas van a
+# static/uploads/avatars/thumbs/<nombre>_<tamaño>.<formato>.
+#
+# Las plantillas usan avatar_variantes(user.avatar_url): si las miniaturas
+# existen devuelve los srcset para <picture>; si aún no (subida reciente o
+# avatar antiguo sin procesar) devuelve None y se muestra el original.
+# Para los avatares ya existentes: flask generar-miniaturas
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+
+TAMANOS_AVATAR = (48, 128, 512)
+FORMATOS_AVATAR = ('webp', 'jpg')
+CARPETA_MINIATURAS = 'thumbs'
+EXTENSIONES_IMAGEN = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')
+AVATARES_POR_DEFECTO = ('default.png', 'default_avatar.png')
+
+CALIDAD_WEBP = 80
+CALIDAD_JPEG = 85
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(app=None):
+    """Crea el pool de hilos la primera vez (y de nuevo tras un fork del proceso)."""
+    global _executor, _executor_pid
+    app = app or current_app
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('AVATAR_THUMBNAIL_WORKERS', 2),
+                thread_name_prefix='avatar-thumb'
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _nombre_miniatura(nombre_original, tamano, formato):
+    base = os.path.splitext(os.path.basename(nombre_original))[0]
+    return f"{base}_{tamano}.{formato}"
+
+
+def ruta_miniatura(upload_folder, nombre_original, tamano, formato):
+    """Ruta absoluta de una miniatura dentro de la carpeta de avatares."""
+    return os.path.join(upload_folder, CARPETA_MINIATURAS, _nombre_miniatura(nombre_original, tamano, formato))
+
+
+def generar_miniaturas(ruta_original, upload_folder, forzar=False):
+    """
+    Genera todas las variantes (TAMANOS_AVATAR x FORMATOS_AVATAR) del avatar `ruta_original`.
+    Cada archivo se escribe en un temporal y se renombra, así nunca se sirve una miniatura a medias.
+    Devuelve el número de archivos escritos.
+    """
+    carpeta = os.path.join(upload_folder, CARPETA_MINIATURAS)
+    os.makedirs(carpeta, exist_ok=True)
+
+    pendientes = [
+        (tamano, formato) for tamano in TAMANOS_AVATAR for formato in FORMATOS_AVATAR
+        if forzar or not os.path.exists(ruta_miniatura(upload_folder, ruta_original, tamano, formato))
+    ]
+    if not pendientes:
+        return 0
+
+    from PIL import Image, ImageOps  # Solo los hilos de miniaturas necesitan Pillow
+
+    with Image.open(ruta_original) as imagen:
+        imagen = ImageOps.exif_transpose(imagen)
+        if imagen.mode not in ('RGB', 'RGBA'):
+            imagen = imagen.convert('RGBA')
+
+        # Para JPEG se aplana la transparencia sobre fondo blanco
+        if imagen.mode == 'RGBA':
+            fondo = Image.new('RGB', imagen.size, (255, 255, 255))
+            fondo.paste(imagen, mask=imagen.getchannel('A'))
+            imagen_rgb = fondo
+        else:
+            imagen_rgb = imagen
+
+        escritos = 0
+        fuentes = {'webp': imagen, 'jpg': imagen_rgb}
+        # Se procesa de mayor a menor: cada tamaño se reduce desde el anterior, que ya es pequeño
+        for tamano in sorted({t for t, _ in pendientes}, reverse=True):
+            recortes = {
+                formato: ImageOps.fit(fuente, (tamano, tamano), Image.LANCZOS)
+                for formato, fuente in fuentes.items()
+            }
+            fuentes = recortes
+            for formato in FORMATOS_AVATAR:
+                if (tamano, formato) not in pendientes:
+                    continue
+                destino = ruta_miniatura(upload_folder, ruta_original, tamano, formato)
+                temporal = destino + '.tmp'
+                if formato == 'webp':
+                    recortes['webp'].save(temporal, 'WEBP', quality=CALIDAD_WEBP, method=4)
+                else:
+                    recortes['jpg'].save(temporal, 'JPEG', quality=CALIDAD_JPEG, optimize=True, progressive=True)
+                os.replace(temporal, destino)
+                escritos += 1
+    return escritos
+
+
+def _generar_en_segundo_plano(ruta_original, upload_folder):
+    try:
+        generar_miniaturas(ruta_original, upload_folder)
+    except Exception as e:
+        print(f"DEBUG: No se pudieron generar las miniaturas de {ruta_original}: {e}")
+
+
+def encolar_miniaturas(ruta_original):
+    """Envía al pool la generación de miniaturas de un avatar recién guardado."""
+    app = current_app._get_current_object()
+    return _get_executor(app).submit(_generar_en_segundo_plano, ruta_original, app.config['UPLOAD_FOLDER'])
+
+
+def borrar_miniaturas(avatar_url):
+    """Elimina las miniaturas de un avatar (al reemplazarlo o al borrar el usuario)."""
+    if not avatar_url:
+        return
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    for tamano in TAMANOS_AVATAR:
+        for formato in FORMATOS_AVATAR:
+            ruta = ruta_miniatura(upload_folder, avatar_url, tamano, formato)
+            if os.path.exists(ruta):
+                os.unlink(ruta)
+
+
+def es_avatar_por_defecto(avatar_url):
+    """True si el usuario no tiene avatar propio (esos archivos no se borran nunca)."""
+    return not avatar_url or os.path.basename(avatar_url) in AVATARES_POR_DEFECTO
+
+
+def avatar_variantes(avatar_url, tamanos=(48, 128)):
+    """
+    Función para las plantillas. Si las miniaturas del avatar existen devuelve un dict con
+    'webp' y 'jpg' (srcset con los `tamanos` pedidos) y 'src' (el JPEG más grande, como respaldo).
+    Devuelve None si todavía no hay miniaturas; la plantilla muestra entonces el original.
+    """
+    avatar_url = avatar_url or 'uploads/avatars/default.png'
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    # La variante más pequeña en el último formato es la última que se escribe
+    if not os.path.exists(ruta_miniatura(upload_folder, avatar_url, TAMANOS_AVATAR[0], FORMATOS_AVATAR[-1])):
+        return None
+
+    carpeta_url = os.path.dirname(avatar_url).replace('\\', '/')
+
+    def _url(tamano, formato):
+        return url_for('static', filename=f"{carpeta_url}/{CARPETA_MINIATURAS}/{_nombre_miniatura(avatar_url, tamano, formato)}")
+
+    return {
+        'webp': ', '.join(f"{_url(t, 'webp')} {t}w" for t in tamanos),
+        'jpg': ', '.join(f"{_url(t, 'jpg')} {t}w" for t in tamanos),
+        'src': _url(tamanos[-1], 'jpg'),
+    }
+
+
+@click.command('generar-miniaturas')
+@click.option('--forzar', is_flag=True, help='Regenera también las miniaturas que ya existen.')
+@with_appcontext
+def generar_miniaturas_command(forzar):
+    """Genera las miniaturas de todos los avatares existentes en la carpeta de subidas."""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    originales = [
+        os.path.join(upload_folder, nombre) for nombre in sorted(os.listdir(upload_folder))
+        if nombre.lower().endswith(EXTENSIONES_IMAGEN) and os.path.isfile(os.path.join(upload_folder, nombre))
+    ]
+
+    futuros = {
+        _get_executor().submit(generar_miniaturas, ruta, upload_folder, forzar): ruta
+        for ruta in originales
+    }
+    escritos, errores = 0, 0
+    for futuro, ruta in futuros.items():
+        try:
+            escritos += futuro.result()
+        except Exception as e:
+            errores += 1
+            print(f"Error con {os.path.basename(ruta)}: {e}")
+    print(f"Avatares revisados: {len(originales)}, miniaturas generadas: {escritos}, errores: {errores}")
@@ -0,0 +1,92 @@
+# bench_exportar_excel.py
+# Compara la exportación clásica a Excel (Workbook en memoria + BytesIO) con la
+# exportación write-only de exportacion_xlsx.py, midiendo tiempo y pico de RSS
+# con 1k, 10k y 100k usuarios sintéticos.
+#
+# Uso (desde la raíz del proyecto):
+#   python benchmarks/bench_exportar_excel.py
+#   python benchmarks/bench_exportar_excel.py 1000 5000
+#
+# Cada caso corre en un proceso hijo nuevo para que el pico de RSS no se mezcle.
+import io
+import os
+import sys
+import time
+import resource
+import tempfile
+import multiprocessing
+from datetime import datetime, date
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from exportacion_xlsx import CAMPOS_EXPORTABLES, escribir_usuarios_xlsx, formatear_valor
+
+TAMANOS_POR_DEFECTO = [1_000, 10_000, 100_000]
+COLUMNAS = list(CAMPOS_EXPORTABLES)  # Todas las columnas: el peor caso
+
+
+def usuarios_sinteticos(n):
+    """Generador de objetos con los mismos atributos que User."""
+    for i in range(n):
+        yield SimpleNamespace(
+            id=i, username=f'usuario{i}', nombre=f'Nombre{i}', primer_apellido='Pérez',
+            segundo_apellido='Gómez', cedula=f'1-{i:04d}-{i % 1000:04d}', email=f'usuario{i}@example.com',
+            telefono='8888-8888', telefono_emergencia='2222-2222', nombre_emergencia='Contacto',
+            empresa='La Tribu', direccion='San José', actividad='Senderista', capacidad='Intermedio',
+            participacion='Constante', fecha_cumpleanos=date(1990, 1, 1), tipo_sangre='O+',
+            poliza='123', aseguradora='INS', alergias='Ninguna', enfermedades_cronicas='Ninguna',
+            role='Usuario Regular', last_login_at=datetime(2025, 1, 1), fecha_registro=datetime(2024, 1, 1),
+            fecha_actualizacion=None,
+        )
+
+
+def exportar_clasico(n):
+    """Réplica de la exportación anterior: todos los usuarios en una lista y Workbook normal."""
+    import openpyxl
+    users = list(usuarios_sinteticos(n))  # Equivale a User.query.all()
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append([CAMPOS_EXPORTABLES[c] for c in COLUMNAS])
+    for user in users:
+        sheet.append([formatear_valor(getattr(user, c)) for c in COLUMNAS])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getbuffer().nbytes
+
+
+def exportar_write_only(n):
+    """Exportación nueva: generador (como yield_per) y archivo temporal."""
+    with tempfile.TemporaryFile(suffix='.xlsx') as spool:
+        escribir_usuarios_xlsx(usuarios_sinteticos(n), COLUMNAS, spool)
+        return spool.tell()
+
+
+def _caso(nombre, n, cola):
+    funcion = exportar_clasico if nombre == 'clasico' else exportar_write_only
+    inicio = time.perf_counter()
+    tamano = funcion(n)
+    duracion = time.perf_counter() - inicio
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        pico //= 1024
+    cola.put((duracion, pico, tamano))
+
+
+def medir(nombre, n):
+    cola = multiprocessing.Queue()
+    proceso = multiprocessing.Process(target=_caso, args=(nombre, n, cola))
+    proceso.start()
+    resultado = cola.get()
+    proceso.join()
+    return resultado
+
+
+if __name__ == '__main__':
+    tamanos = [int(a) for a in sys.argv[1:]] or TAMANOS_POR_DEFECTO
+    print(f"{'usuarios':>10} {'modo':>12} {'tiempo (s)':>11} {'pico RSS (MiB)':>15} {'archivo (KiB)':>14}")
+    for n in tamanos:
+        for nombre in ('clasico', 'write_only'):
+            duracion, pico_kib, tamano = medir(nombre, n)
+            print(f"{n:>10} {nombre:>12} {duracion:>11.2f} {pico_kib / 1024:>15.1f} {tamano / 1024:>14.0f}")
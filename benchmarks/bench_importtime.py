@@ -0,0 +1,81 @@
+# bench_importtime.py
+# Presupuesto del tiempo de importación de la aplicación (arranque en frío de
+# cada worker y de cada comando `flask`).
+#
+# Importa el módulo indicado (por defecto `wsgi`) en procesos nuevos con
+# `python -X importtime`, toma la mediana del tiempo total y muestra los
+# módulos que más tardan. Termina con error si:
+#   - la mediana supera --presupuesto-ms, o
+#   - se cargó alguno de los módulos pesados de MODULOS_DIFERIDOS, que solo
+#     deben importarse dentro de las funciones de exportación/OAuth.
+#
+# Uso (desde la raíz del proyecto):
+#   python benchmarks/bench_importtime.py
+#   python benchmarks/bench_importtime.py --repeticiones 7 --presupuesto-ms 900 --top 25
+import os
+import re
+import sys
+import argparse
+import subprocess
+import statistics
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+MODULOS_DIFERIDOS = ('pandas', 'numpy', 'reportlab', 'openpyxl', 'authlib', 'vobject', 'PIL')
+
+_RE_LINEA = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def medir(modulo):
+    """Importa `modulo` en un proceso nuevo; devuelve [(módulo, propio_us, acumulado_us, nivel)]."""
+    entorno = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+        cwd=RAIZ, env=entorno, capture_output=True, text=True
+    )
+    if proceso.returncode != 0:
+        sys.stderr.write(proceso.stderr)
+        sys.exit(f"No se pudo importar {modulo}.")
+    filas = []
+    for linea in proceso.stderr.splitlines():
+        coincidencia = _RE_LINEA.match(linea)
+        if coincidencia:
+            propio, acumulado, sangria, nombre = coincidencia.groups()
+            filas.append((nombre, int(propio), int(acumulado), len(sangria) // 2))
+    return filas
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Presupuesto de tiempo de importación')
+    parser.add_argument('--modulo', default='wsgi', help='Módulo a importar (wsgi o app)')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--presupuesto-ms', type=float, default=1200)
+    parser.add_argument('--top', type=int, default=15, help='Paquetes más lentos a mostrar')
+    args = parser.parse_args()
+
+    totales = []
+    for _ in range(args.repeticiones):
+        filas = medir(args.modulo)
+        totales.append(next(acumulado for nombre, _, acumulado, _ in filas if nombre == args.modulo) / 1000)
+
+    # Paquetes de primer nivel (flask, sqlalchemy, models...) de la última corrida; el acumulado incluye sus dependencias
+    primer_nivel = sorted((f for f in filas if '.' not in f[0] and f[3] > 0), key=lambda f: f[2], reverse=True)
+    print(f"{'módulo':<40} {'acumulado (ms)':>15}")
+    for nombre, _, acumulado, _ in primer_nivel[:args.top]:
+        print(f"{nombre:<40} {acumulado / 1000:>15.1f}")
+
+    mediana = statistics.median(totales)
+    print(f"\nimport {args.modulo}: mediana {mediana:.0f} ms en {args.repeticiones} corridas "
+          f"(mín {min(totales):.0f}, máx {max(totales):.0f}); presupuesto {args.presupuesto_ms:.0f} ms")
+
+    cargados = sorted({nombre.split('.')[0] for nombre, _, _, _ in filas} & set(MODULOS_DIFERIDOS))
+    fallos = 0
+    if cargados:
+        print(f"FALLA: se importaron al arrancar módulos que deben cargarse al usarse: {', '.join(cargados)}")
+        fallos += 1
+    if mediana > args.presupuesto_ms:
+        print("FALLA: el tiempo de importación supera el presupuesto.")
+        fallos += 1
+    if fallos:
+        sys.exit(1)
+    print("OK")
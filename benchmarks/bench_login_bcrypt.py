@@ -0,0 +1,99 @@
+# bench_login_bcrypt.py
+# Mide el rendimiento de POST /login según el número de hilos del pool de bcrypt
+# (PASSWORD_HASH_WORKERS, ver contrasenas.py): inicios de sesión por segundo,
+# latencia p50/p95 y cuántas peticiones recibieron 503 por saturación.
+#
+# Uso (desde la raíz del proyecto):
+#   python benchmarks/bench_login_bcrypt.py
+#   python benchmarks/bench_login_bcrypt.py --workers 1 2 4 --clientes 32 --rondas 10
+#
+# Cada caso corre en un proceso hijo nuevo con su propia base SQLite temporal,
+# porque la configuración se lee de variables de entorno al importar app.py.
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, RAIZ)
+
+PASSWORD = 'caminata2025'
+
+
+def _caso(workers, clientes, rondas, costo, cola_max, cola):
+    carpeta = tempfile.mkdtemp(prefix='bench_login_')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(carpeta, 'bench.db')
+    os.environ['PASSWORD_HASH_WORKERS'] = str(workers)
+    os.environ['PASSWORD_HASH_QUEUE_MAX'] = str(cola_max)
+    os.environ['BCRYPT_LOG_ROUNDS'] = str(costo)
+    os.chdir(RAIZ)
+
+    from app import app
+    from models import db, User, bcrypt
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(
+            username='bench', email='bench@example.com', nombre='Bench', primer_apellido='Mark', telefono='0',
+            password=bcrypt.generate_password_hash(PASSWORD).decode('utf-8')
+        ))
+        db.session.commit()
+
+    latencias, codigos = [], []
+    lock = threading.Lock()
+
+    def cliente():
+        client = app.test_client()
+        for _ in range(rondas):
+            inicio = time.perf_counter()
+            r = client.post('/login', data={'username_or_email': 'bench', 'password': PASSWORD})
+            duracion = time.perf_counter() - inicio
+            with lock:
+                latencias.append(duracion)
+                codigos.append(r.status_code)
+
+    hilos = [threading.Thread(target=cliente) for _ in range(clientes)]
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    total = time.perf_counter() - inicio
+
+    latencias.sort()
+    ok = sum(1 for c in codigos if c == 302)
+    cola.put({
+        'logins_s': ok / total,
+        'p50': latencias[len(latencias) // 2],
+        'p95': latencias[int(len(latencias) * 0.95) - 1],
+        'ok': ok,
+        'rechazadas': sum(1 for c in codigos if c == 503),
+    })
+
+
+def medir(workers, clientes, rondas, costo, cola_max):
+    cola = multiprocessing.Queue()
+    proceso = multiprocessing.Process(target=_caso, args=(workers, clientes, rondas, costo, cola_max, cola))
+    proceso.start()
+    resultado = cola.get()
+    proceso.join()
+    return resultado
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--clientes', type=int, default=16, help='Hilos que inician sesión a la vez')
+    parser.add_argument('--rondas', type=int, default=5, help='Inicios de sesión por cliente')
+    parser.add_argument('--costo', type=int, default=12, help='BCRYPT_LOG_ROUNDS')
+    parser.add_argument('--cola', type=int, default=1000, help='PASSWORD_HASH_QUEUE_MAX (bájala para ver los 503)')
+    args = parser.parse_args()
+
+    print(f"CPUs: {os.cpu_count()}, clientes: {args.clientes}, rondas: {args.rondas}, costo: {args.costo}, cola: {args.cola}")
+    print(f"{'workers':>8} {'logins/s':>9} {'p50 (s)':>8} {'p95 (s)':>8} {'ok':>5} {'503':>5}")
+    for workers in args.workers:
+        r = medir(workers, args.clientes, args.rondas, args.costo, args.cola)
+        print(f"{workers:>8} {r['logins_s']:>9.1f} {r['p50']:>8.2f} {r['p95']:>8.2f} {r['ok']:>5} {r['rechazadas']:>5}")
@@ -0,0 +1,116 @@
+# bench_servidor.py
+# Prueba de carga de servidor.py: peticiones por segundo y latencias p50/p99
+# según el número de workers (procesos), para ver cómo escala con los núcleos.
+#
+# Para cada valor de --workers arranca `python servidor.py` en un puerto libre y
+# lanza --clientes procesos que piden --ruta en bucle (conexión keep-alive)
+# durante --segundos. Los clientes son procesos, no hilos, para que el GIL del
+# generador de carga no limite la medición.
+#
+# Uso (desde la raíz del proyecto):
+#   python benchmarks/bench_servidor.py
+#   python benchmarks/bench_servidor.py --workers 1 2 4 8 --threads 4 --clientes 16 --segundos 15 --ruta /login
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import http.client
+import multiprocessing
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _esperar_servidor(puerto, proceso, limite=60):
+    inicio = time.time()
+    while time.time() - inicio < limite:
+        if proceso.poll() is not None:
+            sys.exit("El servidor terminó antes de aceptar conexiones.")
+        try:
+            with socket.create_connection(('127.0.0.1', puerto), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit("El servidor no respondió a tiempo.")
+
+
+def _cliente(puerto, ruta, segundos, cola):
+    latencias, errores = [], 0
+    conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=30)
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        try:
+            conexion.request('GET', ruta)
+            respuesta = conexion.getresponse()
+            respuesta.read()
+            if respuesta.status >= 500:
+                errores += 1
+            latencias.append(time.perf_counter() - inicio)
+        except (OSError, http.client.HTTPException):
+            errores += 1
+            conexion.close()
+            conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=30)
+    conexion.close()
+    cola.put((latencias, errores))
+
+
+def medir(workers, threads, clientes, segundos, ruta):
+    puerto = _puerto_libre()
+    servidor = subprocess.Popen(
+        [sys.executable, 'servidor.py', '--workers', str(workers), '--threads', str(threads), '--port', str(puerto),
+         '--host', '127.0.0.1'],
+        cwd=RAIZ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        _esperar_servidor(puerto, servidor)
+        time.sleep(1)  # Deja que todos los workers terminen de arrancar
+
+        cola = multiprocessing.Queue()
+        procesos = [multiprocessing.Process(target=_cliente, args=(puerto, ruta, segundos, cola)) for _ in range(clientes)]
+        for p in procesos:
+            p.start()
+        resultados = [cola.get() for _ in procesos]
+        for p in procesos:
+            p.join()
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=30)
+
+    latencias = sorted(l for lat, _ in resultados for l in lat)
+    errores = sum(e for _, e in resultados)
+    if not latencias:
+        return {'req_s': 0, 'p50': 0, 'p99': 0, 'errores': errores}
+    return {
+        'req_s': len(latencias) / segundos,
+        'p50': latencias[len(latencias) // 2] * 1000,
+        'p99': latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))] * 1000,
+        'errores': errores,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prueba de carga de servidor.py')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4, help='Hilos por worker')
+    parser.add_argument('--clientes', type=int, default=8, help='Procesos que generan carga')
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--ruta', default='/login', help='Ruta a pedir (GET)')
+    args = parser.parse_args()
+
+    print(f"CPUs: {os.cpu_count()}, hilos por worker: {args.threads}, clientes: {args.clientes}, "
+          f"duración: {args.segundos:.0f} s, ruta: {args.ruta}")
+    print(f"{'workers':>8} {'req/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'errores':>8}")
+    base = None
+    for workers in args.workers:
+        r = medir(workers, args.threads, args.clientes, args.segundos, args.ruta)
+        base = base or r['req_s'] or None
+        escala = f"  x{r['req_s'] / base:.2f}" if base else ''
+        print(f"{workers:>8} {r['req_s']:>9.1f} {r['p50']:>9.1f} {r['p99']:>9.1f} {r['errores']:>8}{escala}")
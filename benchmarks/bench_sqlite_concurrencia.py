@@ -0,0 +1,145 @@
+# bench_sqlite_concurrencia.py
+# Lecturas y escrituras por segundo en SQLite con varios procesos a la vez,
+# antes y después de motor_bd.py.
+#
+#   antes:   create_engine() tal cual (lo que hacía Flask-SQLAlchemy sin
+#            SQLALCHEMY_ENGINE_OPTIONS): journal DELETE, sin PRAGMA, sin reintentos.
+#   despues: QueuePool, PRAGMA de config.py (WAL, synchronous=NORMAL,
+#            busy_timeout, cache_size, mmap_size) y escrituras con con_reintentos.
+#
+# Cada proceso (--procesos) corre --hilos hilos durante --segundos. Cada
+# operación es una lectura (suma de 50 filas) o, con probabilidad
+# --escrituras, una transacción que lee una fila y la actualiza (el patrón de
+# las vistas: consultar y luego hacer commit). Se cuentan los errores
+# "database is locked" que llegarían al usuario.
+#
+# Uso (desde la raíz del proyecto):
+#   python benchmarks/bench_sqlite_concurrencia.py
+#   python benchmarks/bench_sqlite_concurrencia.py --procesos 8 --hilos 4 --escrituras 0.2 --segundos 10
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, RAIZ)
+
+FILAS = 1000
+
+
+def _preparar(ruta):
+    import sqlite3
+    conn = sqlite3.connect(ruta)
+    conn.execute("CREATE TABLE contador (id INTEGER PRIMARY KEY, valor INTEGER NOT NULL, texto TEXT)")
+    conn.executemany("INSERT INTO contador (id, valor, texto) VALUES (?, 0, '')", [(i,) for i in range(1, FILAS + 1)])
+    conn.commit()
+    conn.close()
+
+
+def _proceso(url, modo, hilos, segundos, escrituras, cola):
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.pool import QueuePool
+    from config import Config
+    from motor_bd import aplicar_pragmas, pragmas_sqlite, con_reintentos, es_error_de_bloqueo
+
+    if modo == 'despues':
+        engine = create_engine(url, poolclass=QueuePool, pool_size=hilos, max_overflow=0,
+                               connect_args={'check_same_thread': False})
+        config = {k: getattr(Config, k) for k in dir(Config) if k.startswith('SQLITE_')}
+        aplicar_pragmas(engine, pragmas_sqlite(config))
+    else:
+        engine = create_engine(url)
+
+    resultados = {'lecturas': 0, 'escrituras': 0, 'errores': 0, 'latencias_escritura': []}
+    lock = threading.Lock()
+
+    def escribir(clave):
+        with engine.begin() as conn:
+            valor = conn.execute(text("SELECT valor FROM contador WHERE id = :id"), {'id': clave}).scalar()
+            conn.execute(text("UPDATE contador SET valor = :v, texto = :t WHERE id = :id"),
+                         {'v': valor + 1, 't': 'x' * 200, 'id': clave})
+
+    def leer(desde):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT SUM(valor) FROM contador WHERE id BETWEEN :a AND :b"),
+                         {'a': desde, 'b': desde + 49}).scalar()
+
+    def hilo():
+        lecturas = escrituras_ok = errores = 0
+        latencias = []
+        fin = time.perf_counter() + segundos
+        while time.perf_counter() < fin:
+            if random.random() < escrituras:
+                inicio = time.perf_counter()
+                try:
+                    if modo == 'despues':
+                        con_reintentos(escribir, random.randint(1, FILAS))
+                    else:
+                        escribir(random.randint(1, FILAS))
+                    escrituras_ok += 1
+                    latencias.append(time.perf_counter() - inicio)
+                except OperationalError as e:
+                    if not es_error_de_bloqueo(e):
+                        raise
+                    errores += 1
+            else:
+                leer(random.randint(1, FILAS - 50))
+                lecturas += 1
+        with lock:
+            resultados['lecturas'] += lecturas
+            resultados['escrituras'] += escrituras_ok
+            resultados['errores'] += errores
+            resultados['latencias_escritura'].extend(latencias)
+
+    hilos_lista = [threading.Thread(target=hilo) for _ in range(hilos)]
+    for h in hilos_lista:
+        h.start()
+    for h in hilos_lista:
+        h.join()
+    engine.dispose()
+    cola.put(resultados)
+
+
+def medir(modo, procesos, hilos, segundos, escrituras):
+    carpeta = tempfile.mkdtemp(prefix='bench_sqlite_')
+    ruta = os.path.join(carpeta, 'bench.db')
+    _preparar(ruta)
+    url = 'sqlite:///' + ruta
+
+    cola = multiprocessing.Queue()
+    lista = [multiprocessing.Process(target=_proceso, args=(url, modo, hilos, segundos, escrituras, cola))
+             for _ in range(procesos)]
+    for p in lista:
+        p.start()
+    parciales = [cola.get() for _ in lista]
+    for p in lista:
+        p.join()
+
+    latencias = sorted(l for r in parciales for l in r['latencias_escritura'])
+    return {
+        'lecturas_s': sum(r['lecturas'] for r in parciales) / segundos,
+        'escrituras_s': sum(r['escrituras'] for r in parciales) / segundos,
+        'errores': sum(r['errores'] for r in parciales),
+        'p99_escritura_ms': latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))] * 1000 if latencias else 0,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Concurrencia de SQLite antes y después de motor_bd.py')
+    parser.add_argument('--procesos', type=int, default=4)
+    parser.add_argument('--hilos', type=int, default=4, help='Hilos por proceso')
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--escrituras', type=float, default=0.2, help='Proporción de operaciones que escriben')
+    args = parser.parse_args()
+
+    print(f"CPUs: {os.cpu_count()}, procesos: {args.procesos}, hilos: {args.hilos}, "
+          f"escrituras: {args.escrituras:.0%}, duración: {args.segundos:.0f} s")
+    print(f"{'modo':>8} {'lecturas/s':>11} {'escrituras/s':>13} {'p99 escr. (ms)':>15} {'locked':>7}")
+    for modo in ('antes', 'despues'):
+        r = medir(modo, args.procesos, args.hilos, args.segundos, args.escrituras)
+        print(f"{modo:>8} {r['lecturas_s']:>11.0f} {r['escrituras_s']:>13.0f} {r['p99_escritura_ms']:>15.1f} {r['errores']:>7}")
@@ -0,0 +1,152 @@
+# busqueda.py
+# Búsqueda de texto completo sobre los contactos (tabla User).
+#
+# En SQLite se mantiene una tabla virtual FTS5 ('user_fts') que refleja las
+# columnas buscables de 'user'. Los triggers de la propia base de datos la
+# mantienen sincronizada, así que cualquier escritura (ORM, migraciones, consola)
+# actualiza el índice. El tokenizador 'unicode61 remove_diacritics 2' hace que
+# "Pérez" coincida con "perez", y cada término se busca como prefijo.
+#
+# Con otros motores (DATABASE_URL de MySQL/PostgreSQL) o si SQLite no trae FTS5,
+# se vuelve al filtro clásico con ILIKE sobre las mismas columnas.
+import re
+import threading
+
+from sqlalchemy import or_, text
+
+from models import db, User
+
+FTS_TABLE = 'user_fts'
+
+# Columnas de User que se indexan, en el orden de la tabla virtual
+COLUMNAS_BUSQUEDA = (
+    'username', 'nombre', 'primer_apellido', 'segundo_apellido',
+    'telefono', 'email', 'cedula',
+)
+
+_fts_estado = {}  # URL del engine -> True/False (FTS5 disponible y creado)
+_fts_lock = threading.Lock()
+
+
+def _ddl_fts():
+    """Sentencias idempotentes que crean la tabla FTS5 y sus triggers de sincronización."""
+    columnas = ', '.join(COLUMNAS_BUSQUEDA)
+    nuevas = ', '.join(f'new.{c}' for c in COLUMNAS_BUSQUEDA)
+    viejas = ', '.join(f'old.{c}' for c in COLUMNAS_BUSQUEDA)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{columnas}, content='user', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON user BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, {columnas}) VALUES (new.id, {nuevas}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON user BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columnas}) VALUES ('delete', old.id, {viejas}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {columnas} ON user BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columnas}) VALUES ('delete', old.id, {viejas}); "
+        f"INSERT INTO {FTS_TABLE}(rowid, {columnas}) VALUES (new.id, {nuevas}); END",
+    ]
+
+
+def asegurar_indice_fts(engine=None):
+    """
+    Crea (si hace falta) la tabla FTS5 y sus triggers y la reconstruye la primera vez.
+    Devuelve True si la búsqueda FTS5 está disponible para este engine.
+    El resultado se recuerda por proceso, así que solo cuesta en la primera búsqueda.
+    """
+    engine = engine or db.engine
+    clave = str(engine.url)
+    if clave in _fts_estado:
+        return _fts_estado[clave]
+
+    with _fts_lock:
+        if clave in _fts_estado:
+            return _fts_estado[clave]
+
+        disponible = False
+        if engine.dialect.name == 'sqlite':
+            existe_user = None
+            try:
+                with engine.begin() as conn:
+                    existe_user = conn.execute(text(
+                        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='user'"
+                    )).first()
+                    if existe_user:
+                        existia = conn.execute(text(
+                            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"
+                        ), {'name': FTS_TABLE}).first()
+                        for sentencia in _ddl_fts():
+                            conn.execute(text(sentencia))
+                        if not existia:
+                            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+                        disponible = True
+            except Exception as e:
+                # Por ejemplo, un SQLite compilado sin FTS5
+                print(f"DEBUG: Búsqueda FTS5 no disponible, se usará ILIKE: {e}")
+                disponible = False
+            if not disponible and existe_user is None:
+                # La tabla 'user' aún no existe (antes de migrar) o falló la consulta:
+                # reintentar en la próxima búsqueda
+                return False
+
+        _fts_estado[clave] = disponible
+        return disponible
+
+
+def reconstruir_indice_fts():
+    """Reconstruye por completo el índice FTS5 a partir de la tabla 'user'."""
+    if asegurar_indice_fts():
+        with db.engine.begin() as conn:
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def construir_consulta_fts(search_query, columnas=None):
+    """
+    Convierte el texto del usuario en una expresión MATCH de FTS5.
+    Cada palabra se busca como prefijo ("per" encuentra "Pérez") y todas deben aparecer.
+    Devuelve None si no queda ningún término útil.
+    """
+    terminos = [t for t in re.split(r'[^\w]+', search_query or '', flags=re.UNICODE) if t]
+    if not terminos:
+        return None
+    expresion = ' '.join('"{}"*'.format(t.replace('"', '""')) for t in terminos)
+    if columnas:
+        expresion = '{%s} : (%s)' % (' '.join(columnas), expresion)
+    return expresion
+
+
+def filtro_busqueda_usuarios(search_query, columnas=COLUMNAS_BUSQUEDA):
+    """
+    Devuelve una condición de SQLAlchemy para filtrar User por el texto buscado,
+    o None si no hay nada que filtrar.
+
+    Usa el índice FTS5 cuando está disponible y, si no, un OR de ILIKE sobre las columnas.
+    """
+    search_query = (search_query or '').strip()
+    if not search_query:
+        return None
+
+    if asegurar_indice_fts():
+        expresion = construir_consulta_fts(
+            search_query,
+            columnas if tuple(columnas) != COLUMNAS_BUSQUEDA else None
+        )
+        if expresion is None:
+            return None
+        subconsulta = text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_query") \
+            .bindparams(fts_query=expresion) \
+            .columns(rowid=db.Integer)
+        return User.id.in_(subconsulta.scalar_subquery())
+
+    # Alternativa para motores sin FTS5
+    search_pattern = f"%{search_query}%"
+    return or_(*[getattr(User, columna).ilike(search_pattern) for columna in columnas])
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """
+    Filtro para Alembic: ignora la tabla FTS5 y sus tablas internas al autogenerar
+    migraciones, ya que no forman parte de los modelos.
+    """
+    if type_ == 'table' and name and name.startswith(FTS_TABLE):
+        return False
+    return True
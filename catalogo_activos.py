@@ -0,0 +1,391 @@
+# catalogo_activos.py
+# Catálogo persistente de los archivos de las carpetas de subida.
+#
+# files.get_all_app_assets recorría con os.walk las carpetas de subida en cada
+# petición a ver_files, llamaba a mimetypes.guess_type y os.path.getmtime por
+# archivo y generaba un uuid4 nuevo por activo (los ids cambiaban en cada
+# carga). Ahora los activos están en la tabla activos_app:
+#
+#   - escanear_activos() recorre las carpetas con os.scandir y solo vuelve a
+#     listar los directorios cuyo mtime cambió desde el último escaneo (tabla
+#     activos_directorios). En un directorio que cambió, solo se lee el
+#     contenido de los archivos nuevos o con otro tamaño/mtime.
+#   - Cada activo guarda tamaño, tipo MIME, categoría, fecha de modificación,
+#     SHA-256 del contenido y una clave estable derivada de la ruta y del
+#     contenido.
+#   - consultar_activos() filtra por nombre, categoría y fecha en SQL.
+#
+# Sobrescribir un archivo sin crear ni borrar otros no cambia el mtime del
+# directorio: eso lo detecta `flask escanear-activos --completo`.
+#
+# Con el vigilante en marcha (vigilante_activos.py) el catálogo se mantiene al
+# día con los eventos del sistema de archivos (aplicar_eventos) y las
+# peticiones ya no escanean.
+import os
+import time
+import hashlib
+import mimetypes
+import threading
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, insert, or_, select, update
+
+from models import db, ActivoApp, DirectorioActivos
+from motor_bd import con_reintentos
+
+# Nombre que se muestra en la vista -> clave de configuración de la carpeta.
+# La carpeta 'files' la gestiona el modelo File y no se cataloga aquí.
+CARPETAS_ACTIVOS = {
+    'avatars': 'UPLOAD_FOLDER',
+    'project_images': 'PROJECT_IMAGE_UPLOAD_FOLDER',
+    'note_images': 'NOTE_IMAGE_UPLOAD_FOLDER',
+    'caminata_images': 'CAMINATA_IMAGE_UPLOAD_FOLDER',
+    'pagos_images': 'PAGOS_IMAGE_UPLOAD_FOLDER',
+    'calendar_images': 'CALENDAR_IMAGE_UPLOAD_FOLDER',
+    'songs': 'SONGS_UPLOAD_FOLDER',
+    'covers': 'COVERS_UPLOAD_FOLDER',
+    'aboutus_images': 'ABOUTUS_IMAGE_UPLOAD_FOLDER',
+    'maps': 'MAP_FILES_UPLOAD_FOLDER',
+    'playlist_covers': 'PLAYLIST_COVER_UPLOAD_FOLDER',
+}
+
+TAMANO_BLOQUE = 1024 * 1024
+
+_ultimo_escaneo = 0.0
+_escaneo_lock = threading.Lock()
+
+
+# Función auxiliar para determinar el tipo de archivo para categorización
+def get_file_category(mime_type):
+    if mime_type.startswith('image/'):
+        return 'image'
+    elif mime_type.startswith('audio/'):
+        return 'audio'
+    elif mime_type.startswith('video/'):
+        return 'video'
+    elif mime_type.startswith('application/pdf') or \
+         mime_type == 'text/plain' or \
+         mime_type.startswith('application/msword') or \
+         mime_type.startswith('application/vnd.openxmlformats-officedocument.wordprocessingml') or \
+         mime_type.startswith('application/vnd.ms-excel') or \
+         mime_type.startswith('application/vnd.oasis.opendocument.spreadsheet') or \
+         mime_type.startswith('application/xml') or \
+         mime_type.startswith('text/xml'):
+        return 'document'
+    elif mime_type in ['application/gpx+xml', 'application/vnd.google-earth.kml+xml', 'application/vnd.google-earth.kmz']:
+        return 'map'
+    elif mime_type.startswith('image/x-icon') or mime_type.startswith('image/vnd.microsoft.icon'): # .ico, .icon
+        return 'icon'
+    else:
+        return 'other'
+
+
+def hash_contenido(ruta):
+    """SHA-256 del archivo, leído por bloques."""
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(TAMANO_BLOQUE), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def clave_activo(ruta, hash_hex):
+    """Id estable del activo: no cambia entre escaneos mientras la ruta y el contenido sean los mismos."""
+    return hashlib.blake2b(f"{ruta}\0{hash_hex}".encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _relativa(ruta_absoluta, raiz_static):
+    return os.path.relpath(ruta_absoluta, raiz_static).replace('\\', '/')
+
+
+def _datos_archivo(ruta_absoluta, ruta, directorio, carpeta, stat):
+    mime_type, _ = mimetypes.guess_type(ruta_absoluta)
+    mime_type = mime_type or 'application/octet-stream'
+    contenido = hash_contenido(ruta_absoluta)
+    return {
+        'clave': clave_activo(ruta, contenido),
+        'ruta': ruta,
+        'directorio': directorio,
+        'carpeta': carpeta,
+        'nombre': os.path.basename(ruta),
+        'tamano': stat.st_size,
+        'mime_type': mime_type,
+        'categoria': get_file_category(mime_type),
+        'modificado': datetime.fromtimestamp(stat.st_mtime),
+        'mtime_ns': stat.st_mtime_ns,
+        'hash_contenido': contenido,
+    }
+
+
+def _cambios_directorio(ruta_absoluta, directorio, carpeta, cambios):
+    """Lista un directorio con os.scandir; añade a `cambios` lo que difiere del catálogo y devuelve sus subdirectorios."""
+    subdirectorios, archivos = [], {}
+    with os.scandir(ruta_absoluta) as entradas:
+        for entrada in entradas:
+            if entrada.is_dir(follow_symlinks=False):
+                subdirectorios.append(entrada.path)
+            elif entrada.is_file():
+                archivos[entrada.name] = entrada
+
+    catalogados = {
+        fila.nombre: fila for fila in db.session.execute(
+            select(ActivoApp.id, ActivoApp.nombre, ActivoApp.tamano, ActivoApp.mtime_ns)
+            .where(ActivoApp.directorio == directorio)
+        )
+    }
+    for nombre, entrada in archivos.items():
+        try:
+            stat = entrada.stat()
+            fila = catalogados.pop(nombre, None)
+            if fila is not None and fila.tamano == stat.st_size and fila.mtime_ns == stat.st_mtime_ns:
+                continue
+            ruta = f"{directorio}/{nombre}"
+            datos = _datos_archivo(entrada.path, ruta, directorio, carpeta, stat)
+        except FileNotFoundError:
+            continue # Se borró mientras se escaneaba; lo recoge el próximo escaneo
+        if fila is None:
+            cambios['nuevos'].append(datos)
+        else:
+            datos['id'] = fila.id
+            cambios['actualizados'].append(datos)
+    cambios['eliminados'].extend(fila.id for fila in catalogados.values())
+    return subdirectorios
+
+
+def _aplicar_cambios(cambios):
+    """Escribe en el catálogo lo calculado por escanear_activos (una transacción). Devuelve los activos eliminados."""
+    eliminados = 0
+    if cambios['eliminados']:
+        eliminados += db.session.execute(delete(ActivoApp).where(ActivoApp.id.in_(cambios['eliminados']))).rowcount
+    for directorio in cambios['directorios_borrados']: # Con todo lo que cuelga de él
+        eliminados += db.session.execute(delete(ActivoApp).where(or_(
+            ActivoApp.directorio == directorio, ActivoApp.directorio.startswith(directorio + '/', autoescape=True)
+        ))).rowcount
+        db.session.execute(delete(DirectorioActivos).where(or_(
+            DirectorioActivos.ruta == directorio, DirectorioActivos.ruta.startswith(directorio + '/', autoescape=True)
+        )))
+    if cambios['actualizados']:
+        db.session.execute(update(ActivoApp), cambios['actualizados'])
+    if cambios['nuevos']:
+        db.session.execute(insert(ActivoApp), cambios['nuevos'])
+    for ruta, (carpeta, mtime_ns) in cambios['directorios'].items():
+        db.session.merge(DirectorioActivos(ruta=ruta, carpeta=carpeta, mtime_ns=mtime_ns, escaneado=datetime.utcnow()))
+    db.session.commit()
+    return eliminados
+
+
+def raices_activos():
+    """Lista de (carpeta, ruta absoluta) de las carpetas de CARPETAS_ACTIVOS que existen."""
+    raices = []
+    for carpeta, clave_config in CARPETAS_ACTIVOS.items():
+        raiz = current_app.config.get(clave_config)
+        if raiz and os.path.isdir(raiz):
+            raices.append((carpeta, os.path.abspath(raiz)))
+    return raices
+
+
+def _carpeta_de(ruta_absoluta, raices):
+    for carpeta, raiz in raices:
+        if ruta_absoluta == raiz or ruta_absoluta.startswith(raiz + os.sep):
+            return carpeta
+    return None
+
+
+def aplicar_eventos(actualizar=(), eliminar=(), renombrados=(), directorios_eliminados=()):
+    """
+    Aplica al catálogo, en una transacción, un lote de cambios vistos por el
+    vigilante (rutas absolutas). `renombrados` son pares (antes, después): si el
+    archivo no cambió de tamaño ni de mtime se conserva su hash sin volver a
+    leerlo. Devuelve un resumen como el de escanear_activos.
+    """
+    raiz_static = current_app.static_folder
+    raices = raices_activos()
+    relativa = lambda ruta: _relativa(ruta, raiz_static)
+
+    rutas = {relativa(r) for r in (*actualizar, *eliminar)}
+    rutas.update(relativa(r) for par in renombrados for r in par)
+    filas = {}
+    if rutas:
+        filas = {fila.ruta: fila for fila in db.session.execute(
+            select(ActivoApp.id, ActivoApp.ruta, ActivoApp.tamano, ActivoApp.mtime_ns, ActivoApp.hash_contenido)
+            .where(ActivoApp.ruta.in_(rutas))
+        )}
+
+    cambios = {'nuevos': [], 'actualizados': [], 'eliminados': [], 'directorios': {},
+               'directorios_borrados': [relativa(d) for d in directorios_eliminados]}
+    resueltas = set() # Rutas de destino ya decididas en este lote
+    actualizar = set(actualizar)
+
+    for antes, despues in renombrados:
+        fila = filas.pop(relativa(antes), None)
+        carpeta = _carpeta_de(despues, raices)
+        if fila is None or carpeta is None:
+            if fila is not None:
+                cambios['eliminados'].append(fila.id) # Salió de las carpetas catalogadas
+            if carpeta is not None:
+                actualizar.add(despues) # Entró desde fuera: se cataloga como nuevo
+            continue
+        ruta = relativa(despues)
+        try:
+            stat = os.stat(despues)
+        except FileNotFoundError:
+            cambios['eliminados'].append(fila.id)
+            continue
+        destino = filas.pop(ruta, None)
+        if destino is not None:
+            cambios['eliminados'].append(destino.id) # El renombrado sobrescribió otro activo
+        directorio = ruta.rsplit('/', 1)[0]
+        if stat.st_size == fila.tamano and stat.st_mtime_ns == fila.mtime_ns:
+            datos = {'ruta': ruta, 'directorio': directorio, 'carpeta': carpeta, 'nombre': os.path.basename(ruta),
+                     'clave': clave_activo(ruta, fila.hash_contenido)}
+        else:
+            datos = _datos_archivo(despues, ruta, directorio, carpeta, stat)
+        datos['id'] = fila.id
+        cambios['actualizados'].append(datos)
+        resueltas.add(ruta)
+
+    for ruta_absoluta in eliminar:
+        ruta = relativa(ruta_absoluta)
+        fila = filas.pop(ruta, None)
+        if fila is not None and ruta not in resueltas:
+            cambios['eliminados'].append(fila.id)
+
+    for ruta_absoluta in actualizar:
+        ruta = relativa(ruta_absoluta)
+        carpeta = _carpeta_de(ruta_absoluta, raices)
+        if carpeta is None or ruta in resueltas:
+            continue
+        fila = filas.pop(ruta, None)
+        try:
+            stat = os.stat(ruta_absoluta)
+            if fila is not None and fila.tamano == stat.st_size and fila.mtime_ns == stat.st_mtime_ns:
+                continue
+            datos = _datos_archivo(ruta_absoluta, ruta, ruta.rsplit('/', 1)[0], carpeta, stat)
+        except (FileNotFoundError, IsADirectoryError):
+            if fila is not None:
+                cambios['eliminados'].append(fila.id)
+            continue
+        if fila is None:
+            cambios['nuevos'].append(datos)
+        else:
+            datos['id'] = fila.id
+            cambios['actualizados'].append(datos)
+        resueltas.add(ruta)
+
+    eliminados = 0
+    if any(cambios[k] for k in ('nuevos', 'actualizados', 'eliminados', 'directorios_borrados')):
+        eliminados = con_reintentos(_aplicar_cambios, cambios, revertir_sesion=True)
+    return {
+        'nuevos': len(cambios['nuevos']),
+        'actualizados': len(cambios['actualizados']),
+        'eliminados': eliminados,
+    }
+
+
+def escanear_activos(completo=False):
+    """
+    Actualiza el catálogo con el contenido de CARPETAS_ACTIVOS. Sin `completo`,
+    los directorios cuyo mtime no cambió no se vuelven a listar. Devuelve un
+    resumen con el número de directorios vistos y listados y de activos nuevos,
+    actualizados y eliminados.
+    """
+    raiz_static = current_app.static_folder
+    conocidos = {d.ruta: d.mtime_ns for d in db.session.execute(select(DirectorioActivos)).scalars()}
+    hijos = {}
+    for ruta in conocidos:
+        hijos.setdefault(ruta.rsplit('/', 1)[0], []).append(ruta)
+
+    cambios = {'nuevos': [], 'actualizados': [], 'eliminados': [], 'directorios': {}, 'directorios_borrados': []}
+    vistos, listados = set(), 0
+    for carpeta, raiz in raices_activos():
+        pendientes = [raiz]
+        while pendientes:
+            ruta_absoluta = pendientes.pop()
+            directorio = _relativa(ruta_absoluta, raiz_static)
+            if directorio in vistos:
+                continue # Dos claves de configuración con la misma carpeta
+            try:
+                mtime_ns = os.stat(ruta_absoluta).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            vistos.add(directorio)
+            if not completo and conocidos.get(directorio) == mtime_ns:
+                pendientes.extend(os.path.join(raiz_static, *h.split('/')) for h in hijos.get(directorio, ()))
+                continue
+            listados += 1
+            pendientes.extend(_cambios_directorio(ruta_absoluta, directorio, carpeta, cambios))
+            cambios['directorios'][directorio] = (carpeta, mtime_ns)
+
+    cambios['directorios_borrados'] = [ruta for ruta in conocidos if ruta not in vistos]
+    eliminados = 0
+    if any(cambios[k] for k in ('nuevos', 'actualizados', 'eliminados', 'directorios', 'directorios_borrados')):
+        eliminados = con_reintentos(_aplicar_cambios, cambios, revertir_sesion=True)
+    return {
+        'directorios': len(vistos),
+        'listados': listados,
+        'nuevos': len(cambios['nuevos']),
+        'actualizados': len(cambios['actualizados']),
+        'eliminados': eliminados,
+    }
+
+
+def escanear_si_hace_falta():
+    """
+    Escanea si pasaron ASSETS_SCAN_INTERVAL_SECONDS desde el último escaneo de este
+    proceso, salvo que el vigilante esté en marcha (ASSETS_WATCHER_ACTIVE).
+    """
+    global _ultimo_escaneo
+    if current_app.config.get('ASSETS_WATCHER_ACTIVE'):
+        return None # El vigilante mantiene el catálogo al día
+    intervalo = current_app.config.get('ASSETS_SCAN_INTERVAL_SECONDS', 30)
+    if time.monotonic() - _ultimo_escaneo < intervalo:
+        return None
+    if not _escaneo_lock.acquire(blocking=False):
+        return None # Otro hilo ya está escaneando; se usa el catálogo tal como está
+    try:
+        resumen = escanear_activos()
+        _ultimo_escaneo = time.monotonic()
+        return resumen
+    finally:
+        _escaneo_lock.release()
+
+
+def consultar_activos(busqueda='', categoria='', fecha=None):
+    """Activos del catálogo como diccionarios con la forma de los archivos del modelo File, filtrados en SQL."""
+    consulta = select(ActivoApp).order_by(ActivoApp.modificado.desc())
+    if busqueda:
+        consulta = consulta.where(ActivoApp.nombre.ilike(f'%{busqueda}%'))
+    if categoria:
+        consulta = consulta.where(ActivoApp.categoria == categoria)
+    if fecha:
+        consulta = consulta.where(func.date(ActivoApp.modificado) == fecha.isoformat())
+    return [{
+        'id': f"app_asset_{activo.clave}",
+        'original_filename': activo.nombre,
+        'unique_filename': activo.nombre,
+        'file_path': activo.ruta,
+        'file_type': activo.categoria,
+        'mime_type': activo.mime_type,
+        'size': activo.tamano,
+        'upload_date': activo.modificado,
+        'user_id': None,
+        'is_visible': True,
+        'is_used': True,
+        'is_app_asset': True,
+        'folder_name': activo.carpeta,
+    } for activo in db.session.execute(consulta).scalars()]
+
+
+@click.command('escanear-activos')
+@click.option('--completo', is_flag=True, help='Vuelve a listar todos los directorios aunque su mtime no haya cambiado.')
+@with_appcontext
+def escanear_activos_command(completo):
+    """Actualiza el catálogo de archivos de las carpetas de subida."""
+    inicio = time.perf_counter()
+    resumen = escanear_activos(completo=completo)
+    print(f"Directorios: {resumen['directorios']} ({resumen['listados']} listados), "
+          f"nuevos: {resumen['nuevos']}, actualizados: {resumen['actualizados']}, "
+          f"eliminados: {resumen['eliminados']} en {(time.perf_counter() - inicio) * 1000:.0f} ms")
@@ -11,6 +11,23 @@ class Config:
         'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'db.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # SQLite en producción (motor_bd.py): PRAGMA en cada conexión, pool y reintentos de escritura
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL') # Vacío para no cambiarlo
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)) # Espera por el bloqueo antes de "database is locked"
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 20000)) # Por conexión
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_WRITE_RETRIES = int(os.environ.get('DB_WRITE_RETRIES', 5))
+    DB_WRITE_BACKOFF_MS = int(os.environ.get('DB_WRITE_BACKOFF_MS', 50)) # Espera inicial; se duplica en cada reintento
+
+    # Lecturas de las peticiones GET en un engine aparte (lecturas_bd.py)
+    DB_READ_ROUTING = os.environ.get('DB_READ_ROUTING', 'true').lower() in ['true', 'on', '1']
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL') # Sin definir: en SQLite, el mismo archivo con mode=ro
+    DB_READ_YOUR_WRITES_SECONDS = int(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', 5)) # Tras escribir, el usuario lee del principal
+
     # Configuración para subida de archivos
     UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static', 'uploads', 'avatars')
     PROJECT_IMAGE_UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static', 'uploads', 'projects')
@@ -25,6 +42,74 @@ class Config:
     COVERS_UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static', 'uploads', 'covers')
     ABOUTUS_IMAGE_UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static', 'uploads', 'aboutus')
     UPLOAD_FILES_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static', 'uploads', 'files')
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH_MB', 32)) * 1024 * 1024 # Cuerpo máximo por petición; lo más grande va por subidas.py
+    UPLOAD_CHUNK_MAX_MB = int(os.environ.get('UPLOAD_CHUNK_MAX_MB', 8)) # Parte máxima de una subida por partes (menor que MAX_CONTENT_LENGTH)
+    UPLOAD_MAX_VIDEO_MB = int(os.environ.get('UPLOAD_MAX_VIDEO_MB', 2048)) # Tamaño máximo por tipo de archivo
+    UPLOAD_MAX_AUDIO_MB = int(os.environ.get('UPLOAD_MAX_AUDIO_MB', 200))
+    UPLOAD_MAX_MAP_MB = int(os.environ.get('UPLOAD_MAX_MAP_MB', 100))
+    UPLOAD_MAX_OTHER_MB = int(os.environ.get('UPLOAD_MAX_OTHER_MB', 50))
+    UPLOAD_USER_QUOTA_MB = int(os.environ.get('UPLOAD_USER_QUOTA_MB', 5120)) # Por usuario: subidas completas y en curso (0 = sin límite)
+    UPLOAD_SESSION_TTL_HOURS = int(os.environ.get('UPLOAD_SESSION_TTL_HOURS', 48)) # Subidas sin actividad que se descartan
+    MEDIA_CACHE_SECONDS = int(os.environ.get('MEDIA_CACHE_SECONDS', 3600)) # /medios: caché de los archivos que pueden cambiar (los <sha256>.ext se cachean un año)
+    MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '') # '', 'x-sendfile' (Apache, lighttpd) o 'x-accel' (nginx): el proxy envía los bytes
+    MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/_static') # location interna de nginx que apunta a static/
+    ASSETS_SCAN_INTERVAL_SECONDS = int(os.environ.get('ASSETS_SCAN_INTERVAL_SECONDS', 30)) # Catálogo de activos (catalogo_activos.py): escaneo como mucho cada N s por proceso
+    ASSETS_WATCHER = os.environ.get('ASSETS_WATCHER', 'true').lower() in ['true', 'on', '1'] # servidor.py arranca el vigilante (vigilante_activos.py)
+    ASSETS_WATCHER_BATCH_MS = int(os.environ.get('ASSETS_WATCHER_BATCH_MS', 250)) # Silencio tras el último evento antes de aplicar el lote
+    ASSETS_WATCHER_BATCH_MAX = int(os.environ.get('ASSETS_WATCHER_BATCH_MAX', 200)) # Rutas por transacción
+    ASSETS_WATCHER_POLL_SECONDS = int(os.environ.get('ASSETS_WATCHER_POLL_SECONDS', 10)) # Sondeo si no hay inotify
+
+    # Paginación de la lista de contactos (keyset sobre nombre + id)
+    CONTACTOS_PAGE_SIZE = int(os.environ.get('CONTACTOS_PAGE_SIZE', 25))
+    CONTACTOS_PAGE_SIZE_MAX = int(os.environ.get('CONTACTOS_PAGE_SIZE_MAX', 100))
+    # Segundos que se reutiliza el COUNT(*) de contactos antes de volver a calcularlo
+    CONTACTOS_COUNT_CACHE_TTL = int(os.environ.get('CONTACTOS_COUNT_CACHE_TTL', 60))
+    CONTACTOS_COUNT_CACHE_MAX = int(os.environ.get('CONTACTOS_COUNT_CACHE_MAX', 256)) # Términos de búsqueda distintos en la caché
+
+    # Exportación masiva de vCards en streaming
+    VCARD_EXPORT_BATCH_SIZE = int(os.environ.get('VCARD_EXPORT_BATCH_SIZE', 200))
+    VCARD_EXPORT_CHUNK_BYTES = int(os.environ.get('VCARD_EXPORT_CHUNK_BYTES', 64 * 1024))
+    # Lote de usuarios que se leen por vez en la exportación a Excel
+    XLSX_EXPORT_BATCH_SIZE = int(os.environ.get('XLSX_EXPORT_BATCH_SIZE', 500))
+
+    # Trabajos de exportación en segundo plano (trabajos.py)
+    EXPORT_JOB_WORKERS = int(os.environ.get('EXPORT_JOB_WORKERS', 2))
+    EXPORT_JOB_TTL_MINUTES = int(os.environ.get('EXPORT_JOB_TTL_MINUTES', 60)) # Vida de los archivos generados
+    EXPORT_JOB_CLEANUP_SECONDS = int(os.environ.get('EXPORT_JOB_CLEANUP_SECONDS', 300))
+
+    # Hilos que generan las miniaturas de los avatares (avatares.py)
+    AVATAR_THUMBNAIL_WORKERS = int(os.environ.get('AVATAR_THUMBNAIL_WORKERS', 2))
+
+    # Contraseñas (contrasenas.py): costo de bcrypt y pool dedicado con control de admisión
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+    PASSWORD_HASH_QUEUE_MAX = int(os.environ.get('PASSWORD_HASH_QUEUE_MAX', 16)) # Operaciones en espera antes de responder 503
+    PASSWORD_HASH_TIMEOUT_SECONDS = float(os.environ.get('PASSWORD_HASH_TIMEOUT_SECONDS', 5))
+    PASSWORD_HASH_RETRY_AFTER = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER', 2)) # Segundos sugeridos en Retry-After
+
+    # Sesiones en el servidor (sesiones.py): 'servidor' o 'cookie' (cookies firmadas de Flask)
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'servidor')
+    SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL') # Si se define, se usa Redis en vez de la tabla 'sesiones'
+    SESSION_SERVER_TTL_SECONDS = int(os.environ.get('SESSION_SERVER_TTL_SECONDS', 86400)) # Vida de las sesiones no permanentes
+    SESSION_CACHE_MAX_ENTRIES = int(os.environ.get('SESSION_CACHE_MAX_ENTRIES', 1000))
+    SESSION_CACHE_TTL_SECONDS = int(os.environ.get('SESSION_CACHE_TTL_SECONDS', 5))
+    SESSION_SWEEP_SECONDS = int(os.environ.get('SESSION_SWEEP_SECONDS', 600))
+
+    # Métricas de rendimiento por petición (rendimiento.py, página /admin/perf)
+    PERF_ENABLED = os.environ.get('PERF_ENABLED', 'true').lower() in ['true', 'on', '1']
+    PERF_RING_SIZE = int(os.environ.get('PERF_RING_SIZE', 5000)) # Peticiones recientes en memoria
+    PERF_SLOW_MS = int(os.environ.get('PERF_SLOW_MS', 500)) # A partir de aquí se registra en el log
+    PERF_PROFILE = os.environ.get('PERF_PROFILE', '') # '', 'cprofile' o 'pyinstrument'
+    PERF_PROFILE_THRESHOLD_MS = int(os.environ.get('PERF_PROFILE_THRESHOLD_MS', 1000)) # Solo se guardan perfiles más lentos
+    PERF_PROFILE_MAX = int(os.environ.get('PERF_PROFILE_MAX', 20))
+
+    # Servidor prefork de producción (servidor.py)
+    SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+    SERVER_PORT = int(os.environ.get('SERVER_PORT', 3030))
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', os.cpu_count() or 2)) # Procesos
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 4)) # Hilos por proceso
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', 0)) # Recicla el worker tras N peticiones (0 = nunca)
+    SERVER_PRELOAD_EXPORTS = os.environ.get('SERVER_PRELOAD_EXPORTS', 'true').lower() in ['true', 'on', '1'] # Carga pandas/reportlab/... en el maestro
 
 
     # Configuración de Flask-Mail para recuperación de contraseña
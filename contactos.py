@@ -1,16 +1,26 @@
 # Modified contactos.py
-from flask import Blueprint, render_template, session, redirect, url_for, flash, current_app, request, send_file
+from flask import Blueprint, render_template, session, redirect, url_for, flash, current_app, request, send_file, jsonify, Response, stream_with_context
 from models import db, User 
+from busqueda import filtro_busqueda_usuarios
 from datetime import datetime
-from werkzeug.utils import secure_filename
 import os
 import io
-from sqlalchemy import or_ 
+import json
+import time
+import base64
+import threading
+from collections import OrderedDict
+from sqlalchemy import or_, and_, event
 from functools import wraps 
 
-# Librerías para exportación
-import vobject
-import openpyxl
+# Librerías para exportación (openpyxl se importa dentro de exportar_excel)
+from vcards import vcard_bytes
+from roles import RolInvarianteError, aplicar_cambios_de_rol
+from avatares import encolar_miniaturas, es_avatar_por_defecto
+from almacen_blobs import guardar_subida, liberar
+from sesiones import actualizar_sesiones_de_usuario, cerrar_sesiones_de_usuario
+from trabajos import encolar_trabajo, quiere_trabajo_en_segundo_plano
+from exportacion_xlsx import parse_columnas, enviar_usuarios_xlsx
 
 AVATAR_UPLOAD_FOLDER_RELATIVE = os.path.join('uploads', 'avatars')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
@@ -51,47 +61,194 @@ def role_required(roles):
     return decorator
 
 
+# --- PAGINACIÓN KEYSET (SEEK) DE CONTACTOS ---
+# La lista se ordena por (nombre, id) y cada página se pide a partir de un cursor
+# opaco con los valores de la última (o primera) fila visible. Así la consulta
+# usa siempre LIMIT sin OFFSET y el costo no crece con el número de miembros.
+
+def encode_cursor(user):
+    """Codifica el par (nombre, id) de un usuario como cursor opaco para la URL."""
+    payload = json.dumps([user.nombre, user.id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decodifica un cursor generado por encode_cursor.
+    Devuelve una tupla (nombre, id) o None si el cursor es inválido.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        nombre, user_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        return str(nombre), int(user_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def get_page_size():
+    """Tamaño de página pedido por el cliente (?limit=), acotado por la configuración."""
+    default_size = current_app.config.get('CONTACTOS_PAGE_SIZE', 25)
+    max_size = current_app.config.get('CONTACTOS_PAGE_SIZE_MAX', 100)
+    try:
+        page_size = int(request.args.get('limit', default_size))
+    except (TypeError, ValueError):
+        page_size = default_size
+    return max(1, min(page_size, max_size))
+
+
+def filtrar_contactos(query, search_query):
+    """
+    Aplica el filtro de búsqueda de la lista de contactos a una consulta de User.
+    Busca en username, nombre, apellidos, teléfono, email y cédula (ver busqueda.py).
+    """
+    condicion = filtro_busqueda_usuarios(search_query)
+    if condicion is not None:
+        query = query.filter(condicion)
+    return query
+
+
+def paginar_contactos(query, after=None, before=None, page_size=25):
+    """
+    Devuelve una página de usuarios ordenada por (nombre, id) usando keyset pagination.
+
+    - after: cursor (nombre, id) de la última fila de la página anterior (avanzar).
+    - before: cursor (nombre, id) de la primera fila de la página siguiente (retroceder).
+
+    Retorna (users, next_cursor, prev_cursor); los cursores son None cuando no hay más filas.
+    """
+    if before:
+        nombre, user_id = before
+        query = query.filter(or_(User.nombre < nombre, and_(User.nombre == nombre, User.id < user_id)))
+        rows = query.order_by(User.nombre.desc(), User.id.desc()).limit(page_size + 1).all()
+        has_more = len(rows) > page_size
+        users = list(reversed(rows[:page_size]))
+        prev_cursor = encode_cursor(users[0]) if has_more and users else None
+        next_cursor = encode_cursor(users[-1]) if users else None
+        return users, next_cursor, prev_cursor
+
+    if after:
+        nombre, user_id = after
+        query = query.filter(or_(User.nombre > nombre, and_(User.nombre == nombre, User.id > user_id)))
+    rows = query.order_by(User.nombre.asc(), User.id.asc()).limit(page_size + 1).all()
+    has_more = len(rows) > page_size
+    users = rows[:page_size]
+    next_cursor = encode_cursor(users[-1]) if has_more else None
+    prev_cursor = encode_cursor(users[0]) if after and users else None
+    return users, next_cursor, prev_cursor
+
+
+# Caché en memoria del total de contactos por término de búsqueda.
+# Se vacía cuando se crea o elimina un usuario en este proceso y, como red de
+# seguridad entre procesos, caduca tras CONTACTOS_COUNT_CACHE_TTL segundos.
+# Es un LRU de CONTACTOS_COUNT_CACHE_MAX términos: cada búsqueda distinta añade
+# una entrada y sin límite crecería con todo lo que se escribe en el buscador.
+_contactos_count_cache = OrderedDict()
+_contactos_count_lock = threading.Lock()
+
+
+def contar_contactos(search_query):
+    """Devuelve el número de contactos que coinciden con la búsqueda, usando la caché."""
+    ttl = current_app.config.get('CONTACTOS_COUNT_CACHE_TTL', 60)
+    now = time.monotonic()
+    with _contactos_count_lock:
+        cached = _contactos_count_cache.get(search_query)
+        if cached and now - cached[1] < ttl:
+            _contactos_count_cache.move_to_end(search_query)
+            return cached[0]
+
+    total = filtrar_contactos(db.session.query(db.func.count(User.id)), search_query).scalar()
+    max_entradas = current_app.config.get('CONTACTOS_COUNT_CACHE_MAX', 256)
+    with _contactos_count_lock:
+        _contactos_count_cache[search_query] = (total, now)
+        _contactos_count_cache.move_to_end(search_query)
+        while len(_contactos_count_cache) > max_entradas:
+            _contactos_count_cache.popitem(last=False)
+    return total
+
+
+def invalidar_conteo_contactos(*args):
+    """Vacía la caché de conteos; se usa como listener de eventos de SQLAlchemy."""
+    with _contactos_count_lock:
+        _contactos_count_cache.clear()
+
+
+event.listen(User, 'after_insert', invalidar_conteo_contactos)
+event.listen(User, 'after_delete', invalidar_conteo_contactos)
+
+
+def contacto_to_dict(user):
+    """Representación JSON mínima de un contacto para el listado con scroll infinito."""
+    return {
+        'id': user.id,
+        'username': user.username,
+        'nombre': user.nombre,
+        'primer_apellido': user.primer_apellido,
+        'segundo_apellido': user.segundo_apellido,
+        'avatar_url': url_for('static', filename=user.avatar_url if user.avatar_url else 'uploads/avatars/default.png'),
+        'detalle_url': url_for('contactos.ver_detalle', user_id=user.id),
+    }
+
+
+def obtener_pagina_contactos():
+    """Lee búsqueda, cursores y tamaño de la petición actual y devuelve la página y el total."""
+    search_query = request.args.get('search_query', '').strip()
+    page_size = get_page_size()
+    after = decode_cursor(request.args.get('after'))
+    before = None if after else decode_cursor(request.args.get('before'))
+
+    query = filtrar_contactos(User.query, search_query)
+    users, next_cursor, prev_cursor = paginar_contactos(query, after=after, before=before, page_size=page_size)
+    user_count = contar_contactos(search_query)
+    return search_query, page_size, users, next_cursor, prev_cursor, user_count
+
+
 @contactos_bp.route('/ver_contactos')
 @role_required(['Superuser', 'Administrador', 'Usuario Regular']) # Todos pueden ver contactos
 def ver_contactos():
     """
-    Muestra una lista de todos los usuarios registrados, con funcionalidad de búsqueda y vistas.
+    Muestra una página de los usuarios registrados, con funcionalidad de búsqueda y vistas.
+    La navegación entre páginas usa cursores (?after= / ?before=) sobre (nombre, id).
     Requiere que el usuario esté logueado.
     """
-    search_query = request.args.get('search_query', '').strip()
     view_mode = request.args.get('view', 'list') # Mantener 'list' como predeterminada
 
     try:
-        query = User.query
-        
-        if search_query:
-            search_pattern = f"%{search_query}%"
-            query = query.filter(
-                or_(
-                    User.username.ilike(search_pattern),
-                    User.nombre.ilike(search_pattern),
-                    User.primer_apellido.ilike(search_pattern),
-                    User.segundo_apellido.ilike(search_pattern),
-                    User.telefono.ilike(search_pattern),
-                    User.email.ilike(search_pattern),
-                    User.cedula.ilike(search_pattern)
-                    # Se pueden añadir más campos a la búsqueda si es necesario
-                )
-            )
-        
-        all_users = query.order_by(User.nombre).all()
-        user_count = len(all_users) # Contar los usuarios
+        search_query, page_size, users, next_cursor, prev_cursor, user_count = obtener_pagina_contactos()
 
         return render_template('ver_contactos.html', 
-                               users=all_users, 
+                               users=users, 
                                search_query=search_query, 
                                current_role=session.get('role'),
                                view_mode=view_mode,
-                               user_count=user_count) # Pasar el contador al template
+                               user_count=user_count, # Pasar el contador al template
+                               page_size=page_size,
+                               next_cursor=next_cursor,
+                               prev_cursor=prev_cursor)
     except Exception as e:
         flash(f'Error al cargar los contactos: {e}', 'danger')
         return redirect(url_for('home'))
 
+
+@contactos_bp.route('/api/contactos')
+@role_required(['Superuser', 'Administrador', 'Usuario Regular'])
+def api_contactos():
+    """
+    Variante JSON de ver_contactos para el scroll infinito.
+    Acepta los mismos parámetros (search_query, limit, after, before).
+    """
+    search_query, page_size, users, next_cursor, prev_cursor, user_count = obtener_pagina_contactos()
+    return jsonify({
+        'contactos': [contacto_to_dict(user) for user in users],
+        'total': user_count,
+        'limit': page_size,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+        'next_url': url_for('contactos.api_contactos', search_query=search_query or None, limit=page_size, after=next_cursor) if next_cursor else None,
+        'prev_url': url_for('contactos.api_contactos', search_query=search_query or None, limit=page_size, before=prev_cursor) if prev_cursor else None,
+    })
+
 @contactos_bp.route('/ver_detalle/<int:user_id>')
 @role_required(['Superuser', 'Administrador', 'Usuario Regular']) # Todos pueden ver el detalle
 def ver_detalle(user_id):
@@ -127,36 +284,28 @@ def eliminar_contacto(user_id):
         flash('No puedes eliminar tu propia cuenta mientras estás logueado.', 'danger')
         return redirect(url_for('contactos.ver_detalle', user_id=user_id))
 
-    # Verificar si es el último Superuser
-    if user_to_delete.role == 'Superuser':
-        superuser_count = User.query.filter_by(role='Superuser').count()
-        if superuser_count <= 1: # Si solo queda 1 Superuser (el que se intenta eliminar)
-            flash('No se puede eliminar el último Superuser. Debe haber al menos un Superuser en el sistema.', 'danger')
-            return redirect(url_for('contactos.ver_detalle', user_id=user_id))
-
-
+    # La regla de "al menos un Superuser" se aplica al eliminar (ver roles.py)
+    avatar_url = user_to_delete.avatar_url
     try:
-        # Opcional: Eliminar el archivo de avatar si no es el por defecto
-        if user_to_delete.avatar_url and 'default_avatar.png' not in user_to_delete.avatar_url:
-            file_path_check_1 = os.path.join(current_app.root_path, 'static', user_to_delete.avatar_url)
-            file_path_check_2 = os.path.join(current_app.root_path, user_to_delete.avatar_url)
-
-            if os.path.exists(file_path_check_1):
-                os.unlink(file_path_check_1)
-            elif os.path.exists(file_path_check_2):
-                os.unlink(file_path_check_2)
-            # else: archivo no encontrado o ya eliminado, no hay problema
-                
-
         db.session.delete(user_to_delete)
+        # El avatar se borra del disco tras el commit, si ningún otro usuario lo usa (almacen_blobs.py)
+        if not es_avatar_por_defecto(avatar_url):
+            liberar('UPLOAD_FOLDER', avatar_url, borrar_sin_registro=True)
         db.session.commit()
-        flash(f'El usuario "{user_to_delete.username}" ha sido eliminado exitosamente.', 'success')
-        return redirect(url_for('contactos.ver_contactos')) # Redirige a la lista de contactos
+    except RolInvarianteError as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+        return redirect(url_for('contactos.ver_detalle', user_id=user_id))
     except Exception as e:
         db.session.rollback()
         flash(f'Error al eliminar el usuario: {e}', 'danger')
         return redirect(url_for('contactos.ver_detalle', user_id=user_id))
 
+    cerrar_sesiones_de_usuario(user_id)
+
+    flash(f'El usuario "{user_to_delete.username}" ha sido eliminado exitosamente.', 'success')
+    return redirect(url_for('contactos.ver_contactos')) # Redirige a la lista de contactos
+
 
 @contactos_bp.route('/editar_contacto/<int:user_id>', methods=['GET', 'POST'])
 @role_required(['Superuser', 'Administrador', 'Usuario Regular']) # MODIFICACIÓN: Permitir a Usuario Regular acceder
@@ -270,20 +419,15 @@ def editar_contacto(user_id):
                 file = request.files['avatar']
                 # Solo procesar si un archivo fue realmente seleccionado y es permitido
                 if file.filename != '' and allowed_file(file.filename):
-                    # Eliminar el avatar anterior si no es el por defecto
-                    if user.avatar_url and 'default_avatar.png' not in user.avatar_url:
-                        old_avatar_filename = os.path.basename(user.avatar_url)
-                        old_avatar_path = os.path.join(current_app.config['UPLOAD_FOLDER'], old_avatar_filename)
-                        
-                        if os.path.exists(old_avatar_path):
-                            os.unlink(old_avatar_path)
+                    # Liberar el avatar anterior si no es el por defecto: se borra tras el commit
+                    # si ningún otro usuario lo usa (almacen_blobs.py)
+                    if not es_avatar_por_defecto(user.avatar_url):
+                        liberar('UPLOAD_FOLDER', user.avatar_url, borrar_sin_registro=True)
                     
-                    # Guardar el nuevo avatar con un nombre seguro
-                    filename = secure_filename(f"{user.username}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{file.filename}")
-                    
-                    # Usar la ruta de subida ABSOLUTA definida en app.py para guardar el archivo
-                    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                    file.save(file_path)
+                    # Guardar el nuevo avatar por contenido (si ya existía se reutiliza)
+                    filename, nuevo = guardar_subida(file, 'UPLOAD_FOLDER')
+                    if nuevo:
+                        encolar_miniaturas(os.path.join(current_app.config['UPLOAD_FOLDER'], filename)) # Miniaturas 48/128/512 en WebP y JPEG
                     
                     # Guardar la ruta relativa correcta en la base de datos (relativa a la carpeta 'static')
                     user.avatar_url = os.path.join(AVATAR_UPLOAD_FOLDER_RELATIVE, filename).replace('\\', '/')
@@ -297,20 +441,7 @@ def editar_contacto(user_id):
             if logged_in_user_role == 'Superuser':
                 new_role = request.form.get('role')
                 if new_role and new_role in role_opciones:
-                    # Lógica para limitar a 2 superusuarios
-                    if new_role == 'Superuser' and user.role != 'Superuser':
-                        current_superusers = User.query.filter_by(role='Superuser').count()
-                        if current_superusers >= 2:
-                            flash('No se pueden asignar más de 2 Superusers. Cambia el rol de otro usuario primero.', 'danger')
-                            db.session.rollback() # Revertir cualquier cambio antes de este punto
-                            return render_template('editar_contacto.html', user=user, 
-                                                   actividad_opciones=actividad_opciones, 
-                                                   capacidad_opciones=capacidad_opciones, 
-                                                   participacion_opciones=participacion_opciones,
-                                                   tipo_sangre_opciones=tipo_sangre_opciones,
-                                                   provincia_opciones=provincia_opciones,
-                                                   logged_in_user_role=logged_in_user_role,
-                                                   role_opciones=role_opciones) # Pasa las opciones en caso de error
+                    # El límite de 2 Superusers se aplica al guardar (ver roles.py)
                     user.role = new_role
                 else:
                     # Si el rol enviado no es válido o está vacío, no se actualiza.
@@ -324,12 +455,28 @@ def editar_contacto(user_id):
             # user.fecha_actualizacion = datetime.utcnow()
 
             db.session.commit()
+            if logged_in_user_role == 'Superuser':
+                # El rol nuevo aplica en las sesiones abiertas del contacto sin volver a iniciar sesión
+                actualizar_sesiones_de_usuario(user.id, role=user.role)
+                if str(logged_in_user_id) == str(user_id):
+                    session['role'] = user.role
             flash('¡Contacto actualizado exitosamente!', 'success')
             # Redirigir a perfil.perfil si el usuario editó su propio perfil
             if str(logged_in_user_id) == str(user_id):
                 return redirect(url_for('perfil.perfil')) # CORRECCIÓN APLICADA AQUÍ
             else:
                 return redirect(url_for('contactos.ver_detalle', user_id=user.id))
+        except RolInvarianteError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return render_template('editar_contacto.html', user=user, 
+                                   actividad_opciones=actividad_opciones, 
+                                   capacidad_opciones=capacidad_opciones, 
+                                   participacion_opciones=participacion_opciones,
+                                   tipo_sangre_opciones=tipo_sangre_opciones,
+                                   provincia_opciones=provincia_opciones,
+                                   logged_in_user_role=logged_in_user_role,
+                                   role_opciones=role_opciones) # Pasa las opciones en caso de error
         except Exception as e:
             db.session.rollback()
             flash(f'Error al actualizar el contacto: {e}', 'danger')
@@ -367,6 +514,12 @@ def editar_contacto(user_id):
                            role_opciones=role_opciones) # Pasa las opciones aquí también
 
 
+# --- EXPORTACIÓN A VCARD (la construcción y la caché viven en vcards.py) ---
+def get_static_base_url():
+    """URL externa de la carpeta static (termina en '/')."""
+    return url_for('static', filename='', _external=True)
+
+
 # Rutas de Exportación (Individual)
 @contactos_bp.route('/exportar_vcard/<int:user_id>')
 @role_required(['Superuser', 'Administrador']) # Solo Superusers y Administradores pueden exportar vCard individual
@@ -376,67 +529,8 @@ def exportar_vcard(user_id):
     """
     user = User.query.get_or_404(user_id)
 
-    # Inicializar all_vcard_data antes del bloque try/except
-    all_vcard_data = [] 
-
     try:
-        card = vobject.vCard()
-        
-        # Nombre
-        card.add('n')
-        card.n.value = vobject.vcard.Name(family=user.primer_apellido, given=user.nombre, additional=user.segundo_apellido if user.segundo_apellido else '')
-        
-        # Nombre completo para pantalla
-        card.add('fn')
-        card.fn.value = f"{user.nombre} {user.primer_apellido} {user.segundo_apellido if user.segundo_apellido else ''}".strip()
-
-        # Teléfono
-        if user.telefono:
-            tel = card.add('tel')
-            tel.type_param = 'CELL'
-            tel.value = user.telefono
-        if user.telefono_emergencia:
-            tel_emergencia = card.add('tel')
-            tel_emergencia.type_param = 'WORK'
-            tel_emergencia.params['X-LABEL'] = ['Emergencia'] 
-            tel_emergencia.value = user.telefono_emergencia
-
-        if user.email:
-            email = card.add('email')
-            email.type_param = 'INTERNET'
-            email.value = user.email
-
-        if user.direccion:
-            adr = card.add('adr')
-            adr.type_param = 'HOME'
-            adr.value = vobject.vcard.Address(street=user.direccion) 
-            
-        if user.empresa:
-            card.add('org').value = user.empresa
-
-        # Otros campos que puedan tener sentido en un vCard (ej. TÍTULO, NOTAS, etc.)
-        if user.actividad:
-            card.add('title').value = user.actividad
-        if user.cedula:
-            # Se añade el rol al campo NOTE del vCard
-            card.add('note').value = f"Cédula: {user.cedula}, Rol: {user.role}" 
-        
-        if user.avatar_url and 'default_avatar.png' not in user.avatar_url:
-            with current_app.app_context():
-                full_avatar_url = url_for('static', filename=user.avatar_url, _external=True)
-                photo = card.add('photo')
-                photo.value = full_avatar_url
-                photo.type_param = 'URI'
-
-        # CORRECCIÓN: Se elimina la referencia a fecha_actualizacion
-        
-        # Serializa cada vCard y añádelo a la lista
-        all_vcard_data.append(card.serialize())
-            
-        # Une todas las vCards en una sola cadena
-        final_vcf_content = "\n".join(all_vcard_data)
-
-        buffer = io.BytesIO(final_vcf_content.encode('utf-8'))
+        buffer = io.BytesIO(vcard_bytes(user, get_static_base_url()))
 
         return send_file(
             buffer,
@@ -454,6 +548,8 @@ def exportar_excel(user_id):
     """
     Exporta los datos de un contacto individual a un archivo Excel (.xlsx).
     """
+    import openpyxl
+
     user = User.query.get_or_404(user_id)
 
     workbook = openpyxl.Workbook()
@@ -507,41 +603,22 @@ def exportar_excel(user_id):
 def exportar_todos_excel():
     """
     Exporta los datos de TODOS los contactos a un archivo Excel (.xlsx) en formato de lista tradicional (filas por usuario, columnas por campo).
+    Las columnas se eligen con ?columnas=campo1,campo2,... entre CAMPOS_EXPORTABLES
+    (por defecto: nombre, apellidos, cédula y email). Se usa el modo write-only de openpyxl.
+    Con ?async=1 se genera como trabajo en segundo plano (ver trabajos.py).
     """
     try:
-        all_users = User.query.all()
-
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        sheet.title = "Todos los Contactos"
-
-        # Encabezados de las columnas para el formato de lista, según lo solicitado.
-        headers = [
-            "Nombre", "Primer Apellido", "Segundo Apellido", "Cédula", "Email"
-        ]
-        sheet.append(headers)
-
-        # Iterar sobre cada usuario y añadir sus datos como una fila
-        for user in all_users:
-            # Se ajustan los datos para que coincidan con los nuevos encabezados.
-            row_data = [
-                str(user.nombre),
-                str(user.primer_apellido),
-                str(user.segundo_apellido) if user.segundo_apellido else "",
-                str(user.cedula) if user.cedula else "",
-                str(user.email) if user.email else ""
-            ]
-            sheet.append(row_data)
-
-        buffer = io.BytesIO()
-        workbook.save(buffer)
-        buffer.seek(0)
+        if quiere_trabajo_en_segundo_plano():
+            return encolar_trabajo('contactos_xlsx', {'columnas': request.args.get('columnas')})
 
-        return send_file(
-            buffer,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name='todos_los_contactos.xlsx'
+        columnas = parse_columnas(request.args.get('columnas'))
+        query = User.query.order_by(User.nombre.asc(), User.id.asc())
+
+        return enviar_usuarios_xlsx(
+            query,
+            columnas,
+            download_name='todos_los_contactos.xlsx',
+            batch_size=current_app.config.get('XLSX_EXPORT_BATCH_SIZE', 500)
         )
     except Exception as e:
         flash(f'Error al exportar todos los contactos a Excel: {e}', 'danger')
@@ -554,78 +631,54 @@ def exportar_todos_excel():
 def exportar_todos_vcard():
     """
     Exporta los datos de TODOS los contactos a un archivo VCard (.vcf) consolidado.
-    """
-    # Inicializar all_vcard_data antes del bloque try/except
-    all_vcard_data = [] 
 
+    La respuesta se genera en streaming: los usuarios se leen por lotes (yield_per)
+    en orden de id y cada vCard se serializa directamente en la respuesta, así que
+    la memoria es constante y el primer byte sale de inmediato.
+
+    Para reanudar una descarga interrumpida, el cliente toma el UID (user-<id>) de la
+    última tarjeta completa recibida y vuelve a pedir con ?desde_id=<id>.
+    Con ?async=1 se genera como trabajo en segundo plano (ver trabajos.py).
+    """
     try:
-        all_users = User.query.all()
-        
+        desde_id = int(request.args.get('desde_id', 0))
+    except (TypeError, ValueError):
+        flash('El parámetro desde_id debe ser un número.', 'danger')
+        return redirect(url_for('contactos.ver_contactos'))
 
-        for user in all_users:
-            card = vobject.vCard()
-            
-            card.add('n')
-            card.n.value = vobject.vcard.Name(family=user.primer_apellido, given=user.nombre, additional=user.segundo_apellido if user.segundo_apellido else '')
-            
-            card.add('fn')
-            card.fn.value = f"{user.nombre} {user.primer_apellido} {user.segundo_apellido if user.segundo_apellido else ''}".strip()
-
-            if user.telefono:
-                tel = card.add('tel')
-                tel.type_param = 'CELL'
-                tel.value = user.telefono
-            if user.telefono_emergencia:
-                tel_emergencia = card.add('tel')
-                tel_emergencia.type_param = 'WORK'
-                tel_emergencia.params['X-LABEL'] = ['Emergencia'] 
-                tel_emergencia.value = user.telefono_emergencia
-
-            if user.email:
-                email = card.add('email')
-                email.type_param = 'INTERNET'
-                email.value = user.email
-
-            if user.direccion:
-                adr = card.add('adr')
-                adr.type_param = 'HOME'
-                adr.value = vobject.vcard.Address(street=user.direccion) 
-                
-            if user.empresa:
-                card.add('org').value = user.empresa
-
-            if user.actividad:
-                card.add('title').value = user.actividad
-            if user.cedula:
-                # Se añade el rol al campo NOTE del vCard
-                card.add('note').value = f"Cédula: {user.cedula}, Rol: {user.role}" 
-            
-            if user.avatar_url and 'default_avatar.png' not in user.avatar_url:
-                with current_app.app_context():
-                    full_avatar_url = url_for('static', filename=user.avatar_url, _external=True)
-                    photo = card.add('photo')
-                    photo.value = full_avatar_url
-                    photo.type_param = 'URI'
-
-            # CORRECCIÓN: Se elimina la referencia a fecha_actualizacion
-            
-            # Serializa cada vCard y añádelo a la lista
-            all_vcard_data.append(card.serialize())
-        
-        # Une todas las vCards en una sola cadena
-        final_vcf_content = "\n".join(all_vcard_data)
+    if quiere_trabajo_en_segundo_plano() and not desde_id:
+        return encolar_trabajo('contactos_vcard', {'static_base_url': get_static_base_url()})
 
-        buffer = io.BytesIO(final_vcf_content.encode('utf-8'))
+    batch_size = current_app.config.get('VCARD_EXPORT_BATCH_SIZE', 200)
+    chunk_size = current_app.config.get('VCARD_EXPORT_CHUNK_BYTES', 64 * 1024)
+    static_base_url = get_static_base_url()
 
-        return send_file(
-            buffer,
-            mimetype='text/vcard',
-            as_attachment=True,
-            download_name='todos_los_contactos.vcf'
-        )
-    except Exception as e:
-        flash(f'Error al exportar todos los contactos a VCard: {e}', 'danger')
-        return redirect(url_for('contactos.ver_contactos'))
+    def generar_vcards():
+        pendiente = []
+        pendiente_bytes = 0
+        try:
+            query = User.query.filter(User.id > desde_id).order_by(User.id.asc()).yield_per(batch_size)
+            for user in query:
+                data = vcard_bytes(user, static_base_url)
+                pendiente.append(data)
+                pendiente_bytes += len(data)
+                if pendiente_bytes >= chunk_size:
+                    yield b''.join(pendiente)
+                    pendiente = []
+                    pendiente_bytes = 0
+            if pendiente:
+                yield b''.join(pendiente)
+        except Exception as e:
+            # Ya se enviaron las cabeceras: solo queda registrar el error y cortar la descarga
+            current_app.logger.error(f"Error al exportar todos los contactos a VCard: {e}")
+            raise
+
+    filename = 'todos_los_contactos.vcf' if not desde_id else f'todos_los_contactos_desde_{desde_id}.vcf'
+    return Response(
+        stream_with_context(generar_vcards()),
+        mimetype='text/vcard',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 # NUEVA RUTA: Interfaz de Administración de Roles
 @contactos_bp.route('/admin/manage_roles', methods=['GET', 'POST']) # CAMBIO AQUÍ: Añadido '/admin'
@@ -659,25 +712,15 @@ def admin_manage_roles():
             flash('No puedes cambiar tu propio rol de Superuser a otro rol desde esta interfaz. Pide a otro Superuser que lo haga si es necesario.', 'danger')
             return redirect(url_for('contactos.admin_manage_roles'))
 
-        # Lógica para limitar a 2 Superusuarios
-        if new_role == 'Superuser' and user_to_update.role != 'Superuser':
-            current_superusers = User.query.filter_by(role='Superuser').count()
-            if current_superusers >= 2:
-                flash('No se pueden asignar más de 2 Superusers. Cambia el rol de otro Superuser primero.', 'danger')
-                return redirect(url_for('contactos.admin_manage_roles'))
-        
-        # Si el usuario es un Superuser y se le cambia el rol a otro (por otro Superuser)
-        # Asegurarse de que no se elimina el último Superuser accidentalmente
-        if user_to_update.role == 'Superuser' and new_role != 'Superuser':
-            superuser_count_before_change = User.query.filter_by(role='Superuser').count()
-            if superuser_count_before_change <= 1:
-                flash('No se puede cambiar el rol del último Superuser a un rol inferior. Debe haber al menos un Superuser en el sistema.', 'danger')
-                return redirect(url_for('contactos.admin_manage_roles'))
-
+        # Los límites de Superusers (máximo 2, mínimo 1) se aplican al guardar (ver roles.py)
         user_to_update.role = new_role
         try:
             db.session.commit()
+            actualizar_sesiones_de_usuario(user_to_update.id, role=new_role) # Efecto inmediato, sin volver a iniciar sesión
             flash(f'Rol de {user_to_update.username} actualizado a "{new_role}".', 'success')
+        except RolInvarianteError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
         except Exception as e:
             db.session.rollback()
             flash(f'Error al actualizar el rol: {e}', 'danger')
@@ -691,17 +734,14 @@ def admin_manage_roles():
     # Búsqueda de usuarios regulares
     search_query_regular = request.args.get('search_query_regular', '').strip()
     regular_users = []
-    if search_query_regular:
-        search_pattern = f"%{search_query_regular}%"
+    condicion_busqueda = filtro_busqueda_usuarios(
+        search_query_regular,
+        columnas=('username', 'nombre', 'primer_apellido', 'segundo_apellido', 'email')
+    )
+    if condicion_busqueda is not None:
         regular_users = User.query.filter(
             User.role == 'Usuario Regular',
-            or_(
-                User.username.ilike(search_pattern),
-                User.nombre.ilike(search_pattern),
-                User.primer_apellido.ilike(search_pattern),
-                User.segundo_apellido.ilike(search_pattern),
-                User.email.ilike(search_pattern)
-            )
+            condicion_busqueda
         ).order_by(User.username.asc()).all()
     else:
         # Si no hay búsqueda, no mostrar usuarios regulares por defecto en esta sección
@@ -709,3 +749,34 @@ def admin_manage_roles():
         pass # No fetch all regular users by default
 
     return render_template('admin_roles.html', admin_users=admin_users, regular_users=regular_users, search_query_regular=search_query_regular)
+
+
+@contactos_bp.route('/admin/manage_roles/lote', methods=['POST'])
+@role_required('Superuser')
+def admin_manage_roles_lote():
+    """
+    Cambia el rol de varios usuarios en una sola petición.
+    Recibe JSON: {"cambios": [{"user_id": 1, "new_role": "Administrador"}, ...]}
+    Todas las filas se validan juntas y se aplican en una única transacción;
+    responde con el resultado de cada fila.
+    """
+    data = request.get_json(silent=True) or {}
+    cambios = data.get('cambios')
+    if not isinstance(cambios, list) or not cambios:
+        return jsonify({'error': 'Se esperaba una lista "cambios" con al menos un elemento.'}), 400
+
+    try:
+        resultados, aplicados = aplicar_cambios_de_rol(cambios, usuario_actual_id=session.get('user_id'))
+        db.session.commit()
+    except RolInvarianteError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'aplicados': 0}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Error al actualizar los roles: {e}', 'aplicados': 0}), 500
+
+    for resultado in resultados:
+        if resultado['estado'] == 'actualizado':
+            actualizar_sesiones_de_usuario(resultado['user_id'], role=resultado['new_role'])
+
+    return jsonify({'aplicados': aplicados, 'resultados': resultados})
@@ -0,0 +1,94 @@
+# contrasenas.py
+# Hash y verificación de contraseñas (bcrypt) fuera del hilo de la petición.
+#
+# bcrypt cuesta cientos de milisegundos de CPU por llamada a propósito. Todas las
+# rutas (login, registro, restablecer y cambiar contraseña) pasan por un
+# ThreadPoolExecutor dedicado con PASSWORD_HASH_WORKERS hilos (bcrypt libera el
+# GIL mientras calcula, así que los hilos trabajan en paralelo de verdad).
+#
+# Control de admisión: como mucho PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_MAX
+# operaciones pueden estar en curso o en espera. Si la cola está llena, o la
+# operación no termina en PASSWORD_HASH_TIMEOUT_SECONDS, se lanza
+# ContrasenasOcupadasError y app.py responde enseguida 503 con Retry-After, en
+# vez de dejar la petición colgada detrás de todo un grupo iniciando sesión.
+#
+# Al iniciar sesión, si el hash guardado usa un costo distinto de
+# BCRYPT_LOG_ROUNDS se vuelve a calcular con el costo actual (necesita_rehash).
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
+from flask import current_app
+
+from models import bcrypt
+
+
+class ContrasenasOcupadasError(Exception):
+    """El pool de bcrypt está saturado o la operación superó el tiempo máximo."""
+
+    def __init__(self, mensaje, retry_after):
+        super().__init__(mensaje)
+        self.retry_after = retry_after
+
+
+_executor = None
+_executor_pid = None
+_cupos = None  # Semáforo: hilos + cola
+_executor_lock = threading.Lock()
+
+
+def _get_executor(app):
+    """Crea el pool y el semáforo de admisión la primera vez (y de nuevo tras un fork)."""
+    global _executor, _executor_pid, _cupos
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+            cola = app.config.get('PASSWORD_HASH_QUEUE_MAX', 16)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+            _cupos = threading.BoundedSemaphore(workers + cola)
+            _executor_pid = os.getpid()
+        return _executor, _cupos
+
+
+def _ejecutar(funcion, *args):
+    """Envía `funcion` al pool respetando el límite de admisión y el tiempo máximo."""
+    app = current_app._get_current_object()
+    retry_after = app.config.get('PASSWORD_HASH_RETRY_AFTER', 2)
+    executor, cupos = _get_executor(app)
+
+    if not cupos.acquire(blocking=False):
+        raise ContrasenasOcupadasError('Demasiados inicios de sesión simultáneos.', retry_after)
+    try:
+        futuro = executor.submit(funcion, *args)
+    except Exception:
+        cupos.release()
+        raise
+    # El cupo se libera cuando la operación termina, aunque la petición ya se haya rendido
+    futuro.add_done_callback(lambda _: cupos.release())
+
+    try:
+        return futuro.result(timeout=app.config.get('PASSWORD_HASH_TIMEOUT_SECONDS', 5))
+    except FuturesTimeoutError:
+        raise ContrasenasOcupadasError('La verificación de la contraseña tardó demasiado.', retry_after)
+
+
+def generar_hash(password):
+    """Devuelve el hash bcrypt (str) de `password` con el costo configurado."""
+    return _ejecutar(bcrypt.generate_password_hash, password).decode('utf-8')
+
+
+def verificar_hash(password_hash, password):
+    """True si `password` coincide con `password_hash`."""
+    if not password_hash:
+        return False
+    return _ejecutar(bcrypt.check_password_hash, password_hash, password)
+
+
+def necesita_rehash(password_hash):
+    """True si el hash se generó con un costo distinto de BCRYPT_LOG_ROUNDS."""
+    try:
+        # Formato: $2b$<costo>$<sal y hash>
+        costo = int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return False
+    return costo != current_app.config.get('BCRYPT_LOG_ROUNDS', 12)
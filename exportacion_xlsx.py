@@ -0,0 +1,114 @@
+# exportacion_xlsx.py
+# Exportación de contactos a Excel (.xlsx) en modo "write-only" de openpyxl.
+#
+# Un Workbook normal mantiene en memoria un objeto por cada celda. En modo
+# write-only cada fila se escribe a disco en cuanto se añade, los usuarios se
+# leen de la base de datos por lotes (yield_per) y el .xlsx final se arma en un
+# archivo temporal que Flask envía por partes. La memoria queda constante sin
+# importar cuántos miembros haya.
+import tempfile
+from datetime import date, datetime
+
+from flask import send_file
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Campos de User que se pueden exportar, con su encabezado en la hoja (en orden)
+CAMPOS_EXPORTABLES = {
+    'id': 'ID',
+    'username': 'Nombre de Usuario',
+    'nombre': 'Nombre',
+    'primer_apellido': 'Primer Apellido',
+    'segundo_apellido': 'Segundo Apellido',
+    'cedula': 'Cédula',
+    'email': 'Email',
+    'telefono': 'Teléfono',
+    'telefono_emergencia': 'Teléfono Emergencia',
+    'nombre_emergencia': 'Nombre Contacto Emergencia',
+    'empresa': 'Empresa',
+    'direccion': 'Dirección',
+    'actividad': 'Actividad',
+    'capacidad': 'Capacidad',
+    'participacion': 'Participación',
+    'fecha_cumpleanos': 'Fecha de Cumpleaños',
+    'tipo_sangre': 'Tipo de Sangre',
+    'poliza': 'Póliza',
+    'aseguradora': 'Aseguradora',
+    'alergias': 'Alergias',
+    'enfermedades_cronicas': 'Enfermedades Crónicas',
+    'role': 'Rol',
+    'last_login_at': 'Último Ingreso',
+    'fecha_registro': 'Fecha de Registro',
+    'fecha_actualizacion': 'Fecha de Actualización',
+}
+
+# Columnas que se exportan si no se elige ninguna
+COLUMNAS_POR_DEFECTO = ['nombre', 'primer_apellido', 'segundo_apellido', 'cedula', 'email']
+
+
+def parse_columnas(valor):
+    """
+    Convierte el parámetro ?columnas=nombre,email,... en una lista de campos válidos.
+    Ignora los campos desconocidos o repetidos; si no queda ninguno usa COLUMNAS_POR_DEFECTO.
+    """
+    if not valor:
+        return list(COLUMNAS_POR_DEFECTO)
+    columnas = []
+    for campo in valor.split(','):
+        campo = campo.strip()
+        if campo in CAMPOS_EXPORTABLES and campo not in columnas:
+            columnas.append(campo)
+    return columnas or list(COLUMNAS_POR_DEFECTO)
+
+
+def formatear_valor(valor):
+    """Deja las celdas como texto (igual que la exportación anterior) y las fechas legibles."""
+    if valor is None:
+        return ""
+    if isinstance(valor, datetime):
+        return valor.strftime('%d/%m/%Y %H:%M')
+    if isinstance(valor, date):
+        return valor.strftime('%d/%m/%Y')
+    return str(valor)
+
+
+def escribir_usuarios_xlsx(users, columnas, destino, titulo='Todos los Contactos'):
+    """
+    Escribe los usuarios (cualquier iterable, idealmente una consulta con yield_per)
+    en un .xlsx de una sola hoja. `destino` puede ser una ruta o un archivo abierto en binario.
+    Devuelve el número de filas de datos escritas.
+    """
+    import openpyxl  # Se importa aquí para no cargarlo en cada arranque
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=titulo)
+    sheet.append([CAMPOS_EXPORTABLES[campo] for campo in columnas])
+
+    filas = 0
+    for user in users:
+        sheet.append([formatear_valor(getattr(user, campo)) for campo in columnas])
+        filas += 1
+
+    workbook.save(destino)
+    return filas
+
+
+def enviar_usuarios_xlsx(query, columnas, download_name, batch_size=500, titulo='Todos los Contactos'):
+    """
+    Genera el .xlsx de los usuarios de `query` en un archivo temporal y lo envía.
+    El archivo temporal se borra solo cuando Flask termina de enviarlo y lo cierra.
+    """
+    spool = tempfile.TemporaryFile(suffix='.xlsx')
+    try:
+        escribir_usuarios_xlsx(query.yield_per(batch_size), columnas, spool, titulo=titulo)
+        spool.seek(0)
+    except Exception:
+        spool.close()
+        raise
+
+    return send_file(
+        spool,
+        mimetype=XLSX_MIMETYPE,
+        as_attachment=True,
+        download_name=download_name
+    )
@@ -1,14 +1,9 @@
-import pandas as pd
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet
-import base64
+# pandas, reportlab y PIL se importan dentro de cada generador: cargarlos al
+# importar el módulo costaba casi un segundo en cada arranque de worker y en
+# cada comando `flask`, aunque nadie exportara nada.
 from io import BytesIO
-from reportlab.lib.units import inch
-from reportlab.lib.utils import ImageReader
 from flask import send_file, make_response
-from PIL import Image as PilImage
-from vobject import vCard
+from vcards import construir_vcard_desde_datos
 import logging
 from datetime import datetime
 
@@ -26,6 +21,25 @@ def export_to_pdf(data, filename):
     Retorna:
     - flask.Response: Una respuesta de Flask para enviar el archivo.
     """
+    buffer = generar_pdf(data)
+    
+    response = make_response(send_file(buffer, as_attachment=True, download_name=filename, mimetype='application/pdf'))
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+def generar_pdf(data):
+    """
+    Genera el PDF de export_to_pdf sin depender de una petición HTTP
+    (lo usan también los trabajos en segundo plano).
+
+    Retorna:
+    - BytesIO: El PDF generado, posicionado al inicio.
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import inch
+
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter)
     styles = getSampleStyleSheet()
@@ -47,10 +61,7 @@ def export_to_pdf(data, filename):
 
     doc.build(story)
     buffer.seek(0)
-    
-    response = make_response(send_file(buffer, as_attachment=True, download_name=filename, mimetype='application/pdf'))
-    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-    return response
+    return buffer
 
 def export_to_jpg(data, filename):
     """
@@ -65,37 +76,7 @@ def export_to_jpg(data, filename):
     - flask.Response: Una respuesta de Flask para enviar el archivo.
     """
     try:
-        # Convertir datos a una cadena de texto para la imagen
-        text_content = ""
-        for item in data:
-            for key, value in item.items():
-                text_content += f"{key.capitalize()}: {value}\n"
-            text_content += "---------------------\n"
-
-        # Crear una imagen en memoria
-        from PIL import Image, ImageDraw, ImageFont
-        
-        # Tamaño inicial de la imagen
-        img_width = 800
-        img_height = 600
-
-        # Crear una imagen blanca
-        img = Image.new('RGB', (img_width, img_height), color='white')
-        d = ImageDraw.Draw(img)
-
-        # Usar una fuente por defecto (se puede mejorar)
-        try:
-            font = ImageFont.truetype("arial.ttf", 16)
-        except IOError:
-            logging.warning("No se encontró la fuente 'arial.ttf', usando la fuente por defecto de PIL.")
-            font = ImageFont.load_default()
-
-        # Dibujar el texto en la imagen
-        d.text((10, 10), text_content, fill='black', font=font)
-
-        buffer = BytesIO()
-        img.save(buffer, format='JPEG')
-        buffer.seek(0)
+        buffer = generar_jpg(data)
 
         response = make_response(send_file(buffer, as_attachment=True, download_name=filename, mimetype='image/jpeg'))
         response.headers['Content-Disposition'] = f'attachment; filename={filename}'
@@ -105,6 +86,46 @@ def export_to_jpg(data, filename):
         # Aquí puedes retornar un error o un archivo predeterminado de error
         return make_response("Error al generar la imagen.", 500)
 
+def generar_jpg(data):
+    """
+    Genera la imagen JPG de export_to_jpg sin depender de una petición HTTP.
+
+    Retorna:
+    - BytesIO: La imagen generada, posicionada al inicio.
+    """
+    # Convertir datos a una cadena de texto para la imagen
+    text_content = ""
+    for item in data:
+        for key, value in item.items():
+            text_content += f"{key.capitalize()}: {value}\n"
+        text_content += "---------------------\n"
+
+    # Crear una imagen en memoria
+    from PIL import Image, ImageDraw, ImageFont
+    
+    # Tamaño inicial de la imagen
+    img_width = 800
+    img_height = 600
+
+    # Crear una imagen blanca
+    img = Image.new('RGB', (img_width, img_height), color='white')
+    d = ImageDraw.Draw(img)
+
+    # Usar una fuente por defecto (se puede mejorar)
+    try:
+        font = ImageFont.truetype("arial.ttf", 16)
+    except IOError:
+        logging.warning("No se encontró la fuente 'arial.ttf', usando la fuente por defecto de PIL.")
+        font = ImageFont.load_default()
+
+    # Dibujar el texto en la imagen
+    d.text((10, 10), text_content, fill='black', font=font)
+
+    buffer = BytesIO()
+    img.save(buffer, format='JPEG')
+    buffer.seek(0)
+    return buffer
+
 
 def export_to_xls(data, filename):
     """
@@ -118,11 +139,7 @@ def export_to_xls(data, filename):
     - flask.Response: Una respuesta de Flask para enviar el archivo.
     """
     try:
-        df = pd.DataFrame(data)
-        buffer = BytesIO()
-        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Sheet1')
-        buffer.seek(0)
+        buffer = generar_xls(data)
         
         response = make_response(send_file(buffer, as_attachment=True, download_name=filename, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'))
         response.headers['Content-Disposition'] = f'attachment; filename={filename}'
@@ -131,6 +148,22 @@ def export_to_xls(data, filename):
         logging.error(f"Error al exportar a XLS: {e}")
         return make_response("Error al generar el archivo Excel.", 500)
 
+def generar_xls(data):
+    """
+    Genera el .xlsx de export_to_xls sin depender de una petición HTTP.
+
+    Retorna:
+    - BytesIO: El libro generado, posicionado al inicio.
+    """
+    import pandas as pd
+
+    df = pd.DataFrame(data)
+    buffer = BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Sheet1')
+    buffer.seek(0)
+    return buffer
+
 def export_to_vcard(data, filename):
     """
     Exporta datos de contacto a un archivo VCard (.vcf).
@@ -144,15 +177,7 @@ def export_to_vcard(data, filename):
     - flask.Response: Una respuesta de Flask para enviar el archivo.
     """
     try:
-        vcard_obj = vCard()
-        vcard_obj.add('fn').value = data.get('nombre', '') + ' ' + data.get('apellido', '')
-        vcard_obj.add('n').value = vobject.vCard.Name(family=data.get('apellido', ''), given=data.get('nombre', ''))
-        vcard_obj.add('tel').value = data.get('telefono', '')
-        vcard_obj.add('email').value = data.get('email', '')
-        vcard_obj.add('note').value = data.get('nota', '')
-
-        buffer = BytesIO(vcard_obj.serialize().encode('utf-8'))
-        buffer.seek(0)
+        buffer = generar_vcard(data)
         
         response = make_response(send_file(buffer, as_attachment=True, download_name=filename, mimetype='text/vcard'))
         response.headers['Content-Disposition'] = f'attachment; filename={filename}'
@@ -160,3 +185,19 @@ def export_to_vcard(data, filename):
     except Exception as e:
         logging.error(f"Error al exportar a VCard: {e}")
         return make_response("Error al generar el archivo VCard.", 500)
+
+def generar_vcard(data):
+    """
+    Genera la vCard de export_to_vcard sin depender de una petición HTTP.
+
+    Retorna:
+    - BytesIO: La tarjeta serializada en UTF-8, posicionada al inicio.
+    """
+    vcard_obj = construir_vcard_desde_datos(
+        nombre=data.get('nombre', ''),
+        primer_apellido=data.get('apellido', ''),
+        telefono=data.get('telefono'),
+        email=data.get('email'),
+        nota=data.get('nota')
+    )
+    return BytesIO(vcard_obj.serialize().encode('utf-8'))
@@ -1,12 +1,14 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, send_from_directory
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
 import os
-import uuid # Para generar nombres de archivo únicos
 from datetime import datetime
 from werkzeug.utils import secure_filename
 import mimetypes # Para determinar el tipo MIME de los archivos
 
 # Importa db, File y User desde models.py
 from models import db, File, User
+from catalogo_activos import get_file_category, escanear_si_hace_falta, consultar_activos
+from almacen_blobs import guardar_subida, liberar
+from medios import servir_archivo
 
 # Importa el decorador role_required desde app.py o perfil.py
 # Asumiendo que role_required está disponible globalmente o se importa desde app.py
@@ -53,84 +55,15 @@ def allowed_file_extension(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_FILE_EXTENSIONS
 
-# Función auxiliar para determinar el tipo de archivo para categorización
-def get_file_category(mime_type):
-    if mime_type.startswith('image/'):
-        return 'image'
-    elif mime_type.startswith('audio/'):
-        return 'audio'
-    elif mime_type.startswith('video/'):
-        return 'video'
-    elif mime_type.startswith('application/pdf') or \
-         mime_type == 'text/plain' or \
-         mime_type.startswith('application/msword') or \
-         mime_type.startswith('application/vnd.openxmlformats-officedocument.wordprocessingml') or \
-         mime_type.startswith('application/vnd.ms-excel') or \
-         mime_type.startswith('application/vnd.oasis.opendocument.spreadsheet') or \
-         mime_type.startswith('application/xml') or \
-         mime_type.startswith('text/xml'):
-        return 'document'
-    elif mime_type in ['application/gpx+xml', 'application/vnd.google-earth.kml+xml', 'application/vnd.google-earth.kmz']:
-        return 'map'
-    elif mime_type.startswith('image/x-icon') or mime_type.startswith('image/vnd.microsoft.icon'): # .ico, .icon
-        return 'icon'
-    else:
-        return 'other'
-
-def get_all_app_assets():
+def get_all_app_assets(search_query='', file_type='', search_date=None):
     """
-    Escanea las carpetas de subida predefinidas de la aplicación (excluyendo la de 'files')
-    y devuelve una lista de diccionarios de archivos.
+    Devuelve los archivos de las carpetas de subida de la aplicación (excluyendo la de 'files')
+    como lista de diccionarios, desde el catálogo de catalogo_activos.py. El catálogo se
+    actualiza aquí si pasó ASSETS_SCAN_INTERVAL_SECONDS desde el último escaneo.
     Estos archivos no están necesariamente en el modelo de base de datos 'File'.
     """
-    app_assets = []
-    # Obtener todas las carpetas de subida relevantes de app.config
-    # Asegúrate de que estas rutas se pasen correctamente desde app.py
-    upload_folders_config = {
-        'avatars': current_app.config.get('UPLOAD_FOLDER'),
-        'project_images': current_app.config.get('PROJECT_IMAGE_UPLOAD_FOLDER'),
-        'note_images': current_app.config.get('NOTE_IMAGE_UPLOAD_FOLDER'),
-        'caminata_images': current_app.config.get('CAMINATA_IMAGE_UPLOAD_FOLDER'),
-        'pagos_images': current_app.config.get('PAGOS_IMAGE_UPLOAD_FOLDER'),
-        'calendar_images': current_app.config.get('CALENDAR_IMAGE_UPLOAD_FOLDER'),
-        'songs': current_app.config.get('SONGS_UPLOAD_FOLDER'),
-        'covers': current_app.config.get('COVERS_UPLOAD_FOLDER'),
-        'aboutus_images': current_app.config.get('ABOUTUS_IMAGE_UPLOAD_FOLDER'),
-        # La carpeta 'files' es gestionada por el modelo File, así que la excluimos aquí
-        # 'files': current_app.config.get('UPLOAD_FILES_FOLDER'),
-    }
-
-    for folder_name, folder_path in upload_folders_config.items():
-        if folder_path and os.path.exists(folder_path):
-            for root, _, filenames in os.walk(folder_path):
-                for filename in filenames:
-                    full_path = os.path.join(root, filename)
-                    # La ruta relativa debe ser desde 'static/' para que url_for('static', filename=...) funcione
-                    relative_path_from_static = os.path.relpath(full_path, os.path.join(current_app.root_path, 'static'))
-                    
-                    mime_type, _ = mimetypes.guess_type(full_path)
-                    if not mime_type:
-                        mime_type = 'application/octet-stream'
-
-                    file_category = get_file_category(mime_type)
-
-                    # Crear un diccionario que imita la estructura del modelo File
-                    # Se asigna un ID de cadena único para estos archivos virtuales (activos de la aplicación)
-                    app_assets.append({
-                        'id': f"app_asset_{uuid.uuid4()}", # ID único de cadena para activos de la aplicación
-                        'original_filename': filename,
-                        'unique_filename': filename, # Para activos de la aplicación, original y único pueden ser lo mismo para mostrar
-                        'file_path': relative_path_from_static.replace('\\', '/'), # Asegura barras diagonales para URLs
-                        'file_type': file_category,
-                        'mime_type': mime_type,
-                        'upload_date': datetime.fromtimestamp(os.path.getmtime(full_path)), # Usar la fecha de última modificación
-                        'user_id': None, # Sin usuario específico para activos de la aplicación
-                        'is_visible': True,
-                        'is_used': True, # Asumimos que los activos de la aplicación están en uso
-                        'is_app_asset': True, # Bandera para distinguirlos de los archivos de la base de datos
-                        'folder_name': folder_name # Nombre de la carpeta de origen para mostrar
-                    })
-    return app_assets
+    escanear_si_hace_falta()
+    return consultar_activos(search_query, file_type, search_date)
 
 
 @files_bp.route('/files', methods=['GET', 'POST'])
@@ -157,6 +90,7 @@ def ver_files():
     if file_type_filter and file_type_filter != 'application_assets':
         db_files_query = db_files_query.filter_by(file_type=file_type_filter)
     
+    search_date = None
     if date_filter:
         try:
             # Asume formato YYYY-MM-DD para la fecha de búsqueda
@@ -186,35 +120,10 @@ def ver_files():
         }
         all_files.append(file_dict)
 
-    # 2. Obtener activos de la aplicación (archivos escaneados dinámicamente)
-    app_assets = get_all_app_assets()
-
-    # Aplicar filtros a los activos de la aplicación manualmente
+    # 2. Obtener activos de la aplicación (catálogo filtrado en SQL)
     filtered_app_assets = []
     if file_type_filter == 'application_assets' or not file_type_filter: # Si se filtra por app_assets o no hay filtro de tipo
-        for asset in app_assets:
-            match_search = True
-            match_type = True
-            match_date = True
-
-            if search_query and search_query.lower() not in asset['original_filename'].lower():
-                match_search = False
-            
-            # Si se ha seleccionado un tipo de archivo específico (que no sea 'application_assets')
-            # entonces los activos de la aplicación solo deben coincidir si su tipo coincide con el filtro.
-            if file_type_filter and file_type_filter != 'application_assets' and asset['file_type'] != file_type_filter:
-                match_type = False
-            
-            if date_filter:
-                try:
-                    search_date = datetime.strptime(date_filter, '%Y-%m-%d').date()
-                    if asset['upload_date'].date() != search_date:
-                        match_date = False
-                except ValueError:
-                    pass # El error de formato de fecha ya se manejó para los archivos de la BD
-
-            if match_search and match_type and match_date:
-                filtered_app_assets.append(asset)
+        filtered_app_assets = get_all_app_assets(search_query, search_date=search_date)
     
     # Combinar todos los archivos (archivos de la base de datos + activos de la aplicación filtrados)
     all_files.extend(filtered_app_assets)
@@ -269,8 +178,6 @@ def upload_file():
 
     if uploaded_file and allowed_file_extension(uploaded_file.filename):
         original_filename = secure_filename(uploaded_file.filename)
-        # Generar un nombre de archivo único para evitar colisiones
-        unique_filename = str(uuid.uuid4()) + os.path.splitext(original_filename)[1]
         
         # Define la carpeta de subida para archivos generales (asegúrate de que exista en app.py)
         upload_folder = current_app.config.get('UPLOAD_FILES_FOLDER')
@@ -279,8 +186,9 @@ def upload_file():
             current_app.logger.error("UPLOAD_FILES_FOLDER no está definido en app.config")
             return redirect(url_for('files.ver_files'))
 
+        # Guardado por contenido: un archivo idéntico ya subido se reutiliza (almacen_blobs.py)
+        unique_filename, _ = guardar_subida(uploaded_file, 'UPLOAD_FILES_FOLDER')
         file_path_on_disk = os.path.join(upload_folder, unique_filename)
-        uploaded_file.save(file_path_on_disk)
 
         # Determinar el tipo MIME y la categoría del archivo
         mime_type, _ = mimetypes.guess_type(file_path_on_disk)
@@ -329,10 +237,8 @@ def download_file(file_id):
     full_path = os.path.join(current_app.root_path, 'static', file_record.file_path)
 
     if os.path.exists(full_path):
-        # send_from_directory requiere la ruta del directorio y el nombre del archivo
-        directory = os.path.dirname(full_path)
-        filename = os.path.basename(full_path)
-        return send_from_directory(directory, filename, as_attachment=True, download_name=file_record.original_filename)
+        # ETag del contenido, peticiones condicionales y de rango, X-Sendfile (medios.py)
+        return servir_archivo(full_path, 'UPLOAD_FILES_FOLDER', descarga=file_record.original_filename)
     else:
         flash('El archivo no existe en el servidor.', 'danger')
         return redirect(url_for('files.ver_files'))
@@ -356,13 +262,8 @@ def delete_file(file_id):
         return redirect(url_for('files.ver_files'))
 
     try:
-        # Eliminar el archivo del sistema de archivos
-        full_path = os.path.join(current_app.root_path, 'static', file_record.file_path)
-        if os.path.exists(full_path):
-            os.remove(full_path)
-            flash(f'Archivo "{file_record.original_filename}" eliminado del servidor.', 'info')
-        else:
-            flash(f'Advertencia: El archivo "{file_record.original_filename}" no se encontró en el servidor, pero se eliminará de la base de datos.', 'warning')
+        # Liberar el archivo: se borra del servidor tras el commit si ningún otro registro lo usa
+        liberar('UPLOAD_FILES_FOLDER', file_record.unique_filename, borrar_sin_registro=True)
 
         # Eliminar el registro de la base de datos
         db.session.delete(file_record)
@@ -0,0 +1,133 @@
+# lecturas_bd.py
+# Enrutado de lecturas a un engine de solo lectura.
+#
+# Las peticiones GET/HEAD (ver_contactos, ver_versiones, ver_aboutus,
+# detalle_version, ...) solo leen: sus consultas van al engine del bind
+# BIND_LECTURA, y las escrituras siguen yendo al engine principal.
+#
+#   - SQLite en archivo: el mismo archivo abierto con `mode=ro`. En WAL los
+#     lectores no esperan al escritor, y una conexión de solo lectura no puede
+#     tomar por error el bloqueo de escritura.
+#   - Otros motores: la réplica de DATABASE_REPLICA_URL.
+#
+# Consistencia "lee tus escrituras":
+#   - Dentro de la petición: en cuanto la sesión de SQLAlchemy tiene cambios
+#     pendientes, hace flush o ejecuta un INSERT/UPDATE/DELETE, todo lo demás
+#     de esa petición va al principal.
+#   - Entre peticiones: tras una petición que escribió se guarda la hora en la
+#     sesión de Flask (CLAVE_ESCRITURA); durante DB_READ_YOUR_WRITES_SECONDS
+#     las peticiones de ese usuario leen del principal, así una réplica con
+#     retraso no le muestra datos anteriores a su propio cambio.
+#
+# Las vistas GET que deben leer siempre del principal usan @usar_primaria.
+# El código fuera de una petición (comandos flask, hilos de trabajos) usa
+# siempre el principal.
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+BIND_LECTURA = 'lectura'
+CLAVE_ESCRITURA = '_bd_escritura'  # Hora (epoch) de la última escritura del usuario
+METODOS_LECTURA = ('GET', 'HEAD')
+
+
+def es_solo_lectura(uri):
+    """True si la URL de SQLite abre el archivo en modo solo lectura."""
+    return make_url(uri).query.get('mode') == 'ro'
+
+
+def url_solo_lectura(config):
+    """URL del engine de lectura: la réplica configurada o, para SQLite en archivo, el mismo archivo con mode=ro."""
+    from motor_bd import es_sqlite_en_archivo
+
+    if config.get('DATABASE_REPLICA_URL'):
+        return config['DATABASE_REPLICA_URL']
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    if not es_sqlite_en_archivo(uri):
+        return None
+    url = make_url(uri)
+    if url.query.get('uri'):
+        return str(url.update_query_dict({'mode': 'ro'}))
+    return f"sqlite:///file:{url.database}?mode=ro&uri=true"
+
+
+def configurar_lecturas(app):
+    """Registra el bind de lectura en SQLALCHEMY_BINDS. Llamar después de configurar_motor y antes de db.init_app(app)."""
+    config = app.config
+    if not config.get('DB_READ_ROUTING', True):
+        return
+    url = url_solo_lectura(config)
+    if url is None:
+        return
+    # Los binds no heredan SQLALCHEMY_ENGINE_OPTIONS: se copian las del principal (pool, check_same_thread)
+    opciones = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    opciones['url'] = url
+    config.setdefault('SQLALCHEMY_BINDS', {})[BIND_LECTURA] = opciones
+
+
+def init_lecturas(app):
+    """Guarda en la sesión de Flask la hora de las escrituras. Llamar después de db.init_app(app)."""
+    if BIND_LECTURA not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+
+    @app.after_request
+    def _marcar_escritura(response):
+        sesion_bd = app.extensions['sqlalchemy'].session
+        if sesion_bd.registry.has() and sesion_bd().info.get('escribio'):
+            session[CLAVE_ESCRITURA] = time.time()
+        return response
+
+
+def usar_primaria(f):
+    """Decorador para vistas GET que deben leer siempre del engine principal."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.bd_primaria = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def _peticion_de_lectura():
+    """True si la petición actual puede leer del engine de lectura (se calcula una vez por petición)."""
+    if not has_request_context():
+        return False
+    if 'bd_lectura' not in g:
+        permitida = request.method in METODOS_LECTURA and not g.get('bd_primaria')
+        if permitida:
+            marca = session.get(CLAVE_ESCRITURA)
+            ventana = current_app.config.get('DB_READ_YOUR_WRITES_SECONDS', 5)
+            permitida = not marca or time.time() - marca > ventana
+        g.bd_lectura = permitida
+    return g.bd_lectura and not g.get('bd_primaria')
+
+
+class SesionEnrutada(Session):
+    """
+    Sesión de Flask-SQLAlchemy que manda las consultas de las peticiones de
+    lectura al bind BIND_LECTURA mientras la sesión no haya escrito nada.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None:
+            return engine
+        if clause is not None and getattr(clause, 'is_dml', False):
+            self.info['escribio'] = True
+            return engine
+        engines = self._db.engines
+        if BIND_LECTURA not in engines or engine is not engines.get(None):
+            return engine
+        if self.info.get('escribio') or self._flushing or self.new or self.deleted or self.dirty:
+            return engine
+        if not _peticion_de_lectura():
+            return engine
+        return engines[BIND_LECTURA]
+
+
+@event.listens_for(SesionEnrutada, 'after_flush')
+def _tras_flush(sesion, contexto):
+    sesion.info['escribio'] = True
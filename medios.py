@@ -0,0 +1,139 @@
+# medios.py
+# Servir canciones, videos, mapas y archivos subidos con caché y peticiones de rango.
+#
+#   GET /medios/<carpeta>/<nombre>         p. ej. /medios/songs/tema.mp3, /medios/files/<sha256>.mp4
+#   GET /medios/descargar/<subida_id>      Descarga con el nombre original (subidas.py)
+#
+# Diferencias con url_for('static') y send_from_directory:
+#   - ETag fuerte derivado del contenido: el SHA-256 del nombre en las carpetas
+#     del almacén (almacen_blobs.py) o el hash_contenido del catálogo de activos
+#     (catalogo_activos.py) si sigue al día. Si no hay hash se usa el ETag de
+#     Werkzeug (mtime, tamaño).
+#   - Los nombres <sha256>.<ext> no cambian nunca de contenido: se cachean un año
+#     con `immutable`. El resto se revalida pasados MEDIA_CACHE_SECONDS.
+#   - Las descargas de subidas dependen del usuario: `private` (solo el navegador
+#     las guarda, nunca un proxy o CDN compartido) y sin `immutable`.
+#   - If-None-Match / If-Modified-Since -> 304 y Range -> 206 (Werkzeug
+#     make_conditional): el reproductor puede saltar a cualquier punto de un
+#     MP3 o MP4 sin descargarlo entero.
+#   - MEDIA_SENDFILE = 'x-sendfile' (Apache, lighttpd) o 'x-accel' (nginx): la
+#     vista solo decide permisos y cabeceras, y el proxy envía los bytes (y
+#     atiende los rangos) sin pasar por Python. Para nginx:
+#
+#       location /_static/ {
+#           internal;
+#           alias /ruta/del/proyecto/static/;
+#       }
+import os
+
+from flask import Blueprint, abort, current_app, request, session
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+from models import db, ActivoApp, SubidaPorPartes
+from catalogo_activos import CARPETAS_ACTIVOS
+from almacen_blobs import CARPETAS_BLOBS, es_blob
+from lecturas_bd import usar_primaria
+from trabajos import login_required
+
+medios_bp = Blueprint('medios', __name__, url_prefix='/medios')
+
+# Carpeta en la URL -> clave de config.py
+CARPETAS_MEDIOS = dict(CARPETAS_ACTIVOS, files='UPLOAD_FILES_FOLDER')
+MAX_AGE_INMUTABLE = 365 * 24 * 3600
+
+
+def _etag_del_catalogo(ruta, st):
+    """hash_contenido del catálogo si la fila corresponde al archivo tal como está en disco."""
+    relativa = os.path.relpath(ruta, current_app.static_folder).replace(os.sep, '/')
+    if relativa.startswith('..'):
+        return None
+    fila = db.session.execute(
+        db.select(ActivoApp.hash_contenido, ActivoApp.mtime_ns, ActivoApp.tamano).where(ActivoApp.ruta == relativa)
+    ).first()
+    if fila is None or fila.mtime_ns != st.st_mtime_ns or fila.tamano != st.st_size:
+        return None
+    return fila.hash_contenido
+
+
+def servir_archivo(ruta, clave_carpeta=None, descarga=None, etag=None, privado=False):
+    """
+    Respuesta para el archivo `ruta` con ETag fuerte, peticiones condicionales y
+    de rango, o la cabecera para que el proxy lo envíe (MEDIA_SENDFILE).
+    `descarga` es el nombre con el que se descarga como adjunto; `privado` marca
+    respuestas que dependen del usuario y no deben guardarse en cachés compartidas.
+    """
+    config = current_app.config
+    try:
+        st = os.stat(ruta)
+    except OSError:
+        abort(404)
+
+    nombre = os.path.basename(ruta)
+    es_nombre_blob = clave_carpeta in CARPETAS_BLOBS and es_blob(nombre)
+    inmutable = es_nombre_blob and not privado
+    if etag is None:
+        etag = nombre.split('.', 1)[0] if es_nombre_blob else _etag_del_catalogo(ruta, st)
+
+    modo = config.get('MEDIA_SENDFILE', '')
+    relativa = os.path.relpath(ruta, current_app.static_folder).replace(os.sep, '/')
+    if modo == 'x-accel' and relativa.startswith('..'):
+        modo = '' # Fuera de static/: no hay location interna que lo sirva
+
+    respuesta = send_file(
+        ruta,
+        request.environ,
+        as_attachment=descarga is not None,
+        download_name=descarga,
+        conditional=not modo, # Con el proxy, los rangos los atiende él
+        etag=etag or True,
+        max_age=MAX_AGE_INMUTABLE if inmutable else config.get('MEDIA_CACHE_SECONDS', 3600),
+        use_x_sendfile=bool(modo),
+        response_class=current_app.response_class,
+        _root_path=current_app.root_path,
+    )
+    if privado:
+        respuesta.cache_control.public = False
+        respuesta.cache_control.private = True
+    if inmutable:
+        respuesta.cache_control.immutable = True
+    if not modo:
+        # Werkzeug solo la pone al responder un Range: sin ella algunos reproductores no intentan saltar
+        if respuesta.status_code == 200:
+            respuesta.accept_ranges = 'bytes'
+        return respuesta
+
+    # El proxy envía el cuerpo entero o el rango que pida el cliente; aquí solo
+    # se resuelven If-None-Match / If-Modified-Since
+    respuesta = respuesta.make_conditional(request.environ, accept_ranges=False)
+    cabecera = respuesta.headers.pop('X-Sendfile', None)
+    if respuesta.status_code == 304 or cabecera is None:
+        return respuesta
+    if modo == 'x-accel':
+        respuesta.headers['X-Accel-Redirect'] = config.get('MEDIA_ACCEL_PREFIX', '/_static').rstrip('/') + '/' + relativa
+    else:
+        respuesta.headers['X-Sendfile'] = cabecera
+    return respuesta
+
+
+@medios_bp.route('/<carpeta>/<path:nombre>', methods=['GET', 'HEAD'])
+def servir_medio(carpeta, nombre):
+    clave_carpeta = CARPETAS_MEDIOS.get(carpeta)
+    raiz = current_app.config.get(clave_carpeta) if clave_carpeta else None
+    ruta = safe_join(raiz, nombre) if raiz else None
+    if ruta is None or not os.path.isfile(ruta):
+        abort(404)
+    return servir_archivo(ruta, clave_carpeta)
+
+
+@medios_bp.route('/descargar/<subida_id>', methods=['GET', 'HEAD'])
+@login_required
+@usar_primaria # Justo después de finalizar la subida la réplica aún podría no tenerla
+def descargar_subida(subida_id):
+    subida = db.session.get(SubidaPorPartes, subida_id)
+    if subida is None or subida.estado != 'completa':
+        abort(404)
+    if subida.user_id != session.get('user_id') and session.get('role') != 'Superuser':
+        abort(404)
+    ruta = os.path.join(current_app.config['UPLOAD_FILES_FOLDER'], subida.nombre_final)
+    return servir_archivo(ruta, 'UPLOAD_FILES_FOLDER', descarga=subida.nombre_original, etag=subida.sha256, privado=True)
@@ -9,8 +9,9 @@ from flask import current_app
 from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Float, Boolean, Date, Time, UniqueConstraint
 from sqlalchemy.orm import relationship
 import sqlalchemy as sa
+from lecturas_bd import SesionEnrutada
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': SesionEnrutada}) # Lecturas de GET al engine de solo lectura (lecturas_bd.py)
 bcrypt = Bcrypt()
 migrate = Migrate()
 
@@ -56,6 +57,12 @@ class User(db.Model):
     __table_args__ = (
         UniqueConstraint('username', name='uq_user_username'),
         UniqueConstraint('email', name='uq_user_email'),
+        # Índices para las consultas frecuentes (ver planes_consulta.py)
+        db.Index('ix_user_email_lower', sa.func.lower(email)), # Login por email sin distinguir mayúsculas
+        db.Index('ix_user_role_username', 'role', 'username'), # Conteo de Superusers y lista de administradores
+        db.Index('ix_user_nombre_id', 'nombre', 'id'), # Paginación keyset de contactos
+        db.Index('ix_user_cedula', 'cedula'),
+        db.Index('ix_user_telefono', 'telefono'),
     )
 
     def get_reset_token(self, expires_sec=1800):
@@ -122,3 +129,148 @@ class PushSubscription(db.Model):
         }
 
 
+class ExportJob(db.Model):
+    """Trabajo de exportación en segundo plano (ver trabajos.py)."""
+    __tablename__ = 'export_jobs'
+    id = db.Column(db.String(32), primary_key=True) # uuid4().hex
+    tipo = db.Column(db.String(50), nullable=False)
+    parametros = db.Column(db.Text, nullable=True) # JSON
+    estado = db.Column(db.String(20), nullable=False, default='pendiente', index=True) # pendiente, en_proceso, terminado, error
+    progreso = db.Column(db.Integer, nullable=False, default=0) # 0 a 100
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=True)
+    artifact_path = db.Column(db.String(500), nullable=True) # Ruta absoluta del archivo generado
+    download_name = db.Column(db.String(255), nullable=True)
+    mimetype = db.Column(db.String(100), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+
+    def __repr__(self):
+        return f'<ExportJob {self.id} {self.tipo} {self.estado}>'
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "tipo": self.tipo,
+            "estado": self.estado,
+            "progreso": self.progreso,
+            "download_name": self.download_name,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None,
+        }
+
+
+class RoleCount(db.Model):
+    """Número de usuarios por rol, mantenido por los eventos de User (ver roles.py)."""
+    __tablename__ = 'role_counts'
+    role = db.Column(db.String(50), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return f'<RoleCount {self.role}={self.total}>'
+
+
+class AppSetting(db.Model):
+    """Ajustes persistentes de la aplicación (clave/valor), p. ej. si ya se asignó el primer Superuser."""
+    __tablename__ = 'app_settings'
+    clave = db.Column(db.String(100), primary_key=True)
+    valor = db.Column(db.Text, nullable=True)
+    actualizado = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<AppSetting {self.clave}>'
+
+
+class SesionServidor(db.Model):
+    """Sesión guardada en el servidor (ver sesiones.py); la cookie solo lleva la clave firmada."""
+    __tablename__ = 'sesiones'
+    clave = db.Column(db.String(100), primary_key=True)
+    valor = db.Column(db.LargeBinary, nullable=False)
+    expira = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<SesionServidor {self.clave}>'
+
+
+class SesionUsuario(db.Model):
+    """Índice de las sesiones abiertas de cada usuario (conjunto estilo Redis, ver sesiones.py)."""
+    __tablename__ = 'sesiones_usuario'
+    conjunto = db.Column(db.String(100), primary_key=True)
+    miembro = db.Column(db.String(100), primary_key=True)
+
+    def __repr__(self):
+        return f'<SesionUsuario {self.conjunto} {self.miembro}>'
+
+
+class ActivoApp(db.Model):
+    """Archivo de las carpetas de subida de la app, catalogado por catalogo_activos.py."""
+    __tablename__ = 'activos_app'
+    id = db.Column(db.Integer, primary_key=True)
+    clave = db.Column(db.String(32), unique=True, nullable=False) # Estable: deriva de la ruta y del contenido
+    ruta = db.Column(db.String(500), unique=True, nullable=False) # Relativa a static/, con '/'
+    directorio = db.Column(db.String(500), nullable=False, index=True)
+    carpeta = db.Column(db.String(50), nullable=False) # avatars, project_images, ...
+    nombre = db.Column(db.String(255), nullable=False)
+    tamano = db.Column(db.BigInteger, nullable=False)
+    mime_type = db.Column(db.String(100), nullable=False)
+    categoria = db.Column(db.String(20), nullable=False, index=True)
+    modificado = db.Column(db.DateTime, nullable=False, index=True)
+    mtime_ns = db.Column(db.BigInteger, nullable=False)
+    hash_contenido = db.Column(db.String(64), nullable=False, index=True) # SHA-256
+
+    def __repr__(self):
+        return f'<ActivoApp {self.ruta}>'
+
+
+class DirectorioActivos(db.Model):
+    """mtime de cada directorio catalogado: si no cambió, el escáner no vuelve a listarlo."""
+    __tablename__ = 'activos_directorios'
+    ruta = db.Column(db.String(500), primary_key=True) # Relativa a static/, con '/'
+    carpeta = db.Column(db.String(50), nullable=False)
+    mtime_ns = db.Column(db.BigInteger, nullable=False)
+    escaneado = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<DirectorioActivos {self.ruta}>'
+
+
+class Blob(db.Model):
+    """Archivo subido guardado una sola vez por contenido (ver almacen_blobs.py)."""
+    __tablename__ = 'blobs'
+    __table_args__ = (
+        UniqueConstraint('carpeta', 'digest', name='uq_blobs_carpeta_digest'),
+        db.Index('ix_blobs_carpeta_nombre', 'carpeta', 'nombre'), # liberar() busca por nombre
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    carpeta = db.Column(db.String(50), nullable=False) # Clave de config.py: UPLOAD_FOLDER, ...
+    digest = db.Column(db.String(64), nullable=False) # SHA-256 del contenido
+    nombre = db.Column(db.String(80), nullable=False) # <digest><extensión> dentro de la carpeta
+    tamano = db.Column(db.BigInteger, nullable=False)
+    referencias = db.Column(db.Integer, nullable=False, default=1)
+    creado = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Blob {self.carpeta}/{self.nombre} x{self.referencias}>'
+
+
+class SubidaPorPartes(db.Model):
+    """Subida reanudable por partes (ver subidas.py). Las completas cuentan para la cuota del usuario."""
+    __tablename__ = 'subidas'
+    id = db.Column(db.String(32), primary_key=True) # uuid4().hex
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    nombre_original = db.Column(db.String(255), nullable=False)
+    extension = db.Column(db.String(10), nullable=False)
+    categoria = db.Column(db.String(20), nullable=False) # get_file_category: video, audio, map, ...
+    tamano = db.Column(db.BigInteger, nullable=False) # Tamaño total declarado al iniciar
+    recibido = db.Column(db.BigInteger, nullable=False, default=0) # Bytes ya escritos: offset de la próxima parte
+    sha256 = db.Column(db.String(64), nullable=True) # Suma declarada por el cliente
+    estado = db.Column(db.String(20), nullable=False, default='en_curso', index=True) # en_curso, completa
+    nombre_final = db.Column(db.String(80), nullable=True) # Nombre del blob al completarse
+    creado = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    actualizado = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<SubidaPorPartes {self.id} {self.recibido}/{self.tamano} {self.estado}>'
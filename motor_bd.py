@@ -0,0 +1,151 @@
+# motor_bd.py
+# Ajustes del motor de base de datos para SQLite en producción.
+#
+# Con varios workers (servidor.py) escribiendo en el mismo archivo, SQLite con
+# sus valores por defecto (journal DELETE, sin busy_timeout) responde enseguida
+# "database is locked". Este módulo:
+#
+#   - configurar_motor(app): antes de db.init_app, define SQLALCHEMY_ENGINE_OPTIONS
+#     con un QueuePool de DB_POOL_SIZE + DB_MAX_OVERFLOW conexiones para bases
+#     SQLite en archivo (las de memoria conservan el pool por defecto).
+#   - init_motor_bd(app): después de db.init_app, aplica en cada conexión nueva
+#     los PRAGMA de SQLITE_*: journal_mode=WAL (los lectores no bloquean al
+#     escritor), synchronous=NORMAL (seguro en WAL), busy_timeout, cache_size,
+#     mmap_size y temp_store en memoria.
+#   - con_reintentos(funcion): ejecuta una unidad de escritura completa
+#     serializada dentro del proceso (un candado por proceso, así los hilos de un
+#     worker no compiten entre sí) y, si otro proceso tiene el bloqueo, la repite
+#     con espera exponencial y jitter hasta DB_WRITE_RETRIES veces.
+#   - savepoint(): db.session.begin_nested() que con el driver sqlite3 no
+#     confirma nada antes del commit de la sesión.
+#
+# Comparativa antes/después: python benchmarks/bench_sqlite_concurrencia.py
+import random
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+
+from lecturas_bd import es_solo_lectura
+from models import db
+
+# Mensajes de sqlite3 que indican que otra conexión tiene el bloqueo de escritura
+MENSAJES_BLOQUEO = ('database is locked', 'database table is locked', 'database is busy')
+
+_escritura_lock = threading.RLock()
+
+
+def es_sqlite_en_archivo(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') \
+        and url.query.get('mode') != 'memory'
+
+
+def pragmas_sqlite(config, solo_lectura=False):
+    """Lista de sentencias PRAGMA (en orden) según la configuración."""
+    pragmas = []
+    # Cambiar el modo de journal escribe en el archivo: no se intenta desde una conexión mode=ro
+    if config.get('SQLITE_JOURNAL_MODE') and not solo_lectura:
+        pragmas.append(f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}")
+    if config.get('SQLITE_SYNCHRONOUS'):
+        pragmas.append(f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}")
+    pragmas.append(f"PRAGMA busy_timeout={int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}")
+    if config.get('SQLITE_CACHE_SIZE_KB'):
+        pragmas.append(f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}")  # Negativo = KiB
+    if config.get('SQLITE_MMAP_SIZE'):
+        pragmas.append(f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}")
+    pragmas.append("PRAGMA temp_store=MEMORY")
+    return pragmas
+
+
+def aplicar_pragmas(engine, pragmas):
+    """Ejecuta `pragmas` en cada conexión nueva del pool de `engine`."""
+    def _al_conectar(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    event.listen(engine, 'connect', _al_conectar)
+
+
+def configurar_motor(app):
+    """Opciones del engine para SQLite en archivo. Llamar antes de db.init_app(app)."""
+    config = app.config
+    if not es_sqlite_en_archivo(config['SQLALCHEMY_DATABASE_URI']):
+        return
+    opciones = config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    opciones.setdefault('poolclass', QueuePool)
+    opciones.setdefault('pool_size', config.get('DB_POOL_SIZE', 5))
+    opciones.setdefault('max_overflow', config.get('DB_MAX_OVERFLOW', 10))
+    opciones.setdefault('pool_timeout', config.get('DB_POOL_TIMEOUT', 30))
+    # Las conexiones del pool se usan desde distintos hilos, pero nunca dos a la vez
+    opciones.setdefault('connect_args', {}).setdefault('check_same_thread', False)
+
+
+def init_motor_bd(app):
+    """Aplica los PRAGMA en los engines SQLite en archivo de la app. Llamar después de db.init_app(app)."""
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite' and es_sqlite_en_archivo(str(engine.url)):
+                aplicar_pragmas(engine, pragmas_sqlite(app.config, solo_lectura=es_solo_lectura(str(engine.url))))
+
+
+def es_error_de_bloqueo(error):
+    return isinstance(error, OperationalError) and any(m in str(error.orig).lower() for m in MENSAJES_BLOQUEO)
+
+
+def con_reintentos(funcion, *args, revertir_sesion=False, intentos=None, espera_ms=None, **kwargs):
+    """
+    Ejecuta `funcion(*args, **kwargs)`, que debe ser una unidad de escritura completa
+    (incluido el commit), con el candado de escritura del proceso. Si falla porque la
+    base de datos está bloqueada por otro proceso, espera (exponencial con jitter) y la
+    repite. Con `revertir_sesion=True` hace db.session.rollback() antes de cada reintento
+    (para funciones que usan el ORM). Si se agotan los intentos se relanza el error.
+    """
+    if has_app_context():
+        intentos = intentos or current_app.config.get('DB_WRITE_RETRIES', 5)
+        espera_ms = espera_ms or current_app.config.get('DB_WRITE_BACKOFF_MS', 50)
+    intentos = intentos or 5
+    espera_ms = espera_ms or 50
+
+    for intento in range(intentos):
+        try:
+            with _escritura_lock:
+                return funcion(*args, **kwargs)
+        except OperationalError as e:
+            if not es_error_de_bloqueo(e) or intento == intentos - 1:
+                raise
+            if revertir_sesion:
+                db.session.rollback()
+            espera = min(espera_ms * (2 ** intento), 2000) / 1000
+            time.sleep(espera * random.uniform(0.5, 1.5))
+
+
+def savepoint(sesion=None):
+    """
+    Como sesion.begin_nested(), también con SQLite. El driver sqlite3 no abre la
+    transacción hasta el primer INSERT/UPDATE: un SAVEPOINT emitido antes hace de
+    transacción externa y su RELEASE confirma el cambio sin esperar al commit de
+    la sesión. Aquí se abre la transacción antes del SAVEPOINT si hace falta.
+    """
+    sesion = sesion or db.session
+    conexion = sesion.connection()
+    if conexion.dialect.name == 'sqlite' and not conexion.connection.dbapi_connection.in_transaction:
+        conexion.exec_driver_sql('BEGIN')
+    return sesion.begin_nested()
+
+
+def reintentar_escritura(funcion):
+    """Decorador: la función decorada se ejecuta siempre a través de con_reintentos."""
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        return con_reintentos(funcion, *args, **kwargs)
+    return envoltura
@@ -1,11 +1,12 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, session, current_app, send_from_directory
-from models import db, bcrypt, User
+from models import db, User
 from functools import wraps
 import os
 import shutil
-from werkzeug.utils import secure_filename
 from datetime import datetime
-import uuid # Importar para nombres de archivo únicos
+from avatares import encolar_miniaturas
+from almacen_blobs import guardar_subida, liberar
+from contrasenas import generar_hash, verificar_hash
 
 perfil_bp = Blueprint('perfil', __name__)
 
@@ -73,11 +74,11 @@ def editar_perfil():
             if 'avatar' in request.files:
                 avatar_file = request.files['avatar']
                 if avatar_file.filename != '':
-                    filename = secure_filename(avatar_file.filename)
-                    unique_filename = str(uuid.uuid4()) + os.path.splitext(filename)[1]
                     upload_folder = current_app.config['UPLOAD_FOLDER']
-                    file_path = os.path.join(upload_folder, unique_filename)
-                    avatar_file.save(file_path)
+                    unique_filename, nuevo = guardar_subida(avatar_file, 'UPLOAD_FOLDER')
+                    if nuevo:
+                        encolar_miniaturas(os.path.join(upload_folder, unique_filename))
+                    liberar('UPLOAD_FOLDER', user.avatar_url) # El anterior, si nadie más lo usa
                     user.avatar_url = os.path.join('uploads', 'avatars', unique_filename).replace('\\', '/')
 
             db.session.commit()
@@ -106,12 +107,12 @@ def change_password():
 
         user = User.query.get(session['user_id'])
         
-        if not bcrypt.check_password_hash(user.password, current_password):
+        if not verificar_hash(user.password, current_password):
             flash('La contraseña actual es incorrecta.', 'danger')
         elif new_password != confirm_password:
             flash('Las nuevas contraseñas no coinciden.', 'danger')
         else:
-            hashed_password = bcrypt.generate_password_hash(new_password).decode('utf-8')
+            hashed_password = generar_hash(new_password)
             user.password = hashed_password
             db.session.commit()
             flash('Contraseña actualizada con éxito.', 'success')
@@ -0,0 +1,128 @@
+# planes_consulta.py
+# Verificación de los planes de las consultas frecuentes sobre User.
+#
+# Cada consulta de la lista CONSULTAS_FRECUENTES se pasa por EXPLAIN QUERY PLAN
+# de SQLite. Si alguna recorre la tabla 'user' completa (una fila "SCAN user"),
+# el comando termina con error: normalmente significa que falta un índice en
+# models.py o que la consulta dejó de poder usarlo (por ejemplo, al envolver la
+# columna en una función que el índice no cubre).
+#
+# Uso:
+#   flask verificar-planes            # esquema vacío en memoria (create_all)
+#   flask verificar-planes --usar-bd  # la base de datos configurada (DATABASE_URL)
+import sys
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, create_engine, func, or_, select, text
+from sqlalchemy.pool import StaticPool
+
+from models import db, User
+from busqueda import asegurar_indice_fts, construir_consulta_fts, FTS_TABLE
+
+
+def _consultas_frecuentes():
+    """
+    Devuelve la lista de (nombre, sentencia, permite_scan_con_indice).
+    `permite_scan_con_indice` acepta "SCAN user USING INDEX ...", que es lo esperado
+    en la primera página ordenada con LIMIT: se recorre el índice y se corta enseguida.
+    """
+    subconsulta_fts = text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_query") \
+        .bindparams(fts_query=construir_consulta_fts('perez')) \
+        .columns(rowid=db.Integer)
+
+    return [
+        ('Login por username o email',
+         select(User).where((User.username == 'juan') | (func.lower(User.email) == 'juan@example.com')).limit(1),
+         False),
+        ('Conteo de Superusers',
+         select(func.count()).select_from(User).where(User.role == 'Superuser'),
+         False),
+        ('Lista de administradores',
+         select(User).where(User.role.in_(['Superuser', 'Administrador']))
+         .order_by(User.role.desc(), User.username.asc()),
+         False),
+        ('Contactos: primera página',
+         select(User).order_by(User.nombre.asc(), User.id.asc()).limit(26),
+         True),
+        ('Contactos: página siguiente',
+         select(User).where(or_(User.nombre > 'maria', and_(User.nombre == 'maria', User.id > 10)))
+         .order_by(User.nombre.asc(), User.id.asc()).limit(26),
+         False),
+        ('Contactos: página anterior',
+         select(User).where(or_(User.nombre < 'maria', and_(User.nombre == 'maria', User.id < 10)))
+         .order_by(User.nombre.desc(), User.id.desc()).limit(26),
+         False),
+        ('Usuario por cédula',
+         select(User).where(User.cedula == '1-2345-6789'),
+         False),
+        ('Usuario por teléfono',
+         select(User).where(User.telefono == '88888888'),
+         False),
+        ('Usuario por username',
+         select(User).where(User.username == 'juan'),
+         False),
+        ('Usuario por email',
+         select(User).where(User.email == 'juan@example.com'),
+         False),
+        ('Búsqueda de contactos (FTS5)',
+         select(User).where(User.id.in_(subconsulta_fts.scalar_subquery())),
+         False),
+    ]
+
+
+def _es_scan_completo(detalle, permite_scan_con_indice):
+    """Indica si una fila del plan corresponde a un recorrido completo de una tabla real."""
+    if not detalle.startswith('SCAN '):
+        return False
+    if 'VIRTUAL TABLE' in detalle:
+        # Las tablas FTS5 resuelven el MATCH con su propio índice
+        return False
+    if permite_scan_con_indice and ('USING INDEX' in detalle or 'USING COVERING INDEX' in detalle):
+        return False
+    return True
+
+
+def verificar_planes(engine):
+    """
+    Ejecuta EXPLAIN QUERY PLAN para cada consulta frecuente en `engine` (SQLite).
+    Devuelve una lista de (nombre, filas_del_plan, ok).
+    """
+    asegurar_indice_fts(engine)
+    resultados = []
+    with engine.connect() as conn:
+        for nombre, sentencia, permite_scan_con_indice in _consultas_frecuentes():
+            sql = str(sentencia.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+            filas = [fila[-1] for fila in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+            ok = not any(_es_scan_completo(detalle, permite_scan_con_indice) for detalle in filas)
+            resultados.append((nombre, filas, ok))
+    return resultados
+
+
+@click.command('verificar-planes')
+@click.option('--usar-bd', is_flag=True, help='Usa la base de datos configurada en vez de un esquema vacío en memoria.')
+@with_appcontext
+def verificar_planes_command(usar_bd):
+    """Revisa con EXPLAIN QUERY PLAN que las consultas frecuentes usen índices."""
+    if usar_bd:
+        engine = db.engine
+    else:
+        engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+        db.metadata.create_all(engine)
+
+    if engine.dialect.name != 'sqlite':
+        print(f"EXPLAIN QUERY PLAN solo se verifica en SQLite (motor actual: {engine.dialect.name}).")
+        return
+
+    fallos = 0
+    for nombre, filas, ok in verificar_planes(engine):
+        print(f"[{'OK' if ok else 'FALLA'}] {nombre}")
+        for detalle in filas:
+            print(f"    {detalle}")
+        if not ok:
+            fallos += 1
+
+    if fallos:
+        print(f"{fallos} consulta(s) recorren la tabla 'user' completa.")
+        sys.exit(1)
+    print("Todas las consultas frecuentes usan índices.")
@@ -0,0 +1,332 @@
+# presupuesto_consultas.py
+# Presupuesto de consultas SQL por ruta y detección de N+1.
+#
+# Recorre todas las rutas GET registradas (blueprints incluidos) con el cliente
+# de pruebas de Flask, con sesión de Superuser y una base de datos con datos de
+# ejemplo, y cuenta las sentencias SQL que ejecuta cada petición. Falla si:
+#   - una ruta ejecuta más consultas que su presupuesto guardado en
+#     presupuesto_consultas.json, o
+#   - una misma sentencia (normalizada: sin literales y con las listas IN
+#     colapsadas) se repite UMBRAL_REPETIDAS veces o más en una petición, que es
+#     la huella de un N+1 (p. ej. recorrer User.oauth_logins o OAuthSignIn.user
+#     en un bucle de plantilla).
+# El informe lista las sentencias culpables de cada ruta. Una ruta que no se
+# puede construir porque falta un valor de ejemplo para sus parámetros también
+# cuenta como fallo: añádelo a VALORES_PARAMETROS o a _valores_de_ejemplo.
+#
+# Cada ruta se pide dos veces y se cuenta la segunda, con las cachés ya
+# calientes (sesión, última versión, conteo de contactos), para que el número
+# sea estable entre ejecuciones.
+#
+# Uso:
+#   flask verificar-consultas                 # base SQLite en memoria con datos de ejemplo
+#   flask verificar-consultas --usar-bd       # la base de datos configurada (DATABASE_URL)
+#   flask verificar-consultas --actualizar    # guarda los conteos actuales como presupuesto
+#   flask verificar-consultas -r contactos.ver_contactos -v
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
+
+from models import db, User, OAuthSignIn, AboutUs, SubidaPorPartes
+from busqueda import asegurar_indice_fts
+from lecturas_bd import BIND_LECTURA
+
+ARCHIVO_PRESUPUESTO = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'presupuesto_consultas.json')
+UMBRAL_REPETIDAS = 3
+
+# Rutas que no se recorren: archivos estáticos, proveedores OAuth externos y
+# las que cierran la sesión de la prueba.
+ENDPOINTS_EXCLUIDOS = {'static', 'logout', 'oauth_bp.login', 'oauth_bp.authorize'}
+
+# Valores para los parámetros de las rutas que no salen de los datos de ejemplo
+VALORES_PARAMETROS = {
+    'format': 'xls',
+    'format_type': 'xls',
+    'lang': 'es',
+    'theme': 'light',
+    'job_id': 'inexistente',
+    'perfil_id': 'inexistente',
+    'token': 'invalido',
+    'subida_id': 'inexistente',
+    'carpeta': 'files',
+    'nombre': 'inexistente.txt',
+}
+
+# Archivo de ejemplo para /medios y /subidas; con datos de ejemplo se escribe en
+# una carpeta temporal que sustituye a UPLOAD_FILES_FOLDER durante la medición
+CONTENIDO_EJEMPLO = b'Archivo de ejemplo para verificar-consultas\n'
+
+_RE_LISTA_IN = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_RE_NUMERO = re.compile(r'\b\d+\b')
+_RE_CADENA = re.compile(r"'(?:[^']|'')*'")
+_RE_ESPACIOS = re.compile(r'\s+')
+
+
+def normalizar_sentencia(sql):
+    """Forma canónica de una sentencia para agrupar las que solo cambian en sus valores."""
+    sql = _RE_CADENA.sub('?', sql)
+    sql = _RE_NUMERO.sub('?', sql)
+    sql = _RE_LISTA_IN.sub('(?)', sql)
+    return _RE_ESPACIOS.sub(' ', sql).strip()
+
+
+class ContadorConsultas:
+    """Registra las sentencias que ejecuta `engine` en el hilo actual mientras está activo."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.sentencias = []
+        self._hilo = None
+
+    def _al_ejecutar(self, conn, cursor, statement, parameters, context, executemany):
+        if self._hilo == threading.get_ident():
+            self.sentencias.append(statement)
+
+    @contextmanager
+    def contar(self):
+        self.sentencias = []
+        self._hilo = threading.get_ident()
+        event.listen(self.engine, 'before_cursor_execute', self._al_ejecutar)
+        try:
+            yield self
+        finally:
+            event.remove(self.engine, 'before_cursor_execute', self._al_ejecutar)
+            self._hilo = None
+
+    def repetidas(self, umbral=UMBRAL_REPETIDAS):
+        """Lista de (sentencia_normalizada, veces) que aparecen `umbral` veces o más."""
+        conteo = Counter(normalizar_sentencia(s) for s in self.sentencias)
+        return [(sql, veces) for sql, veces in conteo.most_common() if veces >= umbral]
+
+
+@contextmanager
+def _usar_engine(app, engine):
+    """Hace que db.session y db.engine (y el bind de lectura, si existe) usen `engine` temporalmente."""
+    engines = db.engines
+    claves = [None, BIND_LECTURA] if BIND_LECTURA in engines else [None]
+    anteriores = {clave: engines.get(clave) for clave in claves}
+    db.session.remove()
+    for clave in claves:
+        engines[clave] = engine
+    try:
+        yield
+    finally:
+        db.session.remove()
+        engines.update(anteriores)
+
+
+def sembrar_datos():
+    """Crea usuarios (con inicios OAuth), versiones, entradas de 'Acerca de' y una subida completa de ejemplo."""
+    from version import Version
+
+    roles = ['Superuser'] + ['Administrador'] * 2 + ['Usuario Regular'] * 15
+    for i, role in enumerate(roles):
+        usuario = User(
+            username=f'usuario{i}', email=f'usuario{i}@example.com', nombre=f'Nombre{i:02d}',
+            primer_apellido='Apellido', segundo_apellido='Segundo', telefono=f'8800{i:04d}',
+            cedula=f'1-{i:04d}-0000', role=role, fecha_cumpleanos=date(1990, 1, 1 + i % 28),
+        )
+        usuario.oauth_logins.append(OAuthSignIn(provider='google', provider_user_id=f'g{i}'))
+        db.session.add(usuario)
+    for i in range(5):
+        db.session.add(Version(nombre_version=f'Versión {i}', numero_version=f'1.{i}.0',
+                               titulo=f'Cambios {i}', descripcion='<p>Detalle</p>'))
+    for i in range(3):
+        db.session.add(AboutUs(logo_filename='logo.png', title=f'Sección {i}', detail='<p>Texto</p>'))
+    db.session.flush()
+
+    sha256 = hashlib.sha256(CONTENIDO_EJEMPLO).hexdigest()
+    nombre_final = f'{sha256}.txt'
+    with open(os.path.join(current_app.config['UPLOAD_FILES_FOLDER'], nombre_final), 'wb') as f:
+        f.write(CONTENIDO_EJEMPLO)
+    superuser = User.query.filter_by(role='Superuser').first()
+    db.session.add(SubidaPorPartes(
+        id='0' * 32, user_id=superuser.id, nombre_original='ejemplo.txt', extension='txt',
+        categoria='other', tamano=len(CONTENIDO_EJEMPLO), recibido=len(CONTENIDO_EJEMPLO),
+        sha256=sha256, estado='completa', nombre_final=nombre_final,
+    ))
+    db.session.commit()
+
+
+@contextmanager
+def _carpeta_subidas_temporal(app):
+    """Sustituye UPLOAD_FILES_FOLDER por una carpeta temporal para no escribir en la real."""
+    anterior = app.config['UPLOAD_FILES_FOLDER']
+    with tempfile.TemporaryDirectory(prefix='verificar-consultas-') as carpeta:
+        app.config['UPLOAD_FILES_FOLDER'] = carpeta
+        try:
+            yield carpeta
+        finally:
+            app.config['UPLOAD_FILES_FOLDER'] = anterior
+
+
+def _valores_de_ejemplo():
+    """Ids reales para los parámetros <int:...> de las rutas."""
+    from version import Version
+
+    usuario = User.query.filter(User.role != 'Superuser').order_by(User.id).first()
+    version = Version.query.order_by(Version.id).first()
+    aboutus = AboutUs.query.order_by(AboutUs.id).first()
+    subida = SubidaPorPartes.query.filter_by(estado='completa').order_by(SubidaPorPartes.creado).first()
+    valores = dict(VALORES_PARAMETROS)
+    valores['user_id'] = usuario.id if usuario else 1
+    valores['version_id'] = version.id if version else 1
+    valores['aboutus_id'] = aboutus.id if aboutus else 1
+    if subida is not None:
+        valores['subida_id'] = subida.id
+        valores['nombre'] = subida.nombre_final
+    return valores
+
+
+def _rutas_get(app, solo=None):
+    """
+    (endpoint, url) de cada ruta GET. Si falta un valor de ejemplo para algún
+    parámetro, la url es None y el endpoint se informa como fallo.
+    """
+    valores = _valores_de_ejemplo()
+    adaptador = app.url_map.bind('localhost')
+    rutas = []
+    for regla in sorted(app.url_map.iter_rules(), key=lambda r: r.endpoint):
+        if 'GET' not in regla.methods or regla.endpoint in ENDPOINTS_EXCLUIDOS:
+            continue
+        if solo and regla.endpoint not in solo:
+            continue
+        if any(argumento not in valores for argumento in regla.arguments):
+            if not any(e == regla.endpoint for e, _ in rutas):
+                rutas.append((regla.endpoint, None))
+            continue
+        url = adaptador.build(regla.endpoint, {a: valores[a] for a in regla.arguments})
+        # Una URL (p. ej. '/' y '/home' comparten endpoint) por endpoint basta
+        if not any(e == regla.endpoint for e, _ in rutas):
+            rutas.append((regla.endpoint, url))
+    return rutas
+
+
+def medir_rutas(app, engine, solo=None, umbral=UMBRAL_REPETIDAS):
+    """
+    Pide cada ruta GET como Superuser y devuelve una lista de dicts con
+    endpoint, url, status, consultas, repetidas y sentencias.
+    """
+    superuser = User.query.filter_by(role='Superuser').order_by(User.id).first()
+    if superuser is None:
+        raise click.ClickException('La base de datos no tiene ningún Superuser para recorrer las rutas.')
+
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['logged_in'] = True
+        sesion['user_id'] = superuser.id
+        sesion['username'] = superuser.username
+        sesion['role'] = superuser.role
+    # Se suelta la sesión de esta app_context para no compartir la identity map con las peticiones
+    db.session.remove()
+
+    contador = ContadorConsultas(engine)
+    resultados = []
+    for endpoint, url in _rutas_get(app, solo):
+        if url is None:
+            regla = next(r for r in app.url_map.iter_rules() if r.endpoint == endpoint)
+            resultados.append({
+                'endpoint': endpoint, 'url': None, 'status': None, 'consultas': 0,
+                'repetidas': [], 'sentencias': [], 'sin_valores': sorted(regla.arguments),
+            })
+            continue
+        respuesta = cliente.get(url)  # Primera vez: calienta las cachés
+        respuesta.close()
+        with contador.contar():
+            respuesta = cliente.get(url)
+            respuesta.get_data()  # Consume también las respuestas en streaming
+            respuesta.close()
+        resultados.append({
+            'endpoint': endpoint,
+            'url': url,
+            'status': respuesta.status_code,
+            'consultas': len(contador.sentencias),
+            'repetidas': contador.repetidas(umbral),
+            'sentencias': list(contador.sentencias),
+        })
+    return resultados
+
+
+def cargar_presupuesto(ruta=ARCHIVO_PRESUPUESTO):
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def guardar_presupuesto(presupuesto, ruta=ARCHIVO_PRESUPUESTO):
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(presupuesto, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write('\n')
+
+
+@click.command('verificar-consultas')
+@click.option('--usar-bd', is_flag=True, help='Usa la base de datos configurada en vez de una en memoria con datos de ejemplo.')
+@click.option('--actualizar', is_flag=True, help='Guarda los conteos actuales como nuevo presupuesto.')
+@click.option('--ruta', '-r', 'rutas', multiple=True, help='Endpoint a revisar (se puede repetir). Por defecto, todos.')
+@click.option('--umbral-repetidas', default=UMBRAL_REPETIDAS, show_default=True, help='Repeticiones de una misma sentencia que se consideran N+1.')
+@click.option('--verbose', '-v', is_flag=True, help='Muestra todas las sentencias de cada ruta.')
+@with_appcontext
+def verificar_consultas_command(usar_bd, actualizar, rutas, umbral_repetidas, verbose):
+    """Cuenta las consultas SQL de cada ruta GET y falla ante N+1 o si se pasa del presupuesto."""
+    app = current_app._get_current_object()
+
+    if usar_bd:
+        resultados = medir_rutas(app, db.engine, rutas, umbral_repetidas)
+    else:
+        engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+        with _usar_engine(app, engine), _carpeta_subidas_temporal(app):
+            db.metadata.create_all(engine)
+            asegurar_indice_fts(engine)
+            sembrar_datos()
+            resultados = medir_rutas(app, engine, rutas, umbral_repetidas)
+        engine.dispose()
+
+    presupuesto = cargar_presupuesto()
+    if actualizar:
+        presupuesto.update({r['endpoint']: r['consultas'] for r in resultados if r['url'] is not None})
+        guardar_presupuesto(presupuesto)
+        print(f"Presupuesto guardado en {os.path.basename(ARCHIVO_PRESUPUESTO)} ({len(resultados)} rutas).")
+
+    fallos = 0
+    for r in resultados:
+        if r['url'] is None:
+            print(f"[FALLA] {r['endpoint']}: sin valor de ejemplo para {r['sin_valores']}")
+            fallos += 1
+            continue
+        limite = presupuesto.get(r['endpoint'])
+        excedida = limite is not None and r['consultas'] > limite
+        ok = not excedida and not r['repetidas']
+        limite_txt = '-' if limite is None else limite
+        print(f"[{'OK' if ok else 'FALLA'}] {r['endpoint']} {r['url']} ({r['status']}): "
+              f"{r['consultas']} consultas, presupuesto {limite_txt}")
+        if excedida:
+            print(f"    Excede el presupuesto en {r['consultas'] - limite} consulta(s).")
+        for sql, veces in r['repetidas']:
+            print(f"    Posible N+1, {veces} veces: {sql}")
+        if verbose or excedida:
+            for sentencia in r['sentencias']:
+                print(f"      {_RE_ESPACIOS.sub(' ', sentencia).strip()}")
+        if not ok:
+            fallos += 1
+
+    sin_presupuesto = [r['endpoint'] for r in resultados if r['url'] is not None and r['endpoint'] not in presupuesto]
+    if sin_presupuesto:
+        print(f"Rutas sin presupuesto (usa --actualizar): {', '.join(sin_presupuesto)}")
+    if fallos:
+        print(f"{fallos} ruta(s) con exceso de consultas, posibles N+1 o sin valores de ejemplo.")
+        sys.exit(1)
+    print("Todas las rutas están dentro de su presupuesto de consultas.")
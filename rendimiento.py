@@ -0,0 +1,423 @@
+# rendimiento.py
+# Medición de tiempos por petición y página /admin/perf.
+#
+# MedidorWSGI envuelve app.wsgi_app y mide cada petición completa, incluida la
+# iteración de respuestas en streaming (exportaciones vCard/Excel). Por petición
+# guarda el tiempo total, el número de consultas SQL y su tiempo (eventos
+# before/after_cursor_execute de SQLAlchemy), el tiempo de render de plantillas
+# (señales de Flask) y los bytes enviados. Los registros recientes van a un
+# buffer circular (deque) y cada endpoint acumula un histograma logarítmico al
+# estilo HDR (error relativo < 2 %) del que salen p50/p90/p99.
+#
+# Con PERF_PROFILE='cprofile' (o 'pyinstrument', si está instalado) se perfila
+# cada petición y se guarda el informe solo de las que superan
+# PERF_PROFILE_THRESHOLD_MS. Tiene costo: activarlo solo para investigar.
+#
+# Página: /admin/perf (Superuser), JSON: /admin/perf/datos
+import cProfile
+import io
+import pstats
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+
+from flask import Blueprint, abort, current_app, flash, jsonify, redirect, render_template, request, session, url_for
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+rendimiento_bp = Blueprint('rendimiento', __name__, url_prefix='/admin/perf')
+
+# Métricas de la petición en curso (una por hilo/contexto)
+_medicion_actual = ContextVar('medicion_actual', default=None)
+
+
+def role_required(roles):
+    """
+    Decorador para restringir el acceso a rutas basadas en roles.
+    `roles` puede ser una cadena (un solo rol) o una lista de cadenas (múltiples roles).
+    """
+    if not isinstance(roles, list):
+        roles = [roles]
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'logged_in' not in session or not session['logged_in']:
+                flash('Por favor, inicia sesión para acceder a esta página.', 'info')
+                return redirect(url_for('login'))
+
+            user_role = session.get('role')
+            if user_role not in roles:
+                flash('No tienes permiso para acceder a esta página.', 'danger')
+                return redirect(url_for('home'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+# --- HISTOGRAMA ---
+
+class HistogramaHDR:
+    """
+    Histograma log-lineal de valores enteros (microsegundos): cada potencia de 2 se
+    divide en SUBCUBETAS cubetas lineales, así el percentil sale con error relativo
+    menor a 1/SUBCUBETAS sin guardar cada muestra.
+    """
+    SUBCUBETAS = 64
+
+    def __init__(self):
+        self.cubetas = {}
+        self.total = 0
+        self.maximo = 0
+        self.suma = 0
+
+    def _indice(self, valor):
+        if valor < self.SUBCUBETAS:
+            return (0, valor)
+        exponente = valor.bit_length() - 7  # 64 = 2**6 -> 7 bits
+        return (exponente + 1, (valor >> exponente) - self.SUBCUBETAS)
+
+    def _valor(self, indice):
+        exponente, sub = indice
+        if exponente == 0:
+            return sub
+        return (sub + self.SUBCUBETAS) << (exponente - 1)
+
+    def registrar(self, valor):
+        valor = max(0, int(valor))
+        indice = self._indice(valor)
+        self.cubetas[indice] = self.cubetas.get(indice, 0) + 1
+        self.total += 1
+        self.suma += valor
+        self.maximo = max(self.maximo, valor)
+
+    def percentil(self, p):
+        if not self.total:
+            return 0
+        objetivo = max(1, int(round(self.total * p / 100.0)))
+        acumulado = 0
+        for indice in sorted(self.cubetas):
+            acumulado += self.cubetas[indice]
+            if acumulado >= objetivo:
+                return min(self._valor(indice), self.maximo)
+        return self.maximo
+
+    def media(self):
+        return self.suma / self.total if self.total else 0
+
+
+# --- REGISTRO ---
+
+class RegistroRendimiento:
+    """Buffer circular de peticiones recientes e histogramas por endpoint (compartido por los hilos)."""
+
+    def __init__(self, tamano=5000, max_perfiles=20):
+        self.recientes = deque(maxlen=tamano)
+        self.perfiles = deque(maxlen=max_perfiles)
+        self.endpoints = {}  # endpoint -> {'wall': HistogramaHDR, 'sql': HistogramaHDR, ...}
+        self.desde = datetime.utcnow()
+        self._lock = threading.Lock()
+
+    def registrar(self, medicion):
+        with self._lock:
+            self.recientes.append(medicion)
+            stats = self.endpoints.get(medicion['endpoint'])
+            if stats is None:
+                stats = self.endpoints[medicion['endpoint']] = {
+                    'wall': HistogramaHDR(), 'sql_ms': HistogramaHDR(), 'plantilla': HistogramaHDR(),
+                    'consultas': 0, 'bytes': 0, 'errores': 0,
+                }
+            stats['wall'].registrar(medicion['wall_ms'] * 1000)
+            stats['sql_ms'].registrar(medicion['sql_ms'] * 1000)
+            stats['plantilla'].registrar(medicion['plantilla_ms'] * 1000)
+            stats['consultas'] += medicion['consultas']
+            stats['bytes'] += medicion['bytes']
+            if medicion['status'] >= 500:
+                stats['errores'] += 1
+
+    def guardar_perfil(self, medicion, informe):
+        with self._lock:
+            self.perfiles.appendleft({'id': uuid.uuid4().hex[:12], 'medicion': medicion, 'informe': informe})
+
+    def resumen(self):
+        """Estadísticas por endpoint (milisegundos), ordenadas por p99 descendente."""
+        with self._lock:
+            filas = []
+            for endpoint, stats in self.endpoints.items():
+                n = stats['wall'].total
+                filas.append({
+                    'endpoint': endpoint,
+                    'peticiones': n,
+                    'p50_ms': stats['wall'].percentil(50) / 1000,
+                    'p90_ms': stats['wall'].percentil(90) / 1000,
+                    'p99_ms': stats['wall'].percentil(99) / 1000,
+                    'max_ms': stats['wall'].maximo / 1000,
+                    'sql_p50_ms': stats['sql_ms'].percentil(50) / 1000,
+                    'sql_p99_ms': stats['sql_ms'].percentil(99) / 1000,
+                    'consultas_media': stats['consultas'] / n if n else 0,
+                    'plantilla_p50_ms': stats['plantilla'].percentil(50) / 1000,
+                    'bytes_media': stats['bytes'] / n if n else 0,
+                    'errores': stats['errores'],
+                })
+        return sorted(filas, key=lambda f: f['p99_ms'], reverse=True)
+
+    def limpiar(self):
+        with self._lock:
+            self.recientes.clear()
+            self.perfiles.clear()
+            self.endpoints.clear()
+            self.desde = datetime.utcnow()
+
+
+# --- MEDICIÓN ---
+
+def _antes_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    medicion = _medicion_actual.get()
+    if medicion is not None:
+        conn.info.setdefault('perf_inicio', []).append(time.perf_counter())
+
+
+def _despues_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    medicion = _medicion_actual.get()
+    inicios = conn.info.get('perf_inicio')
+    if medicion is not None and inicios:
+        medicion['consultas'] += 1
+        medicion['sql_ms'] += (time.perf_counter() - inicios.pop()) * 1000
+
+
+def _antes_de_plantilla(sender, template, context, **extra):
+    medicion = _medicion_actual.get()
+    if medicion is not None:
+        medicion['_plantilla_inicio'].append(time.perf_counter())
+
+
+def _plantilla_renderizada(sender, template, context, **extra):
+    medicion = _medicion_actual.get()
+    if medicion is not None and medicion['_plantilla_inicio']:
+        inicio = medicion['_plantilla_inicio'].pop()
+        if not medicion['_plantilla_inicio']:  # Solo el render exterior, sin contar dos veces los anidados
+            medicion['plantilla_ms'] += (time.perf_counter() - inicio) * 1000
+
+
+# Solo puede haber un perfilador activo por proceso (cProfile lo exige desde Python 3.12);
+# las peticiones que llegan mientras otra se está perfilando solo se miden.
+_perfilador_lock = threading.Lock()
+
+
+class _Perfilador:
+    """Envoltorio común para cProfile y pyinstrument."""
+
+    def __init__(self, tipo):
+        self.tipo = tipo
+        if tipo == 'pyinstrument':
+            from pyinstrument import Profiler
+            self._perfil = Profiler()
+        else:
+            self._perfil = cProfile.Profile()
+
+    def iniciar(self):
+        """Devuelve False si ya hay otra petición perfilándose."""
+        if not _perfilador_lock.acquire(blocking=False):
+            return False
+        try:
+            if self.tipo == 'pyinstrument':
+                self._perfil.start()
+            else:
+                self._perfil.enable()
+        except Exception:
+            _perfilador_lock.release()
+            raise
+        return True
+
+    def detener(self):
+        try:
+            if self.tipo == 'pyinstrument':
+                self._perfil.stop()
+            else:
+                self._perfil.disable()
+        finally:
+            _perfilador_lock.release()
+
+    def informe(self):
+        if self.tipo == 'pyinstrument':
+            return self._perfil.output_text(unicode=True, color=False)
+        salida = io.StringIO()
+        pstats.Stats(self._perfil, stream=salida).sort_stats('cumulative').print_stats(40)
+        return salida.getvalue()
+
+
+class _RespuestaMedida:
+    """Iterable que cuenta los bytes enviados y cierra la medición cuando el servidor termina."""
+
+    def __init__(self, iterable, cerrar):
+        self._iterable = iterable
+        self._cerrar = cerrar
+        self.bytes = 0
+
+    def __iter__(self):
+        for bloque in self._iterable:
+            self.bytes += len(bloque)
+            yield bloque
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, 'close'):
+                self._iterable.close()
+        finally:
+            self._cerrar(self.bytes)
+
+
+class MedidorWSGI:
+    """Middleware WSGI que mide cada petición y la guarda en el RegistroRendimiento."""
+
+    def __init__(self, wsgi_app, app, registro):
+        self.wsgi_app = wsgi_app
+        self.app = app
+        self.registro = registro
+
+    def __call__(self, environ, start_response):
+        config = self.app.config
+        medicion = {
+            'inicio': datetime.utcnow().isoformat(timespec='seconds'),
+            'metodo': environ.get('REQUEST_METHOD'),
+            'ruta': environ.get('PATH_INFO'),
+            'endpoint': None,
+            'status': 0,
+            'wall_ms': 0.0,
+            'consultas': 0,
+            'sql_ms': 0.0,
+            'plantilla_ms': 0.0,
+            'bytes': 0,
+            '_plantilla_inicio': [],
+        }
+        environ['rendimiento.medicion'] = medicion
+        token = _medicion_actual.set(medicion)
+
+        perfilador = None
+        if config.get('PERF_PROFILE'):
+            perfilador = _Perfilador(config['PERF_PROFILE'])
+            if not perfilador.iniciar():
+                perfilador = None
+
+        inicio = time.perf_counter()
+
+        def _start_response(status, headers, exc_info=None):
+            medicion['status'] = int(status.split(' ', 1)[0])
+            return start_response(status, headers, exc_info)
+
+        def _cerrar(bytes_enviados):
+            medicion['wall_ms'] = (time.perf_counter() - inicio) * 1000
+            medicion['bytes'] = bytes_enviados
+            medicion['endpoint'] = medicion['endpoint'] or (
+                'static' if (medicion['ruta'] or '').startswith('/static/') else '(sin endpoint)'
+            )
+            medicion.pop('_plantilla_inicio', None)
+            if perfilador is not None:
+                perfilador.detener()
+                if medicion['wall_ms'] >= config.get('PERF_PROFILE_THRESHOLD_MS', 1000):
+                    self.registro.guardar_perfil(dict(medicion), perfilador.informe())
+            self.registro.registrar(medicion)
+            if medicion['wall_ms'] >= config.get('PERF_SLOW_MS', 500):
+                self.app.logger.warning(
+                    "Petición lenta: %s %s (%s) %.0f ms, %d consultas SQL (%.0f ms)",
+                    medicion['metodo'], medicion['ruta'], medicion['endpoint'],
+                    medicion['wall_ms'], medicion['consultas'], medicion['sql_ms']
+                )
+            try:
+                _medicion_actual.reset(token)
+            except ValueError:
+                # El servidor cerró la respuesta desde otro contexto
+                _medicion_actual.set(None)
+
+        try:
+            respuesta = self.wsgi_app(environ, _start_response)
+        except Exception:
+            medicion['status'] = 500
+            _cerrar(0)
+            raise
+        return _RespuestaMedida(respuesta, _cerrar)
+
+
+def _anotar_endpoint():
+    medicion = request.environ.get('rendimiento.medicion')
+    if medicion is not None:
+        medicion['endpoint'] = request.endpoint
+
+
+def init_rendimiento(app):
+    """Instala el middleware, los eventos de SQLAlchemy/plantillas y el blueprint."""
+    if not app.config.get('PERF_ENABLED', True):
+        return None
+    registro = RegistroRendimiento(
+        tamano=app.config.get('PERF_RING_SIZE', 5000),
+        max_perfiles=app.config.get('PERF_PROFILE_MAX', 20),
+    )
+    app.extensions['rendimiento'] = registro
+    app.wsgi_app = MedidorWSGI(app.wsgi_app, app, registro)
+    app.before_request(_anotar_endpoint)
+
+    if not event.contains(Engine, 'before_cursor_execute', _antes_de_consulta):
+        event.listen(Engine, 'before_cursor_execute', _antes_de_consulta)
+        event.listen(Engine, 'after_cursor_execute', _despues_de_consulta)
+    before_render_template.connect(_antes_de_plantilla, app)
+    template_rendered.connect(_plantilla_renderizada, app)
+
+    app.register_blueprint(rendimiento_bp)
+    return registro
+
+
+def _registro():
+    registro = current_app.extensions.get('rendimiento')
+    if registro is None:
+        abort(404)
+    return registro
+
+
+# --- RUTAS ---
+
+@rendimiento_bp.route('/')
+@role_required('Superuser')
+def ver_rendimiento():
+    registro = _registro()
+    recientes = list(registro.recientes)[-50:][::-1]
+    lentas = sorted(registro.recientes, key=lambda m: m['wall_ms'], reverse=True)[:20]
+    return render_template('admin_perf.html', resumen=registro.resumen(), recientes=recientes,
+                           lentas=lentas, perfiles=list(registro.perfiles), desde=registro.desde,
+                           perfilador=current_app.config.get('PERF_PROFILE'))
+
+
+@rendimiento_bp.route('/datos')
+@role_required('Superuser')
+def datos_rendimiento():
+    registro = _registro()
+    # Entre 1 y el tamaño del anillo; un valor no numérico usa el de por defecto
+    limite = request.args.get('limite', 100, type=int)
+    limite = max(1, min(limite, registro.recientes.maxlen or len(registro.recientes) or 1))
+    return jsonify({
+        'desde': registro.desde.isoformat(),
+        'endpoints': registro.resumen(),
+        'recientes': list(registro.recientes)[-limite:],
+        'perfiles': [{'id': p['id'], 'medicion': p['medicion']} for p in registro.perfiles],
+    })
+
+
+@rendimiento_bp.route('/perfil/<perfil_id>')
+@role_required('Superuser')
+def ver_perfil(perfil_id):
+    for perfil in _registro().perfiles:
+        if perfil['id'] == perfil_id:
+            return current_app.response_class(perfil['informe'], mimetype='text/plain; charset=utf-8')
+    abort(404)
+
+
+@rendimiento_bp.route('/limpiar', methods=['POST'])
+@role_required('Superuser')
+def limpiar_rendimiento():
+    _registro().limpiar()
+    flash('Métricas de rendimiento reiniciadas.', 'success')
+    return redirect(url_for('rendimiento.ver_rendimiento'))
@@ -0,0 +1,266 @@
+# roles.py
+# Contadores de usuarios por rol y reglas de Superusers.
+#
+# La tabla 'role_counts' guarda cuántos usuarios tiene cada rol. Los eventos
+# after_insert, before_update y before_delete de User la actualizan en la misma
+# transacción que el cambio del usuario, así que leer el número de Superusers
+# es una búsqueda por clave primaria en vez de un COUNT(*) sobre 'user'.
+#
+# Las reglas "máximo 2 / mínimo 1 Superuser" se aplican dentro del mismo UPDATE
+# del contador (UPDATE ... WHERE total + delta <= máximo). Si la condición no se
+# cumple no se modifica ninguna fila, se lanza RolInvarianteError y el flush se
+# aborta: no hay una lectura previa que otro administrador pueda adelantar.
+# El rol anterior de un usuario tampoco se toma de lo que el ORM cargó al
+# principio de la petición: se vuelve a leer con el bloqueo de escritura ya
+# tomado (bloquear_contadores), así dos cambios simultáneos sobre el mismo
+# usuario no descuadran los contadores.
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, event, false, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, RoleCount, AppSetting
+from motor_bd import savepoint
+
+ROL_SUPERUSER = 'Superuser'
+ROLES_VALIDOS = ['Usuario Regular', 'Administrador', 'Superuser']
+MAX_SUPERUSERS = 2
+MIN_SUPERUSERS = 1
+
+MENSAJE_MAX_SUPERUSERS = f'No se pueden asignar más de {MAX_SUPERUSERS} Superusers. Cambia el rol de otro Superuser primero.'
+MENSAJE_MIN_SUPERUSERS = 'No se puede quitar el último Superuser. Debe haber al menos un Superuser en el sistema.'
+
+
+class RolInvarianteError(Exception):
+    """El cambio dejaría el sistema con más o menos Superusers de los permitidos."""
+    pass
+
+
+def ajustar_conteo_rol(connection, role, delta):
+    """
+    Suma `delta` al contador de `role` usando `connection` (la de la transacción en curso).
+    Para Superuser el UPDATE solo se aplica si el total resultante respeta los límites;
+    si no, lanza RolInvarianteError.
+    """
+    if not role or not delta:
+        return
+    tabla = RoleCount.__table__
+    condicion = tabla.c.role == role
+    if role == ROL_SUPERUSER:
+        if delta > 0:
+            condicion = and_(condicion, tabla.c.total + delta <= MAX_SUPERUSERS)
+        else:
+            condicion = and_(condicion, tabla.c.total + delta >= MIN_SUPERUSERS)
+
+    resultado = connection.execute(tabla.update().where(condicion).values(total=tabla.c.total + delta))
+    if resultado.rowcount:
+        return
+
+    # No se actualizó nada: o el rol aún no tiene fila, o se rompería una regla
+    existe = connection.execute(select(tabla.c.total).where(tabla.c.role == role)).first()
+    if existe is None and delta > 0 and (role != ROL_SUPERUSER or delta <= MAX_SUPERUSERS):
+        connection.execute(tabla.insert().values(role=role, total=delta))
+        return
+    if role == ROL_SUPERUSER:
+        raise RolInvarianteError(MENSAJE_MAX_SUPERUSERS if delta > 0 else MENSAJE_MIN_SUPERUSERS)
+
+
+def bloquear_contadores(connection):
+    """
+    Toma el bloqueo de escritura de la transacción de `connection` antes de leer roles guardados.
+    En SQLite un SELECT no bloquea nada: este UPDATE no modifica filas, pero hace esperar a
+    los demás escritores hasta el commit, así que lo que se lea después ya no puede cambiar.
+    """
+    tabla = RoleCount.__table__
+    connection.execute(tabla.update().where(false()).values(total=tabla.c.total))
+
+
+def rol_guardado(connection, user_id):
+    """Rol de `user_id` tal como está en la base (FOR UPDATE en los motores que lo admiten)."""
+    return connection.execute(
+        select(User.role).where(User.id == user_id).with_for_update()
+    ).scalar()
+
+
+def recalcular_conteos_roles(connection=None):
+    """Reconstruye 'role_counts' desde la tabla 'user' (por ejemplo tras cambios hechos fuera del ORM)."""
+    connection = connection or db.session.connection()
+    tabla = RoleCount.__table__
+    conteos = connection.execute(
+        select(User.role, db.func.count()).group_by(User.role)
+    ).all()
+    connection.execute(tabla.delete())
+    if conteos:
+        connection.execute(tabla.insert(), [{'role': role, 'total': total} for role, total in conteos])
+
+
+def contar_rol(role):
+    """Devuelve el número de usuarios con `role` según el contador (sin COUNT(*) sobre 'user')."""
+    total = db.session.execute(
+        select(RoleCount.total).where(RoleCount.role == role)
+    ).scalar()
+    return total or 0
+
+
+def aplicar_cambios_de_rol(cambios, usuario_actual_id=None):
+    """
+    Aplica en lote una lista de cambios [{'user_id': ..., 'new_role': ...}, ...].
+
+    1. Toma el bloqueo de escritura y valida todas las filas en una pasada (una sola
+       consulta para cargar los usuarios): los roles leídos no pueden cambiar hasta el commit.
+    2. Calcula el efecto neto sobre cada contador de rol y lo aplica con un UPDATE
+       condicionado por rol (las reglas de Superusers se comprueban sobre el total final,
+       así que intercambiar dos Superusers en el mismo lote es válido).
+    3. Actualiza los usuarios con un único executemany, en la misma transacción.
+
+    Devuelve (resultados, aplicados). Cada resultado es un dict con user_id, new_role,
+    estado ('actualizado', 'sin_cambios' o 'error') y mensaje. Si el lote rompería las
+    reglas de Superusers lanza RolInvarianteError y no se aplica nada.
+    """
+    resultados = []
+    validos = {}  # user_id -> índice en resultados
+
+    ids = set()
+    for cambio in cambios:
+        try:
+            ids.add(int(cambio.get('user_id')))
+        except (AttributeError, TypeError, ValueError):
+            pass
+    connection = db.session.connection()
+    roles_actuales = {}
+    if ids:
+        bloquear_contadores(connection)
+        roles_actuales = dict(db.session.execute(
+            select(User.id, User.role).where(User.id.in_(ids)).with_for_update()
+        ).all())
+
+    for cambio in cambios:
+        if not isinstance(cambio, dict):
+            resultados.append({'user_id': None, 'new_role': None, 'estado': 'error', 'mensaje': 'Formato de cambio no válido.'})
+            continue
+        new_role = cambio.get('new_role')
+        resultado = {'user_id': cambio.get('user_id'), 'new_role': new_role, 'estado': 'error', 'mensaje': None}
+        resultados.append(resultado)
+        try:
+            user_id = int(cambio.get('user_id'))
+        except (TypeError, ValueError):
+            resultado['mensaje'] = 'ID de usuario no válido.'
+            continue
+        resultado['user_id'] = user_id
+
+        if new_role not in ROLES_VALIDOS:
+            resultado['mensaje'] = 'Rol no válido.'
+        elif user_id not in roles_actuales:
+            resultado['mensaje'] = 'Usuario no encontrado.'
+        elif user_id in validos:
+            resultado['mensaje'] = 'El usuario aparece más de una vez en el lote.'
+        elif (usuario_actual_id is not None and str(usuario_actual_id) == str(user_id)
+              and roles_actuales[user_id] == ROL_SUPERUSER and new_role != ROL_SUPERUSER):
+            resultado['mensaje'] = 'No puedes cambiar tu propio rol de Superuser a otro rol.'
+        elif roles_actuales[user_id] == new_role:
+            resultado['estado'] = 'sin_cambios'
+        else:
+            resultado['estado'] = 'actualizado'
+            validos[user_id] = len(resultados) - 1
+
+    if not validos:
+        return resultados, 0
+
+    deltas = Counter()
+    for user_id in validos:
+        deltas[roles_actuales[user_id]] -= 1
+        deltas[resultados[validos[user_id]]['new_role']] += 1
+
+    for role, delta in deltas.items():
+        ajustar_conteo_rol(connection, role, delta)
+
+    # UPDATE masivo por clave primaria (executemany); no dispara los eventos de User,
+    # por eso los contadores se ajustaron arriba. fecha_actualizacion invalida la caché de vCards.
+    ahora = datetime.utcnow()
+    db.session.execute(
+        update(User),
+        [{'id': user_id, 'role': resultados[indice]['new_role'], 'fecha_actualizacion': ahora}
+         for user_id, indice in validos.items()]
+    )
+    return resultados, len(validos)
+
+
+# --- PRIMER SUPERUSER ---
+# El primer usuario que se registra queda como Superuser. En vez de contar usuarios
+# en cada petición, el "reclamo" es una fila en app_settings con clave primaria fija:
+# solo un INSERT puede tener éxito, aunque lleguen dos registros a la vez o desde
+# procesos distintos. La migración crea la fila si la base ya tenía usuarios.
+CLAVE_PRIMER_SUPERUSER = 'primer_superuser'
+
+_primer_superuser_reclamado = False  # Caché del proceso: una vez True no se vuelve a consultar
+
+
+def reclamar_primer_superuser(username):
+    """
+    Intenta reservar el rol de primer Superuser para `username`.
+    Devuelve True si lo consiguió; el reclamo queda pendiente en la sesión y se
+    guarda (o se descarta) con el mismo commit que crea al usuario.
+    El INSERT va en un savepoint: si falla solo se deshace el reclamo, no los
+    demás cambios pendientes de la sesión.
+    """
+    global _primer_superuser_reclamado
+    if _primer_superuser_reclamado:
+        return False
+    try:
+        with savepoint():
+            db.session.add(AppSetting(clave=CLAVE_PRIMER_SUPERUSER, valor=username))
+        return True
+    except IntegrityError:
+        _primer_superuser_reclamado = True
+        return False
+
+
+@click.command('recalcular-roles')
+@with_appcontext
+def recalcular_roles_command():
+    """Reconstruye los contadores de 'role_counts' a partir de la tabla 'user'."""
+    recalcular_conteos_roles()
+    db.session.commit()
+    for role_count in RoleCount.query.order_by(RoleCount.role).all():
+        print(f"{role_count.role}: {role_count.total}")
+
+
+# --- EVENTOS DE USER ---
+
+def _rol_anterior(connection, target):
+    """
+    Rol con el que el usuario está guardado, leído con el bloqueo de escritura tomado.
+    No se usa el historial del atributo: viene de un SELECT anterior, sin bloqueo, y
+    otra petición puede haber cambiado el rol desde entonces.
+    """
+    bloquear_contadores(connection)
+    return rol_guardado(connection, target.id)
+
+
+def _contar_insercion(mapper, connection, target):
+    ajustar_conteo_rol(connection, target.role, 1)
+
+
+def _contar_actualizacion(mapper, connection, target):
+    historial = inspect(target).attrs.role.history
+    if not historial.added:
+        return
+    rol_nuevo = target.role
+    rol_anterior = _rol_anterior(connection, target)
+    if rol_anterior == rol_nuevo:
+        return
+    # Primero se suma al rol nuevo: si es Superuser y ya hay el máximo, falla antes de tocar el otro
+    ajustar_conteo_rol(connection, rol_nuevo, 1)
+    ajustar_conteo_rol(connection, rol_anterior, -1)
+
+
+def _contar_eliminacion(mapper, connection, target):
+    ajustar_conteo_rol(connection, _rol_anterior(connection, target), -1)
+
+
+event.listen(User, 'after_insert', _contar_insercion)
+event.listen(User, 'before_update', _contar_actualizacion)  # Antes de escribir, para poder leer el rol guardado
+event.listen(User, 'before_delete', _contar_eliminacion)
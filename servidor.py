@@ -0,0 +1,226 @@
+# servidor.py
+# Servidor de producción con modelo prefork.
+#
+# El proceso maestro crea la app con create_app(), precarga los módulos que se
+# importan de forma diferida (exportaciones, OAuth) si SERVER_PRELOAD_EXPORTS
+# está activo, abre el socket y luego hace fork de SERVER_WORKERS procesos. Antes
+# del fork llama a gc.freeze(): los objetos ya creados pasan a una generación
+# permanente que el recolector no recorre, así no escribe en sus cabeceras y las
+# páginas de memoria se siguen compartiendo copy-on-write entre los workers.
+#
+# Cada worker atiende el socket compartido con un pool de SERVER_THREADS hilos.
+# Tras el fork, el worker descarta (sin cerrarlas) las conexiones del pool de
+# SQLAlchemy heredadas del maestro y abre las suyas. Los pools de hilos de
+# bcrypt, miniaturas y exportaciones ya se crean por PID.
+#
+# El maestro vuelve a crear los workers que terminan (caída o reciclaje tras
+# SERVER_MAX_REQUESTS peticiones). SIGTERM/SIGINT apaga todo ordenadamente:
+# cada worker termina las peticiones en curso.
+#
+# Con ASSETS_WATCHER, el maestro crea además un proceso con el vigilante de las
+# carpetas de subida (vigilante_activos.py), también se recrea si termina, y
+# los workers ya no escanean el disco en las peticiones.
+#
+# Uso:
+#   python servidor.py
+#   python servidor.py --workers 4 --threads 8 --port 8000
+import os
+import gc
+import sys
+import time
+import signal
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from app import create_app
+from models import db
+from vigilante_activos import ejecutar_vigilante
+from trabajos import recuperar_trabajos_interrumpidos
+
+# Módulos que la app importa al primer uso; en el maestro se cargan una sola vez para todos
+MODULOS_PRECARGA = ('pandas', 'openpyxl', 'reportlab.platypus', 'PIL.Image', 'vobject',
+                    'authlib.integrations.flask_client')
+
+
+class ManejadorSilencioso(WSGIRequestHandler):
+    """No escribe una línea de log por petición (las métricas están en /admin/perf)."""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class ServidorWorker(BaseWSGIServer):
+    """Servidor WSGI de Werkzeug que atiende cada conexión en un pool acotado de hilos."""
+
+    multithread = True
+
+    def __init__(self, host, port, app, hilos, max_peticiones=0, registrar_peticiones=False):
+        super().__init__(host, port, app, handler=None if registrar_peticiones else ManejadorSilencioso)
+        self.hilos = hilos
+        self.max_peticiones = max_peticiones
+        self.atendidas = 0
+        self._pool = None
+        self._contador_lock = threading.Lock()
+        # Varios procesos esperan en el mismo socket: si otro worker se adelanta
+        # con accept(), este recibe BlockingIOError y vuelve a esperar
+        self.socket.setblocking(False)
+
+    def iniciar_pool(self):
+        self._pool = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='http')
+
+    def process_request(self, request, client_address):
+        request.setblocking(True)
+        self._pool.submit(self._atender, request, client_address)
+
+    def _atender(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+        if self.max_peticiones:
+            with self._contador_lock:
+                self.atendidas += 1
+                reciclar = self.atendidas == self.max_peticiones
+            if reciclar:
+                threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def detener_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+
+def _descartar_conexiones_heredadas(app):
+    """En el worker: olvida las conexiones abiertas por el maestro sin cerrarlas (siguen siendo suyas)."""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def _precargar(app):
+    """Trabajo que conviene hacer una vez en el maestro, antes del fork."""
+    if app.config.get('SERVER_PRELOAD_EXPORTS', True):
+        import importlib
+        for modulo in MODULOS_PRECARGA:
+            try:
+                importlib.import_module(modulo)
+            except ImportError:
+                pass
+    with app.app_context():
+        recuperar_trabajos_interrumpidos() # Los pools de exportación del arranque anterior ya no existen
+        for engine in db.engines.values():
+            engine.dispose()  # El maestro no atiende peticiones: que no pase conexiones abiertas a los hijos
+    gc.collect()
+    gc.freeze()
+
+
+def _ejecutar_worker(servidor, app):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C lo gestiona el maestro
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=servidor.shutdown, daemon=True).start())
+    _descartar_conexiones_heredadas(app)
+    servidor.iniciar_pool()
+    try:
+        servidor.serve_forever(poll_interval=0.5)
+    finally:
+        servidor.detener_pool()
+    os._exit(0)
+
+
+def _crear_worker(servidor, app):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _ejecutar_worker(servidor, app)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def _crear_vigilante(app):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            _descartar_conexiones_heredadas(app)
+            ejecutar_vigilante(app) # Termina con SIGTERM
+            os._exit(0)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def main(argv=None):
+    app = create_app()
+    config = app.config
+
+    parser = argparse.ArgumentParser(description='Servidor prefork de la aplicación')
+    parser.add_argument('--host', default=config.get('SERVER_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=config.get('SERVER_PORT', 3030))
+    parser.add_argument('--workers', type=int, default=config.get('SERVER_WORKERS', os.cpu_count() or 2))
+    parser.add_argument('--threads', type=int, default=config.get('SERVER_THREADS', 4))
+    parser.add_argument('--max-requests', type=int, default=config.get('SERVER_MAX_REQUESTS', 0))
+    parser.add_argument('--access-log', action='store_true', help='Una línea de log por petición')
+    parser.add_argument('--no-watcher', action='store_true', help='No arranca el vigilante de las carpetas de subida')
+    args = parser.parse_args(argv)
+
+    _precargar(app)
+    servidor = ServidorWorker(args.host, args.port, app, args.threads, args.max_requests, args.access_log)
+    servidor.multiprocess = args.workers > 1
+
+    con_vigilante = config.get('ASSETS_WATCHER', True) and not args.no_watcher
+    config['ASSETS_WATCHER_ACTIVE'] = con_vigilante # Los workers lo heredan al hacer fork
+    workers = set()
+    vigilante = None
+    apagando = False
+
+    def _apagar(*_):
+        nonlocal apagando
+        apagando = True
+        for pid in list(workers) + ([vigilante] if vigilante else []):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _apagar)
+    signal.signal(signal.SIGINT, _apagar)
+
+    for _ in range(args.workers):
+        workers.add(_crear_worker(servidor, app))
+    if con_vigilante:
+        vigilante = _crear_vigilante(app)
+    print(f"Servidor en http://{args.host}:{args.port} (PID {os.getpid()}): "
+          f"{args.workers} workers x {args.threads} hilos", flush=True)
+
+    while workers or vigilante:
+        try:
+            pid, estado = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        es_vigilante = pid == vigilante
+        if es_vigilante:
+            vigilante = None
+        else:
+            workers.discard(pid)
+        if not apagando:
+            codigo = os.waitstatus_to_exitcode(estado)
+            if codigo != 0:
+                print(f"{'Vigilante' if es_vigilante else 'Worker'} {pid} terminó con código {codigo}; se crea otro.", flush=True)
+                time.sleep(1)  # Evita un bucle de reinicios si la app falla al arrancar
+            if es_vigilante:
+                vigilante = _crear_vigilante(app)
+            else:
+                workers.add(_crear_worker(servidor, app))
+
+    servidor.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,509 @@
+# sesiones.py
+# Sesiones guardadas en el servidor.
+#
+# Por defecto Flask guarda toda la sesión (logged_in, user_id, username, role,
+# theme, lang) en una cookie firmada que se vuelve a serializar y firmar en cada
+# respuesta que la toca. Aquí la cookie solo lleva un identificador aleatorio
+# firmado y los datos viven en un almacén con la misma API que redis-py
+# (get, setex, delete, expire, ttl, sadd, smembers, srem):
+#
+#   - AlmacenSQLite: tablas 'sesiones' y 'sesiones_usuario' de la base de la app.
+#   - AlmacenConCache: LRU en memoria delante de cualquier almacén.
+#   - Con SESSION_REDIS_URL se usa un cliente redis.Redis real.
+#
+# Las escrituras de AlmacenSQLite pasan por motor_bd.reintentar_escritura: varios
+# workers guardan sesiones a la vez y SQLite admite un solo escritor.
+#
+# La sesión se lee del almacén solo la primera vez que la petición la usa (los
+# archivos estáticos ni la tocan) y solo se escribe si se modificó. Cada usuario
+# tiene un conjunto con sus sesiones abiertas, así un cambio de rol en
+# admin_manage_roles se aplica a sus sesiones sin que tenga que volver a entrar.
+#
+# El rol no se toma de la copia de la sesión: una petición del mismo usuario que
+# ya la tenía cargada (un flash, change_theme, la marca de lecturas_bd) o la
+# caché de otro worker podrían volver a escribir el rol anterior y deshacer una
+# degradación. El rol vigente se guarda aparte (PREFIJO_ROL + user_id) y se
+# impone al cargar cada sesión; los demás workers lo ven en cuanto vence su
+# caché (SESSION_CACHE_TTL_SECONDS), y la copia vieja ya no puede restaurarlo.
+#
+# SESSION_BACKEND='cookie' vuelve a las cookies firmadas de Flask.
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import delete, literal, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, SesionServidor, SesionUsuario
+from motor_bd import reintentar_escritura
+
+PREFIJO_SESION = 'sesion:'
+PREFIJO_USUARIO = 'usuario:'
+PREFIJO_ROL = 'rol:' # Rol vigente del usuario; manda sobre el guardado en sus sesiones
+
+
+def _segundos(tiempo):
+    return int(tiempo.total_seconds()) if isinstance(tiempo, timedelta) else int(tiempo)
+
+
+def _texto(valor):
+    return valor.decode('utf-8') if isinstance(valor, bytes) else valor
+
+
+# --- ALMACENES ---
+
+class AlmacenSQLite:
+    """Almacén clave/valor con vencimiento sobre las tablas de la base de datos de la app."""
+
+    def get(self, name):
+        with db.engine.connect() as conn:
+            return conn.execute(
+                select(SesionServidor.valor).where(SesionServidor.clave == name, SesionServidor.expira > datetime.utcnow())
+            ).scalar()
+
+    @reintentar_escritura
+    def setex(self, name, time, value):
+        expira = datetime.utcnow() + timedelta(seconds=_segundos(time))
+        value = value.encode('utf-8') if isinstance(value, str) else value
+        actualizar = update(SesionServidor).where(SesionServidor.clave == name).values(valor=value, expira=expira)
+        with db.engine.begin() as conn:
+            if conn.execute(actualizar).rowcount:
+                return True
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(SesionServidor.__table__.insert().values(clave=name, valor=value, expira=expira))
+        except IntegrityError:
+            # Otro proceso la creó entre el UPDATE y el INSERT
+            with db.engine.begin() as conn:
+                conn.execute(actualizar)
+        return True
+
+    @reintentar_escritura
+    def delete(self, *names):
+        if not names:
+            return 0
+        with db.engine.begin() as conn:
+            borradas = conn.execute(delete(SesionServidor).where(SesionServidor.clave.in_(names))).rowcount
+            borradas += conn.execute(delete(SesionUsuario).where(SesionUsuario.conjunto.in_(names))).rowcount
+        return borradas
+
+    @reintentar_escritura
+    def expire(self, name, time):
+        expira = datetime.utcnow() + timedelta(seconds=_segundos(time))
+        with db.engine.begin() as conn:
+            return bool(conn.execute(
+                update(SesionServidor).where(SesionServidor.clave == name).values(expira=expira)
+            ).rowcount)
+
+    def ttl(self, name):
+        """Segundos de vida restantes; -2 si la clave no existe (como en Redis)."""
+        with db.engine.connect() as conn:
+            expira = conn.execute(select(SesionServidor.expira).where(SesionServidor.clave == name)).scalar()
+        if expira is None:
+            return -2
+        restante = int((expira - datetime.utcnow()).total_seconds())
+        return restante if restante > 0 else -2
+
+    @reintentar_escritura
+    def sadd(self, name, *values):
+        with db.engine.begin() as conn:
+            existentes = set(conn.execute(
+                select(SesionUsuario.miembro).where(SesionUsuario.conjunto == name, SesionUsuario.miembro.in_(values))
+            ).scalars())
+            nuevos = [{'conjunto': name, 'miembro': v} for v in values if v not in existentes]
+            if nuevos:
+                conn.execute(SesionUsuario.__table__.insert(), nuevos)
+        return len(nuevos)
+
+    def smembers(self, name):
+        with db.engine.connect() as conn:
+            return set(conn.execute(select(SesionUsuario.miembro).where(SesionUsuario.conjunto == name)).scalars())
+
+    @reintentar_escritura
+    def srem(self, name, *values):
+        with db.engine.begin() as conn:
+            return conn.execute(
+                delete(SesionUsuario).where(SesionUsuario.conjunto == name, SesionUsuario.miembro.in_(values))
+            ).rowcount
+
+    @reintentar_escritura
+    def barrer_vencidas(self):
+        """Borra en bloque las sesiones vencidas y sus entradas en los conjuntos de usuario."""
+        with db.engine.begin() as conn:
+            borradas = conn.execute(delete(SesionServidor).where(SesionServidor.expira <= datetime.utcnow())).rowcount
+            conn.execute(delete(SesionUsuario).where(
+                (literal(PREFIJO_SESION) + SesionUsuario.miembro).not_in(select(SesionServidor.clave))
+            ))
+        return borradas
+
+
+class AlmacenConCache:
+    """
+    LRU en memoria delante de otro almacén: las lecturas repetidas de la misma sesión
+    no van a la base de datos. Las entradas caducan a los `ttl` segundos para ver los
+    cambios hechos por otros procesos (p. ej. un cambio de rol desde otro worker).
+    También recuerda cuándo vence cada clave que este proceso escribió o extendió, así
+    comprobar en cada petición si hay que extender una sesión no consulta el almacén.
+    """
+
+    def __init__(self, almacen, max_entradas=1000, ttl=5):
+        self.almacen = almacen
+        self.max_entradas = max_entradas
+        self.ttl_cache = ttl
+        self._cache = OrderedDict()  # name -> (valor, instante de caducidad)
+        self._vidas = OrderedDict()  # name -> instante (monotonic) en que vence en el almacén
+        self._lock = threading.Lock()
+
+    def _guardar(self, name, value):
+        with self._lock:
+            self._cache[name] = (value, time.monotonic() + self.ttl_cache)
+            self._cache.move_to_end(name)
+            while len(self._cache) > self.max_entradas:
+                self._cache.popitem(last=False)
+
+    def _anotar_vida(self, name, segundos):
+        with self._lock:
+            self._vidas[name] = time.monotonic() + segundos
+            self._vidas.move_to_end(name)
+            while len(self._vidas) > self.max_entradas:
+                self._vidas.popitem(last=False)
+
+    def _olvidar(self, *names):
+        with self._lock:
+            for name in names:
+                self._cache.pop(name, None)
+                self._vidas.pop(name, None)
+
+    def get(self, name):
+        with self._lock:
+            entrada = self._cache.get(name)
+            if entrada and entrada[1] > time.monotonic():
+                self._cache.move_to_end(name)
+                return entrada[0]
+        value = self.almacen.get(name)
+        if value is not None:
+            self._guardar(name, value)
+        return value
+
+    def setex(self, name, time, value):
+        resultado = self.almacen.setex(name, time, value)
+        self._guardar(name, value)
+        self._anotar_vida(name, _segundos(time))
+        return resultado
+
+    def expire(self, name, time):
+        resultado = self.almacen.expire(name, time)
+        if resultado:
+            self._anotar_vida(name, _segundos(time))
+        else:
+            self._olvidar(name)
+        return resultado
+
+    def ttl(self, name):
+        with self._lock:
+            vence = self._vidas.get(name)
+        # Lo anotado solo sirve mientras no haya vencido: otro proceso pudo extenderla
+        if vence is not None and vence > time.monotonic():
+            return int(vence - time.monotonic())
+        restante = self.almacen.ttl(name)
+        if restante > 0:
+            self._anotar_vida(name, restante)
+        return restante
+
+    def delete(self, *names):
+        self._olvidar(*names)
+        return self.almacen.delete(*names)
+
+    def __getattr__(self, nombre):
+        # sadd, smembers, srem, barrer_vencidas: directo al almacén
+        return getattr(self.almacen, nombre)
+
+
+# --- SESIÓN ---
+
+class SesionServidorDict(SessionMixin):
+    """
+    Sesión que se carga del almacén la primera vez que se lee o escribe.
+    `sid` es None para una sesión nueva (el identificador se crea al guardarla).
+    """
+
+    def __init__(self, sid=None, cargar=None):
+        self.sid = sid
+        self._cargar = cargar
+        self._datos = None if cargar else {}
+        self.user_id_original = None
+        self.modified = False
+        self.accessed = False
+
+    @property
+    def cargada(self):
+        return self._datos is not None
+
+    def _d(self):
+        self.accessed = True
+        if self._datos is None:
+            datos = self._cargar()
+            self._cargar = None
+            if datos is None:
+                # Clave vencida o desconocida: se trata como sesión nueva
+                self.sid = None
+                datos = {}
+            self._datos = datos
+            self.user_id_original = datos.get('user_id')
+        return self._datos
+
+    def __getitem__(self, key):
+        return self._d()[key]
+
+    def __setitem__(self, key, value):
+        self._d()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self._d()[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self._d())
+
+    def __len__(self):
+        return len(self._d())
+
+
+class InterfazSesionesServidor(SessionInterface):
+    """SessionInterface de Flask que guarda los datos en `almacen` y solo el id en la cookie."""
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, almacen):
+        self.almacen = almacen
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='sesion-servidor', key_derivation='hmac')
+
+    def leer(self, sid):
+        valor = self.almacen.get(PREFIJO_SESION + sid)
+        if valor is None:
+            return None
+        try:
+            datos = self.serializer.loads(_texto(valor))
+        except Exception:
+            return None
+        if datos.get('user_id') is not None:
+            rol = self.almacen.get(PREFIJO_ROL + str(datos['user_id']))
+            if rol is not None:
+                datos['role'] = _texto(rol)
+        return datos
+
+    def guardar_rol(self, app, user_id, rol):
+        """Fija el rol vigente del usuario; dura lo que la sesión más larga que pueda tener."""
+        self.almacen.setex(PREFIJO_ROL + str(user_id), self._ttl_rol(app), rol)
+
+    def _ttl_rol(self, app):
+        return max(_segundos(app.permanent_session_lifetime), app.config.get('SESSION_SERVER_TTL_SECONDS', 86400))
+
+    def escribir(self, sid, datos, ttl):
+        self.almacen.setex(PREFIJO_SESION + sid, ttl, self.serializer.dumps(dict(datos)))
+
+    def _ttl(self, app, session):
+        if session.permanent:
+            return _segundos(app.permanent_session_lifetime)
+        return app.config.get('SESSION_SERVER_TTL_SECONDS', 86400)
+
+    def extender(self, app, session):
+        """Renueva la vida de la sesión (y del rol del usuario) cuando ya consumió la mitad."""
+        ttl = self._ttl(app, session)
+        restante = self.almacen.ttl(PREFIJO_SESION + session.sid)
+        if 0 <= restante < ttl // 2:
+            self.almacen.expire(PREFIJO_SESION + session.sid, ttl)
+            if session.get('user_id') is not None:
+                self.almacen.expire(PREFIJO_ROL + str(session['user_id']), self._ttl_rol(app))
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        valor = request.cookies.get(self.get_cookie_name(app))
+        if not valor:
+            return SesionServidorDict()
+        try:
+            sid = self._signer(app).unsign(valor).decode('utf-8')
+        except BadSignature:
+            return SesionServidorDict()
+        return SesionServidorDict(sid, cargar=lambda: self.leer(sid))
+
+    def should_set_cookie(self, app, session):
+        # No se consulta session.permanent si la sesión no se cargó: evita leer el almacén en vano
+        if session.modified:
+            return True
+        return session.cargada and session.permanent and app.config['SESSION_REFRESH_EACH_REQUEST']
+
+    def save_session(self, app, session, response):
+        nombre = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.cargada and session.sid and not session.modified:
+            # La vida en el almacén se extiende aunque no se reenvíe la cookie: una sesión
+            # sin "recordarme" dura lo que el navegador, no SESSION_SERVER_TTL_SECONDS
+            # desde la última escritura
+            self.extender(app, session)
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        if session.modified and not session:
+            # Sesión vaciada (logout): se borra del almacén y del navegador
+            if session.sid:
+                self.almacen.delete(PREFIJO_SESION + session.sid)
+                if session.user_id_original is not None:
+                    self.almacen.srem(PREFIJO_USUARIO + str(session.user_id_original), session.sid)
+            response.delete_cookie(nombre, domain=domain, path=path, secure=secure, samesite=samesite, httponly=httponly)
+            return
+
+        ttl = self._ttl(app, session)
+        user_id = session.get('user_id')
+        if session.modified:
+            if session.sid and user_id != session.user_id_original:
+                # Cambió el usuario (login/logout): identificador nuevo para evitar fijación de sesión
+                self.almacen.delete(PREFIJO_SESION + session.sid)
+                if session.user_id_original is not None:
+                    self.almacen.srem(PREFIJO_USUARIO + str(session.user_id_original), session.sid)
+                session.sid = None
+            nueva = session.sid is None
+            if nueva:
+                session.sid = secrets.token_urlsafe(32)
+            self.escribir(session.sid, session, ttl)
+            if user_id is not None and (nueva or user_id != session.user_id_original):
+                self.almacen.sadd(PREFIJO_USUARIO + str(user_id), session.sid)
+                if user_id != session.user_id_original and session.get('role'):
+                    # Inicio de sesión: el rol recién leído de la base es el vigente
+                    self.guardar_rol(app, user_id, session['role'])
+
+        iniciar_barrido(app)
+        response.set_cookie(
+            nombre,
+            self._signer(app).sign(session.sid).decode('utf-8'),
+            expires=self.get_expiration_time(app, session),
+            httponly=httponly, domain=domain, path=path, secure=secure, samesite=samesite,
+        )
+
+
+# --- CAMBIOS DESDE FUERA DE LA PETICIÓN DEL USUARIO ---
+
+def _interfaz():
+    interfaz = current_app.session_interface
+    return interfaz if isinstance(interfaz, InterfazSesionesServidor) else None
+
+
+def actualizar_sesiones_de_usuario(user_id, **cambios):
+    """
+    Aplica `cambios` (p. ej. role='Administrador') a todas las sesiones abiertas del usuario.
+    Devuelve cuántas sesiones se actualizaron. Con sesiones en cookie no hace nada.
+    Un cambio de rol se guarda además como rol vigente (ver PREFIJO_ROL).
+    """
+    interfaz = _interfaz()
+    if interfaz is None:
+        return 0
+    if 'role' in cambios:
+        interfaz.guardar_rol(current_app, user_id, cambios['role'])
+    conjunto = PREFIJO_USUARIO + str(user_id)
+    actualizadas = 0
+    for sid in map(_texto, interfaz.almacen.smembers(conjunto)):
+        datos = interfaz.leer(sid)
+        restante = interfaz.almacen.ttl(PREFIJO_SESION + sid)
+        if datos is None or restante <= 0:
+            interfaz.almacen.srem(conjunto, sid)
+            continue
+        datos.update(cambios)
+        interfaz.escribir(sid, datos, restante)
+        actualizadas += 1
+    return actualizadas
+
+
+def cerrar_sesiones_de_usuario(user_id):
+    """Cierra todas las sesiones del usuario (p. ej. al eliminarlo)."""
+    interfaz = _interfaz()
+    if interfaz is None:
+        return 0
+    conjunto = PREFIJO_USUARIO + str(user_id)
+    claves = [PREFIJO_SESION + _texto(sid) for sid in interfaz.almacen.smembers(conjunto)]
+    return interfaz.almacen.delete(conjunto, PREFIJO_ROL + str(user_id), *claves)
+
+
+# --- BARRIDO DE SESIONES VENCIDAS ---
+
+_barrido_pid = None
+_barrido_lock = threading.Lock()
+
+
+def barrer_sesiones_vencidas(app=None):
+    """Borra las sesiones vencidas (Redis las vence solo; el almacén SQLite no)."""
+    app = app or current_app
+    interfaz = app.session_interface
+    if not isinstance(interfaz, InterfazSesionesServidor) or not hasattr(interfaz.almacen, 'barrer_vencidas'):
+        return 0
+    return interfaz.almacen.barrer_vencidas()
+
+
+def _bucle_barrido(app):
+    intervalo = app.config.get('SESSION_SWEEP_SECONDS', 600)
+    while True:
+        time.sleep(intervalo)
+        try:
+            with app.app_context():
+                borradas = barrer_sesiones_vencidas(app)
+                if borradas:
+                    print(f"DEBUG: Sesiones vencidas eliminadas: {borradas}")
+        except Exception as e:
+            print(f"DEBUG: Error al barrer sesiones vencidas: {e}")
+
+
+def iniciar_barrido(app):
+    """Arranca (una vez por proceso) el hilo que borra las sesiones vencidas."""
+    global _barrido_pid
+    with _barrido_lock:
+        if _barrido_pid == os.getpid():
+            return
+        _barrido_pid = os.getpid()
+    threading.Thread(target=_bucle_barrido, args=(app,), name='session-sweeper', daemon=True).start()
+
+
+@click.command('limpiar-sesiones')
+@with_appcontext
+def limpiar_sesiones_command():
+    """Borra las sesiones vencidas del almacén del servidor."""
+    print(f"Sesiones vencidas eliminadas: {barrer_sesiones_vencidas()}")
+
+
+def init_sesiones(app):
+    """Instala la interfaz de sesiones según SESSION_BACKEND ('servidor' o 'cookie')."""
+    if app.config.get('SESSION_BACKEND', 'servidor') != 'servidor':
+        return
+    redis_url = app.config.get('SESSION_REDIS_URL')
+    if redis_url:
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SESSION_REDIS_URL está definido pero el paquete 'redis' no está instalado.")
+        almacen = redis.Redis.from_url(redis_url)
+    else:
+        almacen = AlmacenSQLite()
+    app.session_interface = InterfazSesionesServidor(AlmacenConCache(
+        almacen,
+        max_entradas=app.config.get('SESSION_CACHE_MAX_ENTRIES', 1000),
+        ttl=app.config.get('SESSION_CACHE_TTL_SECONDS', 5),
+    ))
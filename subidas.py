@@ -0,0 +1,369 @@
+# subidas.py
+# Subidas reanudables por partes para archivos grandes (videos de rutas, audio, mapas).
+#
+# Un formulario multipart con un video de cientos de MB no sobrevive a una
+# conexión móvil inestable: si se corta, se vuelve a empezar desde cero, y
+# Werkzeug guarda la parte entera en un temporal antes de que la vista la vea.
+# Aquí el cliente sube el archivo en partes con el cuerpo crudo de la petición:
+#
+#   POST   /subidas                   {"nombre", "tamano", "sha256"} -> 201 {"id", "offset": 0, ...}
+#                                     Comprueba extensión, tamaño máximo por tipo y cuota del usuario.
+#   PUT    /subidas/<id>              Cuerpo: los bytes de la parte; cabecera Upload-Offset (o ?offset=).
+#                                     Se escriben directamente en el archivo parcial, dentro de la
+#                                     carpeta de destino. Si la conexión se corta a mitad, lo
+#                                     recibido se conserva.
+#   HEAD   /subidas/<id>              Upload-Offset: desde dónde reanudar tras un corte.
+#   GET    /subidas/<id>              Lo mismo en JSON.
+#   POST   /subidas/<id>/finalizar    Verifica el SHA-256 y mueve el archivo al almacén (almacen_blobs.py)
+#                                     con un rename, sin copiarlo.
+#   DELETE /subidas/<id>              Cancela una subida en curso o libera una completa (y su cuota).
+#
+# MAX_CONTENT_LENGTH limita cualquier petición; cada parte debe caber en
+# UPLOAD_CHUNK_MAX_MB. Las subidas en curso sin actividad durante
+# UPLOAD_SESSION_TTL_HOURS se descartan (flask limpiar-subidas).
+import os
+import re
+import uuid
+import fcntl
+import hashlib
+import mimetypes
+from datetime import datetime, timedelta
+from functools import wraps
+
+import click
+from flask import Blueprint, current_app, jsonify, request, session, url_for
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+from werkzeug.exceptions import ClientDisconnected
+from werkzeug.utils import secure_filename
+
+from models import db, SubidaPorPartes
+from catalogo_activos import get_file_category
+from almacen_blobs import TAMANO_BLOQUE, adoptar_archivo, liberar
+from lecturas_bd import usar_primaria
+
+subidas_bp = Blueprint('subidas', __name__, url_prefix='/subidas')
+
+CLAVE_CARPETA = 'UPLOAD_FILES_FOLDER' # La misma carpeta que files.upload_file
+SUFIJO_PARCIAL = '.parcial'
+ROLES_PERMITIDOS = ('Superuser', 'Usuario Regular')
+# Las mismas extensiones que files.ALLOWED_FILE_EXTENSIONS
+EXTENSIONES_PERMITIDAS = {
+    'pdf', 'jpg', 'jpeg', 'png', 'gif', 'mp3', 'mp4', 'aiff', 'txt', 'docx',
+    'xls', 'odf', 'xml', 'gpx', 'kml', 'kmz', 'ico', 'icon', 'wma', 'wmv', 'avi'
+}
+# Categoría (get_file_category) -> clave de config.py con el tamaño máximo en MB
+LIMITES_POR_CATEGORIA = {
+    'video': 'UPLOAD_MAX_VIDEO_MB',
+    'audio': 'UPLOAD_MAX_AUDIO_MB',
+    'map': 'UPLOAD_MAX_MAP_MB',
+}
+PATRON_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+MB = 1024 * 1024
+
+# Python no conoce .gpx: sin esto los mapas GPX quedarían como 'other'
+mimetypes.add_type('application/gpx+xml', '.gpx')
+
+
+def subida_autorizada(f):
+    """Como role_required de files.py, pero responde JSON: lo usan clientes, no formularios."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not session.get('logged_in'):
+            return jsonify({'error': 'No autenticado'}), 401
+        if session.get('role') not in ROLES_PERMITIDOS:
+            return jsonify({'error': 'No tienes permiso para subir archivos.'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def categoria_de(extension):
+    mime_type, _ = mimetypes.guess_type('archivo.' + extension)
+    return get_file_category(mime_type or 'application/octet-stream')
+
+
+def tamano_maximo(categoria):
+    """Tamaño máximo en bytes para un archivo de la categoría."""
+    clave = LIMITES_POR_CATEGORIA.get(categoria, 'UPLOAD_MAX_OTHER_MB')
+    return current_app.config.get(clave, 50) * MB
+
+
+def uso_de_usuario(user_id):
+    """Bytes que ocupan las subidas del usuario, completas y en curso (lo reservado al iniciarlas)."""
+    return db.session.scalar(
+        select(func.coalesce(func.sum(SubidaPorPartes.tamano), 0)).where(SubidaPorPartes.user_id == user_id)
+    )
+
+
+def _ruta_parcial(subida):
+    carpeta = current_app.config[CLAVE_CARPETA]
+    os.makedirs(carpeta, exist_ok=True)
+    return os.path.join(carpeta, f".{subida.id}{SUFIJO_PARCIAL}")
+
+
+def _borrar_parcial(subida):
+    try:
+        os.unlink(_ruta_parcial(subida))
+    except FileNotFoundError:
+        pass
+
+
+def _get_subida_autorizada(subida_id):
+    """Devuelve la subida si existe y pertenece al usuario (o es Superuser); si no, None."""
+    subida = db.session.get(SubidaPorPartes, subida_id)
+    if subida is None:
+        return None
+    if subida.user_id != session.get('user_id') and session.get('role') != 'Superuser':
+        return None
+    return subida
+
+
+def _estado_json(subida, status=200):
+    data = {
+        'id': subida.id,
+        'nombre': subida.nombre_original,
+        'categoria': subida.categoria,
+        'tamano': subida.tamano,
+        'offset': subida.recibido,
+        'estado': subida.estado,
+        'parte_max': current_app.config.get('UPLOAD_CHUNK_MAX_MB', 8) * MB,
+    }
+    if subida.estado == 'completa':
+        data['nombre_archivo'] = subida.nombre_final
+        data['url'] = url_for('medios.servir_medio', carpeta='files', nombre=subida.nombre_final)
+        data['descarga_url'] = url_for('medios.descargar_subida', subida_id=subida.id)
+    response = jsonify(data)
+    response.status_code = status
+    response.headers['Upload-Offset'] = str(subida.recibido)
+    response.headers['Upload-Length'] = str(subida.tamano)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def _error(mensaje, status, subida=None, **extra):
+    data = {'error': mensaje, **extra}
+    if subida is not None:
+        data['offset'] = subida.recibido
+    response = jsonify(data)
+    response.status_code = status
+    if subida is not None:
+        response.headers['Upload-Offset'] = str(subida.recibido)
+    return response
+
+
+def limpiar_subidas_vencidas(user_id=None):
+    """
+    Descarta las subidas en curso sin actividad durante UPLOAD_SESSION_TTL_HOURS
+    (las de un usuario o todas). Devuelve cuántas borró.
+    """
+    limite = datetime.utcnow() - timedelta(hours=current_app.config.get('UPLOAD_SESSION_TTL_HOURS', 48))
+    query = select(SubidaPorPartes).where(SubidaPorPartes.estado == 'en_curso', SubidaPorPartes.actualizado < limite)
+    if user_id is not None:
+        query = query.where(SubidaPorPartes.user_id == user_id)
+    vencidas = db.session.execute(query).scalars().all()
+    for subida in vencidas:
+        db.session.delete(subida)
+    db.session.commit()
+    for subida in vencidas:
+        _borrar_parcial(subida)
+    return len(vencidas)
+
+
+# --- RUTAS ---
+
+@subidas_bp.route('', methods=['POST'])
+@subida_autorizada
+def iniciar_subida():
+    datos = request.get_json(silent=True) or {}
+    nombre = secure_filename(str(datos.get('nombre') or ''))
+    extension = nombre.rsplit('.', 1)[1].lower() if '.' in nombre else ''
+    if extension not in EXTENSIONES_PERMITIDAS:
+        return _error('Tipo de archivo no permitido o archivo inválido.', 400)
+    try:
+        tamano = int(datos.get('tamano'))
+    except (TypeError, ValueError):
+        tamano = 0
+    if tamano <= 0:
+        return _error('Se esperaba "tamano": el tamaño total del archivo en bytes.', 400)
+    sha256 = (datos.get('sha256') or '').lower() or None
+    if sha256 is not None and not PATRON_SHA256.match(sha256):
+        return _error('"sha256" debe ser el SHA-256 del archivo en hexadecimal.', 400)
+
+    categoria = categoria_de(extension)
+    maximo = tamano_maximo(categoria)
+    if tamano > maximo:
+        return _error(f'El archivo supera el tamaño máximo para {categoria} ({maximo // MB} MB).', 413, maximo=maximo)
+
+    user_id = session['user_id']
+    limpiar_subidas_vencidas(user_id) # Las abandonadas no deben seguir ocupando su cuota
+
+    subida = SubidaPorPartes(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        nombre_original=nombre,
+        extension=extension,
+        categoria=categoria,
+        tamano=tamano,
+        recibido=0,
+        sha256=sha256,
+        estado='en_curso',
+    )
+    db.session.add(subida)
+    # Tras el flush el INSERT ya tiene el bloqueo de escritura: dos subidas a la vez
+    # del mismo usuario no pueden pasar las dos la comprobación de la cuota
+    db.session.flush()
+    cuota = current_app.config.get('UPLOAD_USER_QUOTA_MB', 0) * MB
+    if cuota:
+        uso = uso_de_usuario(user_id)
+        if uso > cuota:
+            db.session.rollback()
+            return _error('Superarías tu cuota de almacenamiento.', 413, cuota=cuota, disponible=max(0, cuota - (uso - tamano)))
+    open(_ruta_parcial(subida), 'wb').close()
+    db.session.commit()
+
+    response = _estado_json(subida, 201)
+    response.headers['Location'] = url_for('subidas.estado_subida', subida_id=subida.id)
+    return response
+
+
+@subidas_bp.route('/<subida_id>', methods=['GET', 'HEAD'])
+@subida_autorizada
+@usar_primaria # El offset tiene que ser el último escrito, no el de una réplica con retraso
+def estado_subida(subida_id):
+    subida = _get_subida_autorizada(subida_id)
+    if subida is None:
+        return _error('Subida no encontrada', 404)
+    return _estado_json(subida)
+
+
+@subidas_bp.route('/<subida_id>', methods=['PUT', 'PATCH'])
+@subida_autorizada
+def enviar_parte(subida_id):
+    subida = _get_subida_autorizada(subida_id)
+    if subida is None:
+        return _error('Subida no encontrada', 404)
+    if subida.estado != 'en_curso':
+        return _error('La subida ya está completa.', 409, subida)
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', request.args.get('offset', '')))
+    except ValueError:
+        return _error('Falta el offset de la parte (cabecera Upload-Offset).', 400, subida)
+    longitud = request.content_length
+    if longitud is None:
+        return _error('Falta Content-Length.', 411, subida)
+    parte_max = current_app.config.get('UPLOAD_CHUNK_MAX_MB', 8) * MB
+    if longitud > parte_max:
+        return _error(f'La parte supera {parte_max // MB} MB.', 413, subida, parte_max=parte_max)
+    if offset + longitud > subida.tamano:
+        return _error('La parte se sale del tamaño declarado del archivo.', 400, subida)
+
+    try:
+        destino = open(_ruta_parcial(subida), 'r+b')
+    except FileNotFoundError:
+        return _error('La subida venció; hay que iniciarla de nuevo.', 410)
+    with destino:
+        # Un reintento del cliente puede llegar mientras la petición anterior sigue
+        # escribiendo (en otro hilo o proceso): el bloqueo las ordena
+        fcntl.flock(destino, fcntl.LOCK_EX)
+        db.session.refresh(subida)
+        if offset != subida.recibido:
+            return _error('El offset no coincide con lo recibido; reanuda desde "offset".', 409, subida)
+
+        # Lo que quedara tras `recibido` es de una escritura cortada que no llegó a registrarse
+        destino.seek(offset)
+        destino.truncate()
+        escritos = 0
+        try:
+            while escritos < longitud:
+                bloque = request.stream.read(min(TAMANO_BLOQUE, longitud - escritos))
+                if not bloque:
+                    break
+                destino.write(bloque)
+                escritos += len(bloque)
+        except ClientDisconnected:
+            # Conexión cortada: se guarda lo que llegó y el cliente reanuda desde ahí
+            current_app.logger.info(f"Subida {subida.id}: conexión cortada tras {escritos} de {longitud} bytes")
+        destino.flush()
+
+        subida.recibido = offset + escritos
+        subida.actualizado = datetime.utcnow()
+        db.session.commit()
+    return _estado_json(subida)
+
+
+@subidas_bp.route('/<subida_id>/finalizar', methods=['POST'])
+@subida_autorizada
+def finalizar_subida(subida_id):
+    subida = _get_subida_autorizada(subida_id)
+    if subida is None:
+        return _error('Subida no encontrada', 404)
+    if subida.estado == 'completa':
+        return _estado_json(subida)
+    if subida.recibido != subida.tamano:
+        return _error(f'Faltan {subida.tamano - subida.recibido} bytes.', 409, subida)
+
+    datos = request.get_json(silent=True) or {}
+    esperado = (datos.get('sha256') or subida.sha256 or '').lower()
+    if not PATRON_SHA256.match(esperado):
+        return _error('Falta el SHA-256 del archivo ("sha256") para verificarlo.', 400, subida)
+
+    ruta = _ruta_parcial(subida)
+    try:
+        parcial = open(ruta, 'r+b')
+    except FileNotFoundError:
+        # Otra llamada (un reintento del cliente) pudo terminarla y mover ya el archivo
+        db.session.refresh(subida)
+        if subida.estado == 'completa':
+            return _estado_json(subida)
+        return _error('La subida venció; hay que iniciarla de nuevo.', 410)
+    with parcial:
+        fcntl.flock(parcial, fcntl.LOCK_EX)
+        # Con el bloqueo, releer: un finalizar simultáneo pudo completarla mientras esperábamos
+        db.session.refresh(subida)
+        if subida.estado == 'completa':
+            return _estado_json(subida)
+        if subida.recibido != subida.tamano:
+            return _error(f'Faltan {subida.tamano - subida.recibido} bytes.', 409, subida)
+        h = hashlib.sha256()
+        for bloque in iter(lambda: parcial.read(TAMANO_BLOQUE), b''):
+            h.update(bloque)
+        digest = h.hexdigest()
+        if digest != esperado:
+            # El contenido no sirve: se vacía para que el cliente lo envíe de nuevo
+            parcial.truncate(0)
+            subida.recibido = 0
+            subida.actualizado = datetime.utcnow()
+            db.session.commit()
+            return _error('El SHA-256 no coincide; el archivo se recibió dañado.', 422, subida, sha256_recibido=digest)
+
+        nombre, nuevo = adoptar_archivo(ruta, CLAVE_CARPETA, digest, subida.tamano, '.' + subida.extension)
+        subida.estado = 'completa'
+        subida.nombre_final = nombre
+        subida.sha256 = digest
+        subida.actualizado = datetime.utcnow()
+        db.session.commit()
+    if not nuevo:
+        _borrar_parcial(subida) # Ese contenido ya estaba guardado
+    return _estado_json(subida)
+
+
+@subidas_bp.route('/<subida_id>', methods=['DELETE'])
+@subida_autorizada
+def cancelar_subida(subida_id):
+    subida = _get_subida_autorizada(subida_id)
+    if subida is None:
+        return _error('Subida no encontrada', 404)
+    if subida.estado == 'completa':
+        liberar(CLAVE_CARPETA, subida.nombre_final) # El archivo se borra tras el commit si nadie más lo usa
+    db.session.delete(subida)
+    db.session.commit()
+    _borrar_parcial(subida)
+    return '', 204
+
+
+@click.command('limpiar-subidas')
+@with_appcontext
+def limpiar_subidas_command():
+    """Descarta las subidas por partes abandonadas (UPLOAD_SESSION_TTL_HOURS)."""
+    print(f"Subidas vencidas descartadas: {limpiar_subidas_vencidas()}")
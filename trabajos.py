@@ -0,0 +1,361 @@
+# trabajos.py
+# Cola local de trabajos de exportación en segundo plano.
+#
+# Las exportaciones grandes (contactos a Excel/vCard, "Acerca de Nosotros",
+# /export/<formato>) pueden encolarse en vez de ocupar el hilo de la petición:
+# la ruta responde 202 con el id del trabajo, un ThreadPoolExecutor genera el
+# archivo en instance/exports/ y la tabla export_jobs guarda estado y progreso.
+# El cliente consulta /trabajos/<id> (JSON) y descarga con /trabajos/<id>/descargar.
+# Un hilo limpiador borra los artefactos vencidos (EXPORT_JOB_TTL_MINUTES).
+#
+# Para pedir la versión en segundo plano de una exportación basta con añadir
+# ?async=1 a la URL. Solo con sesión iniciada: sin ella la exportación se genera
+# en la misma petición (un anónimo no puede llenar la cola y el trabajo tiene dueño).
+# Los trabajos que un reinicio dejó a medias se marcan como error al arrancar
+# (servidor.py, app.py) o con `flask trabajos recuperar`.
+import os
+import json
+import uuid
+import threading
+import traceback
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from flask import Blueprint, current_app, jsonify, request, session, url_for, send_file, flash, redirect
+
+from models import db, ExportJob
+
+trabajos_bp = Blueprint('trabajos', __name__, url_prefix='/trabajos')
+
+# Tipos de trabajo registrados: nombre -> función(job, parametros, reportar_progreso, destino)
+TIPOS_TRABAJO = {}
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_limpiador_iniciado = False
+
+
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'logged_in' not in session:
+            if request.accept_mimetypes.best == 'application/json':
+                return jsonify({'error': 'No autenticado'}), 401
+            flash('Por favor, inicia sesión para acceder a esta página.', 'info')
+            return redirect(url_for('login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def registrar_tipo(nombre):
+    """
+    Decorador para registrar una función generadora de artefactos.
+    La función recibe (parametros, reportar_progreso, destino), escribe el archivo en
+    `destino` (ruta sin extensión) y devuelve (ruta_final, download_name, mimetype).
+    """
+    def decorator(f):
+        TIPOS_TRABAJO[nombre] = f
+        return f
+    return decorator
+
+
+def get_exports_folder(app=None):
+    """Carpeta donde se guardan los artefactos generados (dentro de instance/)."""
+    app = app or current_app
+    folder = app.config.get('EXPORT_JOBS_FOLDER') or os.path.join(app.instance_path, 'exports')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _get_executor(app):
+    """Crea el pool de hilos la primera vez (y de nuevo tras un fork del proceso)."""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('EXPORT_JOB_WORKERS', 2),
+                thread_name_prefix='export-job'
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def quiere_trabajo_en_segundo_plano():
+    """True si un usuario con sesión pidió la exportación como trabajo (?async=1)."""
+    if not session.get('logged_in') or not session.get('user_id'):
+        return False
+    return request.args.get('async', '').lower() in ('1', 'true', 'si', 'sí')
+
+
+def encolar_trabajo(tipo, parametros):
+    """
+    Crea el registro del trabajo, lo envía al pool y devuelve la respuesta 202 para la ruta.
+    """
+    if tipo not in TIPOS_TRABAJO:
+        raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+
+    app = current_app._get_current_object()
+    job = ExportJob(
+        id=uuid.uuid4().hex,
+        tipo=tipo,
+        parametros=json.dumps(parametros, ensure_ascii=False),
+        estado='pendiente',
+        progreso=0,
+        user_id=session.get('user_id')
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    _get_executor(app).submit(_ejecutar_trabajo, app, job.id)
+    iniciar_limpiador(app)
+
+    response = jsonify({
+        'job_id': job.id,
+        'estado': job.estado,
+        'status_url': url_for('trabajos.estado_trabajo', job_id=job.id),
+        'download_url': url_for('trabajos.descargar_trabajo', job_id=job.id),
+    })
+    response.status_code = 202
+    response.headers['Location'] = url_for('trabajos.estado_trabajo', job_id=job.id)
+    return response
+
+
+def _ejecutar_trabajo(app, job_id):
+    """Corre en un hilo del pool: genera el artefacto y actualiza el registro."""
+    with app.app_context():
+        job = db.session.get(ExportJob, job_id)
+        if job is None:
+            return
+        job.estado = 'en_proceso'
+        db.session.commit()
+
+        ultimo_progreso = [0]
+
+        def reportar_progreso(hechos, total):
+            if not total:
+                return
+            progreso = min(99, int(hechos * 100 / total))
+            # Solo escribir cuando el avance cambia de forma apreciable
+            if progreso - ultimo_progreso[0] >= 5:
+                ultimo_progreso[0] = progreso
+                job.progreso = progreso
+                db.session.commit()
+
+        try:
+            parametros = json.loads(job.parametros or '{}')
+            destino = os.path.join(get_exports_folder(app), job.id)
+            ruta, download_name, mimetype = TIPOS_TRABAJO[job.tipo](parametros, reportar_progreso, destino)
+
+            ahora = datetime.utcnow()
+            job.artifact_path = ruta
+            job.download_name = download_name
+            job.mimetype = mimetype
+            job.estado = 'terminado'
+            job.progreso = 100
+            job.finished_at = ahora
+            job.expires_at = ahora + timedelta(minutes=app.config.get('EXPORT_JOB_TTL_MINUTES', 60))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error en el trabajo de exportación {job_id}: {e}\n{traceback.format_exc()}")
+            job = db.session.get(ExportJob, job_id)
+            job.estado = 'error'
+            job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            job.expires_at = job.finished_at + timedelta(minutes=app.config.get('EXPORT_JOB_TTL_MINUTES', 60))
+            db.session.commit()
+        finally:
+            db.session.remove()
+
+
+# --- TRABAJOS INTERRUMPIDOS ---
+
+def recuperar_trabajos_interrumpidos():
+    """
+    Marca como error los trabajos pendientes o en proceso: el pool que los corría
+    murió con el proceso. Llamar solo al arrancar todo el servidor, no en cada
+    worker (los trabajos de los demás workers siguen vivos). Devuelve cuántos marcó.
+    """
+    ahora = datetime.utcnow()
+    expira = ahora + timedelta(minutes=current_app.config.get('EXPORT_JOB_TTL_MINUTES', 60))
+    marcados = db.session.execute(
+        db.update(ExportJob)
+        .where(ExportJob.estado.in_(('pendiente', 'en_proceso')))
+        .values(estado='error', error='Interrumpido por un reinicio del servidor', finished_at=ahora, expires_at=expira)
+    ).rowcount
+    db.session.commit()
+    return marcados
+
+
+# --- LIMPIEZA DE ARTEFACTOS VENCIDOS ---
+
+def limpiar_trabajos_vencidos():
+    """Borra los archivos y registros de trabajos cuyo TTL ya venció. Devuelve cuántos borró."""
+    vencidos = ExportJob.query.filter(ExportJob.expires_at.isnot(None), ExportJob.expires_at < datetime.utcnow()).all()
+    for job in vencidos:
+        if job.artifact_path and os.path.exists(job.artifact_path):
+            try:
+                os.remove(job.artifact_path)
+            except OSError as e:
+                current_app.logger.warning(f"No se pudo borrar el artefacto {job.artifact_path}: {e}")
+        db.session.delete(job)
+    db.session.commit()
+    return len(vencidos)
+
+
+def _bucle_limpiador(app):
+    intervalo = app.config.get('EXPORT_JOB_CLEANUP_SECONDS', 300)
+    evento = threading.Event()
+    while not evento.wait(intervalo):
+        with app.app_context():
+            try:
+                limpiar_trabajos_vencidos()
+            except Exception as e:
+                app.logger.error(f"Error al limpiar trabajos de exportación: {e}")
+            finally:
+                db.session.remove()
+
+
+def iniciar_limpiador(app):
+    """Arranca (una vez por proceso) el hilo que limpia los artefactos vencidos."""
+    global _limpiador_iniciado
+    with _executor_lock:
+        if _limpiador_iniciado == os.getpid():
+            return
+        _limpiador_iniciado = os.getpid()
+    threading.Thread(target=_bucle_limpiador, args=(app,), name='export-job-cleaner', daemon=True).start()
+
+
+@trabajos_bp.cli.command('limpiar')
+def limpiar_command():
+    """Borra los artefactos de exportación vencidos (flask trabajos limpiar)."""
+    borrados = limpiar_trabajos_vencidos()
+    print(f"Trabajos vencidos eliminados: {borrados}")
+
+
+@trabajos_bp.cli.command('recuperar')
+def recuperar_command():
+    """Marca como error los trabajos que un reinicio dejó a medias (flask trabajos recuperar)."""
+    print(f"Trabajos interrumpidos marcados como error: {recuperar_trabajos_interrumpidos()}")
+
+
+# --- RUTAS ---
+
+def _get_job_autorizado(job_id):
+    """Devuelve el trabajo si existe y pertenece al usuario (o es Superuser); si no, None."""
+    job = db.session.get(ExportJob, job_id)
+    if job is None:
+        return None
+    if job.user_id != session.get('user_id') and session.get('role') != 'Superuser':
+        return None
+    return job
+
+
+@trabajos_bp.route('/<job_id>')
+@login_required
+def estado_trabajo(job_id):
+    """Estado y progreso del trabajo en JSON, para hacer polling desde el navegador."""
+    job = _get_job_autorizado(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    data = job.to_dict()
+    if job.estado == 'terminado':
+        data['download_url'] = url_for('trabajos.descargar_trabajo', job_id=job.id)
+    return jsonify(data)
+
+
+@trabajos_bp.route('/<job_id>/descargar')
+@login_required
+def descargar_trabajo(job_id):
+    """Descarga el artefacto de un trabajo terminado."""
+    job = _get_job_autorizado(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    if job.estado != 'terminado':
+        return jsonify(job.to_dict()), 409
+    if not job.artifact_path or not os.path.exists(job.artifact_path):
+        return jsonify({'error': 'El archivo ya no está disponible'}), 410
+    return send_file(job.artifact_path, as_attachment=True, download_name=job.download_name, mimetype=job.mimetype)
+
+
+# --- TIPOS DE TRABAJO ---
+# Las importaciones van dentro de cada función para evitar importaciones circulares
+# (los blueprints importan este módulo para encolar).
+
+def _escribir_buffer(buffer, ruta):
+    with open(ruta, 'wb') as f:
+        f.write(buffer.getvalue())
+    return ruta
+
+
+@registrar_tipo('contactos_xlsx')
+def trabajo_contactos_xlsx(parametros, reportar_progreso, destino):
+    from models import User
+    from exportacion_xlsx import escribir_usuarios_xlsx, parse_columnas, XLSX_MIMETYPE
+
+    columnas = parse_columnas(parametros.get('columnas'))
+    total = User.query.count()
+
+    def usuarios():
+        query = User.query.order_by(User.nombre.asc(), User.id.asc()).yield_per(
+            current_app.config.get('XLSX_EXPORT_BATCH_SIZE', 500))
+        for i, user in enumerate(query, 1):
+            yield user
+            if i % 500 == 0:
+                reportar_progreso(i, total)
+
+    ruta = destino + '.xlsx'
+    escribir_usuarios_xlsx(usuarios(), columnas, ruta)
+    return ruta, 'todos_los_contactos.xlsx', XLSX_MIMETYPE
+
+
+@registrar_tipo('contactos_vcard')
+def trabajo_contactos_vcard(parametros, reportar_progreso, destino):
+    from models import User
+    from vcards import vcard_bytes
+
+    static_base_url = parametros['static_base_url']
+    total = User.query.count()
+    ruta = destino + '.vcf'
+    with open(ruta, 'wb') as f:
+        query = User.query.order_by(User.id.asc()).yield_per(current_app.config.get('VCARD_EXPORT_BATCH_SIZE', 200))
+        for i, user in enumerate(query, 1):
+            f.write(vcard_bytes(user, static_base_url))
+            if i % 200 == 0:
+                reportar_progreso(i, total)
+    return ruta, 'todos_los_contactos.vcf', 'text/vcard'
+
+
+@registrar_tipo('aboutus')
+def trabajo_aboutus(parametros, reportar_progreso, destino):
+    from models import AboutUs
+    from aboutus import generar_exportacion_aboutus
+
+    about_us_entry = db.session.get(AboutUs, parametros['aboutus_id'])
+    if about_us_entry is None:
+        raise ValueError('La sección "Acerca de Nosotros" ya no existe.')
+    resultado = generar_exportacion_aboutus(about_us_entry, parametros['format'])
+    if resultado is None:
+        raise ValueError('Formato de exportación no válido.')
+    buffer, download_name, mimetype = resultado
+    ruta = _escribir_buffer(buffer, destino + os.path.splitext(download_name)[1])
+    return ruta, download_name, mimetype
+
+
+@registrar_tipo('export_data')
+def trabajo_export_data(parametros, reportar_progreso, destino):
+    import exports
+
+    generadores = {
+        'pdf': (exports.generar_pdf, 'application/pdf'),
+        'jpg': (exports.generar_jpg, 'image/jpeg'),
+        'xls': (exports.generar_xls, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+        'vcard': (exports.generar_vcard, 'text/vcard'),
+    }
+    generador, mimetype = generadores[parametros['format_type']]
+    download_name = parametros['filename']
+    buffer = generador(parametros['data'])
+    ruta = _escribir_buffer(buffer, destino + os.path.splitext(download_name)[1])
+    return ruta, download_name, mimetype
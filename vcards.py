@@ -0,0 +1,142 @@
+# vcards.py
+# Serialización de contactos a vCard (.vcf) compartida por contactos.py y exports.py.
+#
+# Cada tarjeta serializada se guarda en una caché en memoria (LRU) con clave
+# User.id y se valida con fecha_actualizacion, de modo que las exportaciones
+# repetidas (individuales o masivas) reutilizan los bytes ya generados en vez
+# de volver a construir el árbol de vobject. Los eventos after_update y
+# after_delete de SQLAlchemy descartan la entrada del usuario afectado.
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+from models import User
+
+VCARD_CACHE_MAX_ENTRIES = 5000
+
+_vcard_cache = OrderedDict()  # user_id -> (fecha_actualizacion, static_base_url, bytes)
+_vcard_cache_lock = threading.Lock()
+
+
+def construir_vcard_desde_datos(nombre, primer_apellido='', segundo_apellido=None, telefono=None,
+                                telefono_emergencia=None, email=None, direccion=None, empresa=None,
+                                titulo=None, nota=None, foto_url=None, uid=None):
+    """
+    Construye un objeto vobject.vCard a partir de valores sueltos.
+    Los campos vacíos no se agregan a la tarjeta.
+    """
+    import vobject  # Se carga con la primera exportación, no al arrancar
+
+    card = vobject.vCard()
+
+    # Identificador estable: permite al cliente saber hasta qué contacto recibió
+    if uid:
+        card.add('uid').value = uid
+
+    # Nombre
+    card.add('n')
+    card.n.value = vobject.vcard.Name(family=primer_apellido or '', given=nombre or '', additional=segundo_apellido if segundo_apellido else '')
+
+    # Nombre completo para pantalla
+    card.add('fn')
+    card.fn.value = f"{nombre or ''} {primer_apellido or ''} {segundo_apellido if segundo_apellido else ''}".strip()
+
+    # Teléfono
+    if telefono:
+        tel = card.add('tel')
+        tel.type_param = 'CELL'
+        tel.value = telefono
+    if telefono_emergencia:
+        tel_emergencia = card.add('tel')
+        tel_emergencia.type_param = 'WORK'
+        tel_emergencia.params['X-LABEL'] = ['Emergencia']
+        tel_emergencia.value = telefono_emergencia
+
+    if email:
+        email_line = card.add('email')
+        email_line.type_param = 'INTERNET'
+        email_line.value = email
+
+    if direccion:
+        adr = card.add('adr')
+        adr.type_param = 'HOME'
+        adr.value = vobject.vcard.Address(street=direccion)
+
+    if empresa:
+        card.add('org').value = empresa
+
+    if titulo:
+        card.add('title').value = titulo
+    if nota:
+        card.add('note').value = nota
+
+    if foto_url:
+        photo = card.add('photo')
+        photo.value = foto_url
+        photo.type_param = 'URI'
+
+    return card
+
+
+def construir_vcard(user, static_base_url):
+    """
+    Construye el objeto vobject.vCard de un usuario.
+    `static_base_url` es la URL externa de /static/ (se calcula una sola vez por petición),
+    para no llamar a url_for(..., _external=True) por cada contacto.
+    """
+    foto_url = None
+    if user.avatar_url and 'default_avatar.png' not in user.avatar_url:
+        foto_url = static_base_url + user.avatar_url
+
+    return construir_vcard_desde_datos(
+        nombre=user.nombre,
+        primer_apellido=user.primer_apellido,
+        segundo_apellido=user.segundo_apellido,
+        telefono=user.telefono,
+        telefono_emergencia=user.telefono_emergencia,
+        email=user.email,
+        direccion=user.direccion,
+        empresa=user.empresa,
+        titulo=user.actividad,
+        # Se añade el rol al campo NOTE del vCard
+        nota=f"Cédula: {user.cedula}, Rol: {user.role}" if user.cedula else None,
+        foto_url=foto_url,
+        uid=f"user-{user.id}",
+    )
+
+
+def vcard_bytes(user, static_base_url):
+    """
+    Devuelve la vCard del usuario serializada en UTF-8, desde la caché si sigue vigente.
+    """
+    with _vcard_cache_lock:
+        cached = _vcard_cache.get(user.id)
+        if cached and cached[0] == user.fecha_actualizacion and cached[1] == static_base_url:
+            _vcard_cache.move_to_end(user.id)
+            return cached[2]
+
+    data = construir_vcard(user, static_base_url).serialize().encode('utf-8')
+
+    with _vcard_cache_lock:
+        _vcard_cache[user.id] = (user.fecha_actualizacion, static_base_url, data)
+        _vcard_cache.move_to_end(user.id)
+        while len(_vcard_cache) > VCARD_CACHE_MAX_ENTRIES:
+            _vcard_cache.popitem(last=False)
+    return data
+
+
+def invalidar_vcard(mapper, connection, target):
+    """Listener de SQLAlchemy: descarta la vCard en caché del usuario modificado o eliminado."""
+    with _vcard_cache_lock:
+        _vcard_cache.pop(target.id, None)
+
+
+def limpiar_cache_vcards():
+    """Vacía por completo la caché de vCards."""
+    with _vcard_cache_lock:
+        _vcard_cache.clear()
+
+
+event.listen(User, 'after_update', invalidar_vcard)
+event.listen(User, 'after_delete', invalidar_vcard)
@@ -1,8 +1,13 @@
 # version.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
 from models import db # IMPORTANTE: Importa la instancia de 'db' desde models.py
 from datetime import datetime
 from functools import wraps # Necesario para el decorador role_required
+import os
+import uuid
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
 
 # DECORADOR PARA ROLES (Ahora definido dentro de version.py)
 def role_required(roles):
@@ -44,6 +49,96 @@ class Version(db.Model):
     def __repr__(self):
         return f'<Version {self.nombre_version} - {self.numero_version}>'
 
+
+# --- CACHÉ DE LA ÚLTIMA VERSIÓN ---
+# El número de la última versión se muestra en el pie de todas las páginas.
+# Se guarda en memoria por proceso y solo se vuelve a consultar cuando cambia
+# una Version. Para avisar a los demás procesos (varios workers) se reescribe
+# el archivo instance/version_generacion tras cada commit que toque Version:
+# cada proceso compara el os.stat() de ese archivo con el que vio al cargar.
+ARCHIVO_GENERACION = 'version_generacion'
+
+_ultima_version = {'valor': None, 'generacion': None}
+_ultima_version_lock = threading.Lock()
+
+
+def _ruta_generacion(app=None):
+    app = app or current_app
+    return os.path.join(app.instance_path, ARCHIVO_GENERACION)
+
+
+def _generacion_actual(app=None):
+    """Identificador barato de la generación: inodo y mtime del archivo (None si no existe)."""
+    try:
+        estado = os.stat(_ruta_generacion(app))
+    except OSError:
+        return None
+    return (estado.st_ino, estado.st_mtime_ns)
+
+
+def avanzar_generacion_version(app=None):
+    """Marca la caché como vencida en todos los procesos."""
+    ruta = _ruta_generacion(app)
+    temporal = f"{ruta}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temporal, 'w') as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(temporal, ruta) # Nuevo inodo: el cambio se detecta aunque el mtime sea igual
+    except OSError as e:
+        print(f"DEBUG: No se pudo actualizar {ruta}: {e}")
+    with _ultima_version_lock:
+        _ultima_version['generacion'] = None
+
+
+def obtener_ultima_version():
+    """
+    Devuelve el numero_version más reciente (o 'N/A'), consultando la base de datos
+    solo si la caché de este proceso está vacía o la generación cambió.
+    """
+    generacion = _generacion_actual()
+    with _ultima_version_lock:
+        if _ultima_version['generacion'] is not None and _ultima_version['generacion'] == generacion:
+            return _ultima_version['valor']
+
+    if generacion is None:
+        # Primera vez: se crea el archivo para que los demás procesos tengan con qué comparar
+        avanzar_generacion_version()
+        generacion = _generacion_actual()
+
+    # La generación se leyó antes de consultar: si cambia mientras tanto, la próxima llamada recarga
+    valor = 'N/A'
+    latest_version = Version.query.order_by(Version.fecha_creacion.desc()).first()
+    if latest_version:
+        valor = latest_version.numero_version
+
+    with _ultima_version_lock:
+        _ultima_version['valor'] = valor
+        _ultima_version['generacion'] = generacion
+    return valor
+
+
+def _marcar_version_cambiada(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['version_cambiada'] = True
+
+
+def _avisar_cambio_de_version(session):
+    if session.info.pop('version_cambiada', False):
+        avanzar_generacion_version()
+
+
+def _descartar_cambio_de_version(session):
+    session.info.pop('version_cambiada', None)
+
+
+event.listen(Version, 'after_insert', _marcar_version_cambiada)
+event.listen(Version, 'after_update', _marcar_version_cambiada)
+event.listen(Version, 'after_delete', _marcar_version_cambiada)
+# Solo se avisa cuando el cambio quedó guardado (tras el commit, no en el flush)
+event.listen(Session, 'after_commit', _avisar_cambio_de_version)
+event.listen(Session, 'after_rollback', _descartar_cambio_de_version)
+
 version_bp = Blueprint('version', __name__)
 
 @version_bp.route('/ver_versiones')
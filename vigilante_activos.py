@@ -0,0 +1,319 @@
+# vigilante_activos.py
+# Vigilante del sistema de archivos que mantiene al día el catálogo de activos
+# (catalogo_activos.py) sin que las peticiones tengan que escanear el disco.
+#
+# Con inotify (Linux, mediante ctypes: no hace falta ningún paquete) vigila
+# todos los directorios de las carpetas de subida y recoge los eventos:
+#
+#   IN_CLOSE_WRITE / IN_MOVED_TO   -> el archivo se creó o cambió
+#   IN_DELETE / IN_MOVED_FROM      -> el archivo ya no está
+#   IN_MOVED_FROM + IN_MOVED_TO    -> renombrado (misma cookie): se conserva el hash
+#   IN_CREATE | IN_ISDIR           -> directorio nuevo: se vigila y se cataloga su contenido
+#   IN_Q_OVERFLOW                  -> se perdieron eventos: escaneo completo
+#
+# Los eventos se acumulan y se aplican en lotes pequeños (aplicar_eventos, una
+# transacción por lote) cuando pasan ASSETS_WATCHER_BATCH_MS sin eventos nuevos
+# o el lote llega a ASSETS_WATCHER_BATCH_MAX rutas.
+#
+# Si inotify no está disponible (otro sistema operativo, límite de
+# fs.inotify.max_user_watches) se usa sondeo: un escaneo completo cada
+# ASSETS_WATCHER_POLL_SECONDS (solo se lee el contenido de lo que cambió).
+#
+# Al arrancar siempre hace un escaneo completo, para recoger lo que cambió
+# mientras no estaba en marcha. Debe haber un solo vigilante por base de
+# datos: servidor.py lo arranca en un proceso aparte (ASSETS_WATCHER) o se
+# ejecuta a mano con `flask vigilar-activos`.
+import os
+import time
+import errno
+import select
+import struct
+import signal
+import threading
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models import db
+from catalogo_activos import aplicar_eventos, escanear_activos, raices_activos
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+MASCARA = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+CABECERA_EVENTO = struct.Struct('iIII') # wd, mask, cookie, len
+
+
+class InotifyNoDisponible(Exception):
+    pass
+
+
+class Inotify:
+    """Envoltorio mínimo de inotify(7) con ctypes; vigila árboles de directorios."""
+
+    def __init__(self):
+        try:
+            import ctypes
+            import ctypes.util
+            self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            self._libc.inotify_init1.argtypes = [ctypes.c_int]
+            self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            self._libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        except (OSError, AttributeError) as e:
+            raise InotifyNoDisponible(str(e))
+        self._ctypes = ctypes
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise InotifyNoDisponible(os.strerror(ctypes.get_errno()))
+        self.directorios = {} # wd -> ruta absoluta
+        self._wds = {} # ruta absoluta -> wd
+
+    def vigilar(self, ruta):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(ruta), MASCARA)
+        if wd < 0:
+            error = self._ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                return # Desapareció antes de poder vigilarlo
+            raise InotifyNoDisponible(f"{ruta}: {os.strerror(error)}")
+        self.directorios[wd] = ruta
+        self._wds[ruta] = wd
+
+    def vigilar_arbol(self, raiz):
+        """Vigila `raiz` y todos sus subdirectorios; devuelve los archivos que ya contienen."""
+        archivos, pendientes = [], [raiz]
+        while pendientes:
+            ruta = pendientes.pop()
+            self.vigilar(ruta)
+            try:
+                with os.scandir(ruta) as entradas:
+                    for entrada in entradas:
+                        if entrada.is_dir(follow_symlinks=False):
+                            pendientes.append(entrada.path)
+                        elif entrada.is_file():
+                            archivos.append(entrada.path)
+            except FileNotFoundError:
+                pass
+        return archivos
+
+    def olvidar_arbol(self, raiz):
+        """Deja de vigilar `raiz` y sus subdirectorios (p. ej. se movió fuera)."""
+        prefijo = raiz + os.sep
+        for ruta in [r for r in self._wds if r == raiz or r.startswith(prefijo)]:
+            wd = self._wds.pop(ruta)
+            self.directorios.pop(wd, None)
+            self._libc.inotify_rm_watch(self.fd, wd)
+
+    def olvidar_wd(self, wd):
+        ruta = self.directorios.pop(wd, None)
+        if ruta is not None and self._wds.get(ruta) == wd:
+            del self._wds[ruta]
+
+    def leer(self, espera):
+        """Eventos disponibles como tuplas (wd, ruta_directorio, nombre, mask, cookie); espera hasta `espera` s."""
+        listos, _, _ = select.select([self.fd], [], [], espera)
+        if not listos:
+            return []
+        eventos = []
+        while True:
+            try:
+                datos = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            posicion = 0
+            while posicion < len(datos):
+                wd, mascara, cookie, longitud = CABECERA_EVENTO.unpack_from(datos, posicion)
+                posicion += CABECERA_EVENTO.size
+                nombre = os.fsdecode(datos[posicion:posicion + longitud].rstrip(b'\0'))
+                posicion += longitud
+                eventos.append((wd, self.directorios.get(wd), nombre, mascara, cookie))
+        return eventos
+
+    def cerrar(self):
+        os.close(self.fd)
+
+
+class LoteEventos:
+    """Cambios pendientes de aplicar al catálogo, ya combinados (el último evento de una ruta gana)."""
+
+    def __init__(self):
+        self.actualizar = set()
+        self.eliminar = set()
+        self.renombrados = []
+        self.directorios_eliminados = set()
+        self.movidos_desde = {} # cookie -> (ruta, es_directorio)
+        self.ultimo_evento = 0.0
+
+    def __len__(self):
+        return (len(self.actualizar) + len(self.eliminar) + len(self.renombrados)
+                + len(self.directorios_eliminados) + len(self.movidos_desde))
+
+    def archivo_cambiado(self, ruta):
+        self.eliminar.discard(ruta)
+        self.actualizar.add(ruta)
+
+    def archivo_eliminado(self, ruta):
+        self.actualizar.discard(ruta)
+        self.eliminar.add(ruta)
+
+    def archivo_renombrado(self, antes, despues):
+        self.eliminar.discard(despues)
+        if antes in self.actualizar:
+            # Cambió en este mismo lote: hay que leerlo igualmente, ya con el nombre nuevo
+            self.actualizar.discard(antes)
+            self.eliminar.add(antes)
+            self.actualizar.add(despues)
+        else:
+            self.actualizar.discard(despues)
+            self.renombrados.append((antes, despues))
+
+    def cerrar_movimientos(self):
+        """Los IN_MOVED_FROM sin pareja salieron de las carpetas vigiladas."""
+        for ruta, es_directorio in self.movidos_desde.values():
+            if es_directorio:
+                self.directorios_eliminados.add(ruta)
+            else:
+                self.archivo_eliminado(ruta)
+        self.movidos_desde.clear()
+
+
+class VigilanteActivos:
+    """Bucle del vigilante: inotify si está disponible, si no sondeo."""
+
+    def __init__(self, app, sondeo=False):
+        self.app = app
+        config = app.config
+        self.espera_lote = config.get('ASSETS_WATCHER_BATCH_MS', 250) / 1000
+        self.max_lote = config.get('ASSETS_WATCHER_BATCH_MAX', 200)
+        self.intervalo_sondeo = config.get('ASSETS_WATCHER_POLL_SECONDS', 10)
+        self.forzar_sondeo = sondeo
+        self.detener = threading.Event()
+        self.inotify = None
+
+    def ejecutar(self):
+        with self.app.app_context():
+            if not self.forzar_sondeo:
+                try:
+                    self.inotify = Inotify()
+                    for _, raiz in raices_activos():
+                        self.inotify.vigilar_arbol(raiz)
+                except InotifyNoDisponible as e:
+                    current_app.logger.warning(f"Vigilante de activos: inotify no disponible ({e}); se usa sondeo.")
+                    if self.inotify is not None:
+                        self.inotify.cerrar()
+                    self.inotify = None
+            # Después de empezar a vigilar, así no se pierde nada entre el escaneo y los eventos
+            self._escanear()
+            try:
+                if self.inotify is not None:
+                    self._bucle_inotify()
+                else:
+                    self._bucle_sondeo()
+            finally:
+                if self.inotify is not None:
+                    self.inotify.cerrar()
+                db.session.remove()
+
+    def _escanear(self):
+        try:
+            resumen = escanear_activos(completo=True)
+            current_app.logger.info(f"Vigilante de activos: escaneo completo {resumen}")
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception("Vigilante de activos: error en el escaneo completo")
+
+    def _bucle_sondeo(self):
+        while not self.detener.wait(self.intervalo_sondeo):
+            self._escanear()
+
+    def _bucle_inotify(self):
+        lote = LoteEventos()
+        while not self.detener.is_set():
+            desbordado = False
+            for wd, directorio, nombre, mascara, cookie in self.inotify.leer(self.espera_lote):
+                lote.ultimo_evento = time.monotonic()
+                if mascara & IN_Q_OVERFLOW:
+                    desbordado = True
+                    continue
+                if mascara & IN_IGNORED:
+                    self.inotify.olvidar_wd(wd)
+                    continue
+                if directorio is None or not nombre:
+                    continue # Evento del propio directorio vigilado (IN_DELETE_SELF): lo cubre el del padre
+                self._registrar(lote, os.path.join(directorio, nombre), mascara, cookie)
+
+            if desbordado:
+                lote = LoteEventos()
+                self._escanear()
+                continue
+            tranquilo = time.monotonic() - lote.ultimo_evento >= self.espera_lote
+            if len(lote) and (tranquilo or len(lote) >= self.max_lote):
+                self._aplicar(lote)
+                lote = LoteEventos()
+
+    def _registrar(self, lote, ruta, mascara, cookie):
+        es_directorio = bool(mascara & IN_ISDIR)
+        if mascara & IN_MOVED_FROM:
+            lote.movidos_desde[cookie] = (ruta, es_directorio)
+            if es_directorio:
+                self.inotify.olvidar_arbol(ruta)
+        elif mascara & IN_MOVED_TO:
+            origen = lote.movidos_desde.pop(cookie, None)
+            if es_directorio:
+                if origen is not None:
+                    lote.directorios_eliminados.add(origen[0])
+                for archivo in self.inotify.vigilar_arbol(ruta):
+                    lote.archivo_cambiado(archivo)
+            elif origen is not None:
+                lote.archivo_renombrado(origen[0], ruta)
+            else:
+                lote.archivo_cambiado(ruta)
+        elif mascara & IN_CREATE:
+            if es_directorio:
+                for archivo in self.inotify.vigilar_arbol(ruta):
+                    lote.archivo_cambiado(archivo)
+        elif mascara & IN_CLOSE_WRITE:
+            lote.archivo_cambiado(ruta)
+        elif mascara & IN_DELETE:
+            if es_directorio:
+                lote.directorios_eliminados.add(ruta)
+            else:
+                lote.archivo_eliminado(ruta)
+
+    def _aplicar(self, lote):
+        lote.cerrar_movimientos()
+        try:
+            resumen = aplicar_eventos(lote.actualizar, lote.eliminar, lote.renombrados, lote.directorios_eliminados)
+            current_app.logger.debug(f"Vigilante de activos: lote aplicado {resumen}")
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception("Vigilante de activos: error al aplicar un lote; se hará un escaneo completo")
+            self._escanear()
+
+
+def ejecutar_vigilante(app, sondeo=False):
+    """Ejecuta el vigilante en primer plano hasta SIGTERM o Ctrl+C."""
+    vigilante = VigilanteActivos(app, sondeo=sondeo)
+    signal.signal(signal.SIGTERM, lambda *_: vigilante.detener.set())
+    try:
+        vigilante.ejecutar()
+    except KeyboardInterrupt:
+        pass
+
+
+@click.command('vigilar-activos')
+@click.option('--sondeo', is_flag=True, help='Usa sondeo periódico en vez de inotify.')
+@with_appcontext
+def vigilar_activos_command(sondeo):
+    """Mantiene al día el catálogo de activos con los cambios en las carpetas de subida."""
+    ejecutar_vigilante(current_app._get_current_object(), sondeo=sondeo)
@@ -0,0 +1,9 @@
+# wsgi.py
+# Punto de entrada para servidores WSGI (archivo WSGI de PythonAnywhere, gunicorn, etc.):
+#   gunicorn wsgi:application
+# Para el servidor prefork propio del proyecto ver servidor.py.
+# Las dependencias pesadas de exportación (pandas, reportlab, openpyxl, PIL,
+# vobject) y Authlib se cargan con la primera petición que las usa, no aquí.
+from app import create_app
+
+application = create_app()